@@ -0,0 +1,136 @@
+import hashlib
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import select, delete, or_
+from extensions import db
+from models import AnswerCacheEntry
+
+ALL_DOCUMENTS = "all"
+
+
+def scope_key(document_ids):
+    """Questions over all of a user's documents share one scope; explicit selections hash their ids."""
+    if not document_ids:
+        return ALL_DOCUMENTS
+    ids = sorted({str(document_id) for document_id in document_ids})
+    return hashlib.sha256(",".join(ids).encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    Answers keyed by (user, document scope, query embedding) in the answer_cache table.
+
+    A question hits when an answer for the same scope was given to a question whose embedding has
+    cosine similarity of at least ANSWER_CACHE_THRESHOLD. Entries are dropped when a document in
+    their scope is added or deleted, after ANSWER_CACHE_TTL seconds, and beyond
+    ANSWER_CACHE_MAX_ENTRIES per scope (oldest first).
+
+    Only a conversation's first question is looked up and stored. A follow-up depends on the turns
+    before it ("and the second one?") and questions are not rewritten into standalone ones, so
+    follow-ups are always generated; skip_follow_up() counts them in the stats as follow_ups.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.threshold = 0.95
+        self.ttl = 86400
+        self.max_entries = 200
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "follow_ups": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config["ANSWER_CACHE_ENABLED"]
+        self.threshold = app.config["ANSWER_CACHE_THRESHOLD"]
+        self.ttl = app.config["ANSWER_CACHE_TTL"]
+        self.max_entries = app.config["ANSWER_CACHE_MAX_ENTRIES"]
+        app.extensions["answer_cache"] = self
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def skip_follow_up(self):
+        """Records a question answered without a lookup because it continues a conversation."""
+        self._count("follow_ups")
+
+    def lookup(self, user_id, document_ids, query_vector):
+        """Returns (entry, similarity) for the closest cached answer above the threshold, or None."""
+        if not self.enabled:
+            return None
+        rows = db.session.execute(
+            select(AnswerCacheEntry.id, AnswerCacheEntry.query_vector)
+            .where(
+                AnswerCacheEntry.user_id == user_id,
+                AnswerCacheEntry.scope_key == scope_key(document_ids),
+                AnswerCacheEntry.created_at >= datetime.utcnow() - timedelta(seconds=self.ttl),
+            )
+        ).all()
+        if not rows:
+            self._count("misses")
+            return None
+
+        # Scopes hold at most max_entries answers, so they are compared exactly
+        vectors = np.asarray([row.query_vector for row in rows], dtype=np.float32)
+        query = np.asarray(query_vector, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+        similarities = vectors @ query / np.where(norms == 0, 1, norms)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return db.session.get(AnswerCacheEntry, rows[best].id), float(similarities[best])
+
+    def store(self, user_id, document_ids, query, query_vector, response, sources):
+        if not self.enabled:
+            return
+        key = scope_key(document_ids)
+        db.session.add(AnswerCacheEntry(
+            user_id=user_id,
+            scope_key=key,
+            document_ids=sorted(str(document_id) for document_id in document_ids) if document_ids else None,
+            query_text=query,
+            query_vector=query_vector,
+            response=response,
+            sources=sources,
+            created_at=datetime.utcnow(),
+        ))
+        db.session.flush()
+
+        stale = db.session.execute(
+            select(AnswerCacheEntry.id)
+            .where(AnswerCacheEntry.user_id == user_id, AnswerCacheEntry.scope_key == key)
+            .order_by(AnswerCacheEntry.created_at.desc())
+            .offset(self.max_entries)
+        ).scalars().all()
+        if stale:
+            db.session.execute(delete(AnswerCacheEntry).where(AnswerCacheEntry.id.in_(stale)))
+        db.session.commit()
+
+    def invalidate(self, user_id, document_id):
+        """Drops the answers whose scope includes document_id: all-document scopes and selections naming it."""
+        selections = db.session.execute(
+            select(AnswerCacheEntry.id, AnswerCacheEntry.document_ids)
+            .where(AnswerCacheEntry.user_id == user_id, AnswerCacheEntry.scope_key != ALL_DOCUMENTS)
+        ).all()
+        named = [entry_id for entry_id, ids in selections if str(document_id) in (ids or ())]
+        db.session.execute(
+            delete(AnswerCacheEntry).where(
+                AnswerCacheEntry.user_id == user_id,
+                or_(AnswerCacheEntry.scope_key == ALL_DOCUMENTS, AnswerCacheEntry.id.in_(named)),
+            )
+        )
+        db.session.commit()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+answer_cache = AnswerCache()
@@ -1,21 +1,57 @@
+import time
+IMPORT_STARTED = time.perf_counter()  # start-up time includes importing the modules below
+
 from flask import Flask
 from config import Config
-from extensions import db, jwt
+from extensions import db, jwt, vector_index
 from routes import routes
 from services import qa_bp
+from embeddings import embedding_cache
+from jobs import ingestion_queue
+from sessions import chat_store
+from answer_cache import answer_cache
+from rerank import reranking
+from identity import identity_cache
+from versions import embedding_versions
+from reindex import reindexer
+from metrics import metrics
+from providers import llm_client
 import os
 
-def create_app():
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+
+def create_app(config=None):
+    started = time.perf_counter()
     app = Flask(__name__)
     app.config.from_object(Config)
+    # Overrides, e.g. a test database, are applied before the extensions read the config
+    app.config.update(config or {})
 
     # Initialize Extensions
     db.init_app(app)
     jwt.init_app(app)
+    vector_index.init_app(app)
+    embedding_cache.init_app(app)
+    ingestion_queue.init_app(app)
+    chat_store.init_app(app)
+    answer_cache.init_app(app)
+    reranking.init_app(app)
+    identity_cache.init_app(app)
+    embedding_versions.init_app(app)
+    reindexer.init_app(app)
+    metrics.init_app(app)
+    llm_client.init_app(app)
 
     # Register Blueprints
     app.register_blueprint(routes)
     app.register_blueprint(qa_bp)
+
+    # Re-embeds chunks in the background when the embedding version changes
+    reindexer.start()
+    # Ingestion workers poll from start-up, so jobs left queued or stale by a restart are run
+    ingestion_queue.start()
+    metrics.startup_seconds.set(IMPORT_SECONDS, phase="import")
+    metrics.startup_seconds.set(time.perf_counter() - started, phase="create_app")
     return app
 
 if __name__ == '__main__':
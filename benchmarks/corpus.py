@@ -0,0 +1,56 @@
+import random
+
+TOPICS = [
+    "invoice", "shipment", "contract", "warranty", "payroll", "inventory", "audit", "budget",
+    "compliance", "maintenance", "onboarding", "security", "forecast", "procurement", "licensing",
+    "insurance", "logistics", "pricing", "support", "training",
+]
+WORDS = [
+    "account", "approval", "balance", "billing", "customer", "deadline", "delivery", "department",
+    "estimate", "expense", "facility", "invoice", "manager", "milestone", "order", "payment",
+    "policy", "quarter", "record", "region", "renewal", "report", "request", "review", "schedule",
+    "service", "supplier", "system", "team", "total", "update", "vendor", "version", "warehouse",
+]
+
+
+class Corpus:
+    """
+    Deterministic synthetic documents for benchmarks. Document i is a few paragraphs of filler
+    text about one topic with a single fact in the middle ("The reference code for project X is
+    Y."); question i asks for that fact, so its answer is known to be in document i.
+    """
+
+    def __init__(self, size, paragraphs=8, seed=0):
+        self.size = size
+        self.paragraphs = paragraphs
+        self.seed = seed
+
+    def project(self, i):
+        return f"{TOPICS[i % len(TOPICS)]}-{i:06d}"
+
+    def document(self, i):
+        """(file name, text) of document i."""
+        rng = random.Random(f"{self.seed}:{i}")
+        topic = TOPICS[i % len(TOPICS)]
+        paragraphs = []
+        for _ in range(self.paragraphs):
+            sentences = [
+                f"The {topic} {' '.join(rng.choices(WORDS, k=rng.randint(4, 9)))}."
+                for _ in range(rng.randint(3, 6))
+            ]
+            paragraphs.append(" ".join(sentences))
+        code = f"{rng.randrange(16 ** 8):08x}"
+        paragraphs.insert(self.paragraphs // 2, f"The reference code for project {self.project(i)} is {code}.")
+        return f"{self.project(i)}.txt", "\n\n".join(paragraphs)
+
+    def documents(self):
+        for i in range(self.size):
+            yield self.document(i)
+
+    def questions(self, count):
+        """(question, index of the document holding the answer), spread evenly over the corpus."""
+        step = max(1, self.size // count)
+        return [
+            (f"What is the reference code for project {self.project(i)}?", i)
+            for i in range(0, self.size, step)
+        ][:count]
@@ -0,0 +1,151 @@
+"""
+Extraction throughput per document format: the synthetic corpus written as text, Markdown, HTML,
+DOCX and CSV, and tests/sample.pdf with the PDF text layer ("auto") and with layout analysis on
+every page ("layout"). Pages are extracted in-process, without the extraction pool.
+
+    python -m benchmarks.parsers --documents 200 --output parsers.json
+    python -m benchmarks.parsers --baseline parsers.json  # exits 1 on a regression
+"""
+import argparse
+import csv
+import html
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from xml.sax.saxutils import escape
+from benchmarks.corpus import Corpus
+from benchmarks.run import ROOT, compare
+
+sys.path.insert(0, ROOT)
+from extraction import iter_pages, sniff_mime  # noqa: E402
+
+SAMPLE_PDF = os.path.join(ROOT, "tests", "sample.pdf")
+
+DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+
+
+def write_docx(path, paragraphs):
+    """A minimal DOCX of (style, text) paragraphs; style is e.g. "Heading1", or None for body text."""
+    body = []
+    for style, text in paragraphs:
+        properties = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ""
+        body.append(f'<w:p>{properties}<w:r><w:t xml:space="preserve">{escape(text)}</w:t></w:r></w:p>')
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f'<w:body>{"".join(body)}</w:body></w:document>'
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", DOCX_CONTENT_TYPES)
+        archive.writestr("word/document.xml", document)
+
+
+def write_document(path, fmt, title, paragraphs):
+    """Writes one corpus document in fmt (txt, md, html, docx or csv)."""
+    if fmt == "docx":
+        write_docx(path, [("Title", title)] + [(None, paragraph) for paragraph in paragraphs])
+        return
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        if fmt == "txt":
+            f.write("\n\n".join(paragraphs))
+        elif fmt == "md":
+            f.write(f"# {title}\n\n")
+            for i, paragraph in enumerate(paragraphs):
+                f.write(f"## Part {i + 1}\n\n{paragraph}\n\n")
+        elif fmt == "html":
+            f.write(f"<!DOCTYPE html><html><head><title>{html.escape(title)}</title>"
+                    "<style>p { margin: 0 }</style></head><body>")
+            f.write(f"<h1>{html.escape(title)}</h1>")
+            f.write("".join(f"<p>{html.escape(paragraph)}</p>" for paragraph in paragraphs))
+            f.write("</body></html>")
+        elif fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(["project", "part", "text"])
+            writer.writerows([title, i + 1, paragraph] for i, paragraph in enumerate(paragraphs))
+
+
+def measure(paths, pdf_mode="auto"):
+    size = sum(os.path.getsize(path) for path in paths)
+    characters = 0
+    started = time.perf_counter()
+    for path in paths:
+        for _, text in iter_pages(path, pdf_mode=pdf_mode):
+            characters += len(text)
+    seconds = time.perf_counter() - started
+    return {
+        "documents": len(paths),
+        "mb": round(size / 1024 / 1024, 3),
+        "characters": characters,
+        "seconds": round(seconds, 3),
+        "documents_per_second": round(len(paths) / seconds, 2),
+        "mb_per_second": round(size / seconds / 1024 / 1024, 3),
+    }
+
+
+def run(args, workdir):
+    corpus = Corpus(args.documents, paragraphs=args.paragraphs, seed=args.seed)
+    results = {"config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}}
+    for fmt in ("txt", "md", "html", "docx", "csv"):
+        paths = []
+        for i in range(corpus.size):
+            name, text = corpus.document(i)
+            path = os.path.join(workdir, f"{os.path.splitext(name)[0]}.{fmt}")
+            write_document(path, fmt, corpus.project(i), text.split("\n\n"))
+            paths.append(path)
+        detected = {sniff_mime(path) for path in paths}
+        results[fmt] = {**measure(paths), "detected": sorted(detected)}
+
+    # The same PDF many times over; its pages have a text layer, so "auto" never needs layout analysis
+    paths = []
+    for i in range(args.pdfs):
+        paths.append(shutil.copy(SAMPLE_PDF, os.path.join(workdir, f"sample-{i}.pdf")))
+    results["pdf"] = measure(paths, "auto")
+    results["pdf_layout"] = measure(paths, "layout")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=200, help="synthetic documents per text format")
+    parser.add_argument("--paragraphs", type=int, default=8, help="paragraphs per document")
+    parser.add_argument("--pdfs", type=int, default=50, help="copies of tests/sample.pdf")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results to this JSON file instead of stdout")
+    parser.add_argument("--baseline", help="results JSON to compare with; exits 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="ai-document-qa-parsers-")
+    try:
+        results = run(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
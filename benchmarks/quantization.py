@@ -0,0 +1,147 @@
+"""
+Recall and latency of the local vector index per VECTOR_INDEX_DTYPE, against exact float32 search.
+Each encoding returns top_k * VECTOR_RESCORE_FACTOR candidates, which are rescored with their
+full-precision vectors as vector_store does; recall_at_k is the share of the exact top_k found.
+
+Vectors come from the synthetic corpus embedded by the fake provider ("corpus", sparse), or from
+clustered Gaussians ("dense"), closer to a real embedding model's.
+
+    python -m benchmarks.quantization --source dense --vectors 100000 --output quantization.json
+    python -m benchmarks.quantization --baseline quantization.json  # exits 1 on a regression
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from types import SimpleNamespace
+import numpy as np
+from benchmarks.corpus import Corpus
+from benchmarks.run import ROOT, compare, summarize
+
+sys.path.insert(0, ROOT)
+from fake_provider import hashed_embedding  # noqa: E402
+from vector_index import ENCODINGS, LocalVectorIndex  # noqa: E402
+
+
+def corpus_vectors(args):
+    """Chunk vectors of the corpus paragraphs, and the corpus questions as queries."""
+    corpus = Corpus(args.documents, paragraphs=args.paragraphs, seed=args.seed)
+    vectors, document_ids = [], []
+    for i, (_, text) in enumerate(corpus.documents()):
+        for paragraph in text.split("\n\n"):
+            vectors.append(hashed_embedding(paragraph, args.dimensions))
+            document_ids.append(i)
+    queries = [hashed_embedding(question, args.dimensions) for question, _ in corpus.questions(args.queries)]
+    return np.asarray(vectors, dtype=np.float32), document_ids, np.asarray(queries, dtype=np.float32)
+
+
+def dense_vectors(args):
+    """Unit vectors around random cluster centres, one cluster per document; queries are perturbed chunks."""
+    rng = np.random.default_rng(args.seed)
+    centres = rng.normal(size=(args.documents, args.dimensions)).astype(np.float32)
+    document_ids = rng.integers(0, args.documents, size=args.vectors)
+    vectors = centres[document_ids] + rng.normal(scale=1.5, size=(args.vectors, args.dimensions)).astype(np.float32)
+    queries = vectors[rng.integers(0, args.vectors, size=args.queries)]
+    queries = queries + rng.normal(scale=0.5, size=queries.shape).astype(np.float32)
+    normalize = lambda a: a / np.linalg.norm(a, axis=1, keepdims=True)  # noqa: E731
+    return normalize(vectors), document_ids.tolist(), normalize(queries)
+
+
+def measure(encoding, workdir, vectors, document_ids, queries, thresholds, args):
+    app = SimpleNamespace(extensions={}, config={
+        "VECTOR_INDEX_DIR": os.path.join(workdir, encoding),
+        "VECTOR_INDEX_DTYPE": encoding,
+        "VECTOR_INDEX_MAX_SEGMENTS": 16,
+    })
+    index = LocalVectorIndex(app)
+    chunk_ids = [uuid.UUID(int=i) for i in range(len(vectors))]
+    documents = [uuid.UUID(int=i) for i in document_ids]
+    started = time.perf_counter()
+    index.build("benchmark", chunk_ids, documents, vectors)
+    build_seconds = time.perf_counter() - started
+    shard = index.shard_path("benchmark")
+    size = sum(os.path.getsize(os.path.join(shard, name)) for name in os.listdir(shard))
+
+    candidates = args.top_k * (args.rescore_factor if index.quantized else 1)
+    index.search("benchmark", queries[0], candidates)  # maps the segment
+    latencies, found, candidate_found = [], 0, 0
+    for query, threshold in zip(queries, thresholds):
+        started = time.perf_counter()
+        ranked = index.search("benchmark", query, candidates)
+        rows = np.asarray([chunk_id.int for chunk_id, _ in ranked])
+        if index.quantized:
+            # The rescoring step of vector_store._rescore, on the full-precision vectors
+            rows = rows[np.argsort(-(vectors[rows] @ query))]
+        latencies.append(time.perf_counter() - started)
+        scores = vectors[rows] @ query
+        found += int(np.sum(scores[:args.top_k] >= threshold))
+        candidate_found += min(args.top_k, int(np.sum(scores >= threshold)))
+    total = args.top_k * len(queries)
+    return {
+        **summarize(latencies),
+        "recall_at_k": round(found / total, 4),
+        "candidate_recall": round(candidate_found / total, 4),
+        "candidates": candidates,
+        "index_mb": round(size / 1024 / 1024, 3),
+        "build_seconds": round(build_seconds, 3),
+    }
+
+
+def run(args, workdir):
+    vectors, document_ids, queries = (dense_vectors if args.source == "dense" else corpus_vectors)(args)
+    # The exact k-th best score per query, by brute force; a result scoring at least that is a hit,
+    # so chunks tied with the k-th one count too
+    thresholds = [np.partition(vectors @ query, -args.top_k)[-args.top_k] - 1e-6 for query in queries]
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "vectors": len(vectors),
+    }
+    for encoding in args.encodings:
+        results[encoding] = measure(encoding, workdir, vectors, document_ids, queries, thresholds, args)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", choices=("corpus", "dense"), default="corpus")
+    parser.add_argument("--documents", type=int, default=1000, help="synthetic documents, or dense clusters")
+    parser.add_argument("--paragraphs", type=int, default=8, help="paragraphs per corpus document")
+    parser.add_argument("--vectors", type=int, default=50000, help="dense vectors")
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=4, help="VECTOR_RESCORE_FACTOR")
+    parser.add_argument("--encodings", nargs="+", choices=ENCODINGS, default=list(ENCODINGS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results to this JSON file instead of stdout")
+    parser.add_argument("--baseline", help="results JSON to compare with; exits 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="ai-document-qa-quantization-")
+    try:
+        results = run(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""
+Offline benchmark of document ingestion and question answering, using the fake model provider.
+
+    python -m benchmarks.run --documents 1000 --output results.json
+    python -m benchmarks.run --documents 1000 --baseline results.json  # exits 1 on a regression
+
+Documents go to a temporary SQLite database unless --database points at a Postgres one (run
+setup.py against it first); the benchmark user and its documents are deleted afterwards.
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+import numpy as np
+from benchmarks.corpus import Corpus
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Latency keys compared with a baseline; throughput keys must not drop by more than the tolerance
+LATENCY_KEYS = ("p50_ms", "p95_ms")
+THROUGHPUT_KEYS = ("documents_per_second", "mb_per_second")
+# Retrieval quality keys must not drop at all
+QUALITY_KEYS = ("hit_rate", "recall_at_k")
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(latencies):
+    """Percentiles of latencies (seconds), in milliseconds."""
+    ms = np.asarray(latencies) * 1000
+    return {
+        "count": len(ms),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def configure(args, workdir):
+    """Environment for the app, set before it is imported since Config reads it at import time."""
+    os.environ.update({
+        "LLM_PROVIDER": "fake",
+        "FAKE_EMBED_LATENCY_MS": str(args.embed_latency_ms),
+        "FAKE_CHAT_LATENCY_MS": str(args.chat_latency_ms),
+        "DATABASE_URL": args.database or f"sqlite:///{os.path.join(workdir, 'benchmark.db')}",
+        "INGESTION_MODE": "sync",
+        "REINDEX_ENABLED": "false",
+        "ANSWER_CACHE_ENABLED": "true" if args.answer_cache else "false",
+        "VECTOR_INDEX_DIR": os.path.join(workdir, "vector_index"),
+    })
+    os.environ.setdefault("JWT_SECRET_KEY", uuid.uuid4().hex)
+    # Uploaded files are saved under the working directory
+    os.chdir(workdir)
+
+
+def upload(client, headers, corpus, batch_size):
+    failed, size = 0, 0
+    started = time.perf_counter()
+    for start in range(0, corpus.size, batch_size):
+        files = []
+        for i in range(start, min(start + batch_size, corpus.size)):
+            name, text = corpus.document(i)
+            data = text.encode()
+            size += len(data)
+            files.append((io.BytesIO(data), name))
+        response = client.post("/documentbulkupload", headers=headers, data={"files": files})
+        entries = response.get_json().get("files", [])
+        failed += len(files) - sum(entry["status"] == "ready" for entry in entries)
+    seconds = time.perf_counter() - started
+    return {
+        "documents": corpus.size,
+        "failed": failed,
+        "seconds": round(seconds, 3),
+        "documents_per_second": round(corpus.size / seconds, 2),
+        "mb_per_second": round(size / seconds / 1024 / 1024, 3),
+    }
+
+
+def retrieve(qa_service, user_id, questions, corpus):
+    """get_relevant_documents latency, and how often the answer's document is among the results."""
+    latencies, hits, errors = [], 0, 0
+    for question, index in questions:
+        started = time.perf_counter()
+        chunks = qa_service.get_relevant_documents(question, user_id)
+        latencies.append(time.perf_counter() - started)
+        if isinstance(chunks, tuple):
+            errors += 1
+            continue
+        expected = corpus.document(index)[0]
+        hits += any(chunk.document_name == expected for chunk in chunks)
+    return {**summarize(latencies), "hit_rate": round(hits / len(questions), 4), "errors": errors}
+
+
+def answer(client, headers, questions):
+    """End-to-end /askquestion latency, HTTP handling included."""
+    latencies, errors = [], 0
+    for question, _ in questions:
+        started = time.perf_counter()
+        response = client.post("/askquestion", headers=headers, json={"query": question, "new_chat": 1})
+        latencies.append(time.perf_counter() - started)
+        errors += response.status_code != 200
+    return {**summarize(latencies), "errors": errors}
+
+
+def run(args):
+    from app import create_app
+    from extensions import db
+    from models import DocumentChunk, Document, User
+    from providers import llm_client
+    from services import QAService
+    from sqlalchemy import func, select, text
+
+    app = create_app()
+    client = app.test_client()
+    with app.app_context():
+        if db.engine.dialect.name == "postgresql":
+            db.session.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+            db.session.commit()
+        db.create_all()
+
+    email = f"benchmark-{uuid.uuid4().hex[:8]}@example.com"
+    client.post("/register", json={"username": email, "email": email, "password": "benchmark"})
+    token = client.post("/login", json={"email": email, "password": "benchmark"}).get_json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    corpus = Corpus(args.documents, paragraphs=args.paragraphs, seed=args.seed)
+    results = {"config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}}
+
+    try:
+        results["upload"] = upload(client, headers, corpus, args.batch_size)
+        with app.app_context():
+            user_id = db.session.execute(select(User.id).where(User.email == email)).scalar()
+            chunks = db.session.execute(
+                select(func.count(DocumentChunk.id)).join(Document).where(Document.user_id == user_id)
+            ).scalar()
+        results["upload"].update(
+            chunks=chunks, chunks_per_second=round(chunks / results["upload"]["seconds"], 2), peak_rss_mb=peak_rss_mb(),
+        )
+
+        questions = corpus.questions(args.queries)
+        with app.app_context():
+            # First with new query embeddings from the provider, then with them cached (the hot path alone)
+            results["retrieval"] = retrieve(QAService, user_id, questions, corpus)
+            results["retrieval_cached"] = retrieve(QAService, user_id, questions, corpus)
+        results["retrieval_cached"]["peak_rss_mb"] = peak_rss_mb()
+
+        results["answer"] = answer(client, headers, corpus.questions(args.answers))
+        results["answer"]["peak_rss_mb"] = peak_rss_mb()
+        results["provider"] = dict(llm_client.get().stats)
+    finally:
+        with app.app_context():
+            db.session.execute(text("DELETE FROM users WHERE email = :email"), {"email": email})
+            db.session.commit()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of results against baseline: slower latencies, lower throughput, fewer hits or lower recall."""
+    regressions = []
+    for phase, metrics in results.items():
+        before = baseline.get(phase)
+        if phase == "config" or not isinstance(metrics, dict) or not isinstance(before, dict):
+            continue
+        for key in LATENCY_KEYS:
+            if key in metrics and key in before and metrics[key] > before[key] * (1 + tolerance):
+                regressions.append(f"{phase}.{key}: {before[key]} -> {metrics[key]}")
+        for key in THROUGHPUT_KEYS:
+            if key in metrics and key in before and metrics[key] < before[key] / (1 + tolerance):
+                regressions.append(f"{phase}.{key}: {before[key]} -> {metrics[key]}")
+        for key in QUALITY_KEYS:
+            if key in metrics and key in before and metrics[key] < before[key]:
+                regressions.append(f"{phase}.{key}: {before[key]} -> {metrics[key]}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=1000, help="synthetic documents to upload")
+    parser.add_argument("--paragraphs", type=int, default=8, help="paragraphs per document")
+    parser.add_argument("--batch-size", type=int, default=100, help="documents per bulk upload request")
+    parser.add_argument("--queries", type=int, default=200, help="retrieval queries")
+    parser.add_argument("--answers", type=int, default=50, help="/askquestion requests")
+    parser.add_argument("--embed-latency-ms", type=float, default=0, help="fake provider latency per embedding call")
+    parser.add_argument("--chat-latency-ms", type=float, default=0, help="fake provider latency per answer")
+    parser.add_argument("--answer-cache", action="store_true", help="keep the answer cache enabled")
+    parser.add_argument("--database", help="database URL (default: a temporary SQLite file)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results to this JSON file instead of stdout")
+    parser.add_argument("--baseline", help="results JSON to compare with; exits 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    cwd = os.getcwd()
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    workdir = tempfile.mkdtemp(prefix="ai-document-qa-benchmark-")
+    try:
+        configure(args, workdir)
+        # The app is imported after leaving the repository directory
+        sys.path.insert(0, ROOT)
+        results = run(args)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+Start-up time of fresh app processes: importing the app and create_app(), and the whole process
+until then (interpreter start included). Uses the fake provider and a temporary SQLite database.
+
+    python -m benchmarks.startup --runs 10 --output startup.json
+    python -m benchmarks.startup --baseline startup.json  # exits 1 on a regression
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.run import ROOT, compare, summarize
+
+SCRIPT = """
+import time
+started = time.perf_counter()
+from app import create_app
+create_app()
+print(time.perf_counter() - started)
+"""
+
+
+def measure(runs):
+    with tempfile.TemporaryDirectory(prefix="ai-document-qa-startup-") as workdir:
+        env = {
+            **os.environ,
+            "LLM_PROVIDER": "fake",
+            "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+            "REINDEX_ENABLED": "false",
+            "JWT_SECRET_KEY": os.environ.get("JWT_SECRET_KEY", "startup-benchmark-secret"),
+        }
+        app, process = [], []
+        for _ in range(runs):
+            started = time.perf_counter()
+            output = subprocess.run(
+                [sys.executable, "-c", SCRIPT], cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+            ).stdout
+            process.append(time.perf_counter() - started)
+            app.append(float(output.split()[-1]))
+    return {"startup": summarize(app), "process": summarize(process)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10, help="processes to start")
+    parser.add_argument("--output", help="write results to this JSON file instead of stdout")
+    parser.add_argument("--baseline", help="results JSON to compare with; exits 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    results = measure(args.runs)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import re
+from dataclasses import dataclass
+
+# A sentence ends at terminal punctuation followed by whitespace, or at a blank line.
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+
+@dataclass
+class Chunk:
+    chunk_index: int
+    page_number: int
+    start_offset: int
+    end_offset: int
+    text: str
+
+
+def split_sentences(text, max_length):
+    """
+    Yields (start, end) spans of the sentences in text.
+    Sentences longer than max_length are split at the last whitespace that fits.
+    """
+    start = 0
+    boundaries = [(m.start(), m.end()) for m in SENTENCE_BOUNDARY.finditer(text)]
+    boundaries.append((len(text), len(text)))
+    for end, next_start in boundaries:
+        while start < end and text[start].isspace():
+            start += 1
+        while end - start > max_length:
+            cut = text.rfind(" ", start + 1, start + max_length)
+            if cut <= start:
+                cut = start + max_length
+            yield start, cut
+            start = cut
+            while start < end and text[start].isspace():
+                start += 1
+        if start < end:
+            yield start, end
+        start = next_start
+
+
+def _pack_spans(spans, chunk_size, chunk_overlap):
+    """Greedily packs sentence spans into windows of at most chunk_size characters."""
+    window = []
+    for span in spans:
+        if window and span[1] - window[0][0] > chunk_size:
+            yield window[0][0], window[-1][1]
+            # Carry trailing sentences over so neighbouring chunks share context
+            carried = []
+            for previous in reversed(window):
+                if window[-1][1] - previous[0] > chunk_overlap:
+                    break
+                carried.insert(0, previous)
+            window = carried
+            while window and span[1] - window[0][0] > chunk_size:
+                window.pop(0)
+        window.append(span)
+    if window:
+        yield window[0][0], window[-1][1]
+
+
+def chunk_pages(pages, chunk_size=1000, chunk_overlap=200):
+    """
+    Splits (page_number, text) pairs into sentence-aligned chunks that never cross a page.
+    Offsets refer to the document text formed by joining the pages with a newline.
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+    if not 0 <= chunk_overlap < chunk_size:
+        raise ValueError("chunk_overlap must be between 0 and chunk_size")
+
+    chunk_index = 0
+    page_offset = 0
+    for page_number, page_text in pages:
+        page_text = page_text or ""
+        spans = split_sentences(page_text, chunk_size)
+        for start, end in _pack_spans(spans, chunk_size, chunk_overlap):
+            yield Chunk(
+                chunk_index=chunk_index,
+                page_number=page_number,
+                start_offset=page_offset + start,
+                end_offset=page_offset + end,
+                text=page_text[start:end],
+            )
+            chunk_index += 1
+        page_offset += len(page_text) + 1
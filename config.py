@@ -6,4 +6,121 @@ load_dotenv()
 class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
\ No newline at end of file
+    JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
+
+    # Document chunking (sizes are in characters)
+    CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 1000))
+    CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 200))
+    RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 5))
+    HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", 100))  # pgvector HNSW candidate list size
+    # HNSW index over compressed vectors (pgvector 0.7+, created by setup.py): "none", "halfvec" or "binary"
+    PGVECTOR_QUANTIZATION = os.getenv("PGVECTOR_QUANTIZATION", "none")
+    # Candidates per result taken from a quantized index and rescored with the full-precision vectors
+    VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", 4))
+    # Questions over at most this many chunk vectors, selected documents or all of the user's, are scored exactly instead of through HNSW
+    SCOPED_SEARCH_MAX_VECTORS = int(os.getenv("SCOPED_SEARCH_MAX_VECTORS", 10000))
+
+    # Vector search backend: "pgvector", "local" (memory-mapped shards) or "auto" (pgvector on Postgres)
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "auto")
+    VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join(os.getcwd(), "uploads", "vector_index"))
+    # float32, float16 (half the size), or int8 / binary (a quarter / a 32nd, with the top candidates rescored exactly)
+    VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")
+    VECTOR_INDEX_MAX_SEGMENTS = int(os.getenv("VECTOR_INDEX_MAX_SEGMENTS", 16))  # compact beyond this
+
+    # Embedding version: vectors are tagged with both; changing either re-embeds every chunk in the
+    # background (the model must produce 768-dimensional vectors, the size of the vector columns)
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-004")
+    EMBEDDING_PIPELINE_VERSION = os.getenv("EMBEDDING_PIPELINE_VERSION", "1")
+    EMBEDDING_VERSION_REFRESH = float(os.getenv("EMBEDDING_VERSION_REFRESH", 5))  # seconds workers cache the serving version
+
+    # Background re-indexer for embedding version changes
+    REINDEX_ENABLED = os.getenv("REINDEX_ENABLED", "true").lower() == "true"
+    REINDEX_BATCH_SIZE = int(os.getenv("REINDEX_BATCH_SIZE", 100))  # chunks per batch
+    REINDEX_INTERVAL = float(os.getenv("REINDEX_INTERVAL", 1.0))  # seconds between batches
+    REINDEX_IDLE_INTERVAL = float(os.getenv("REINDEX_IDLE_INTERVAL", 60))  # seconds between checks when up to date
+    REINDEX_RETIRE_AFTER = int(os.getenv("REINDEX_RETIRE_AFTER", 300))  # seconds old embeddings are kept after a switch
+
+    # Embedding cache: in-process LRU tier plus the embedding_cache table
+    EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 10000))
+    EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", 3600))  # seconds
+    EMBEDDING_CACHE_PERSIST = os.getenv("EMBEDDING_CACHE_PERSIST", "true").lower() == "true"
+
+    # Embedding micro-batching: flush at EMBED_BATCH_SIZE texts or after EMBED_BATCH_WAIT_MS
+    EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 100))
+    EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", 5))
+    EMBED_MAX_QPS = float(os.getenv("EMBED_MAX_QPS", 0)) or None  # provider calls per second, unset = unlimited
+    EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", 5))
+    EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", 4))
+
+    # Document ingestion: "async" hands uploads to background workers, "sync" processes them in the request
+    INGESTION_MODE = os.getenv("INGESTION_MODE", "async")
+    INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", 2))
+    INGESTION_POLL_INTERVAL = float(os.getenv("INGESTION_POLL_INTERVAL", 1.0))  # seconds
+    INGESTION_JOB_TIMEOUT = int(os.getenv("INGESTION_JOB_TIMEOUT", 600))  # seconds before a stuck job is retried
+
+    # PDF pages are extracted in a process pool per document being ingested (0 = in the ingestion thread, without limits)
+    EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", 2))
+    EXTRACTION_PAGE_TIMEOUT = float(os.getenv("EXTRACTION_PAGE_TIMEOUT", 30))  # seconds per page
+    EXTRACTION_PAGE_MEMORY_MB = int(os.getenv("EXTRACTION_PAGE_MEMORY_MB", 2048))  # per extraction process
+    # "auto": PDF text layer via PDFium, layout analysis only for pages without a usable one; "layout": every page
+    PDF_TEXT_MODE = os.getenv("PDF_TEXT_MODE", "auto")
+
+    # Chat history: "database" (chat_sessions table, shared by every worker) or "memory" (per worker)
+    CHAT_SESSION_BACKEND = os.getenv("CHAT_SESSION_BACKEND", "database")
+    CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", 1000))  # conversations kept per worker by the memory backend
+    CHAT_SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", 86400))  # seconds of inactivity before a conversation expires
+    CHAT_HISTORY_MAX_TURNS = int(os.getenv("CHAT_HISTORY_MAX_TURNS", 10))  # question/answer pairs replayed to the model
+
+    # Document context per question, in estimated tokens (about 4 characters each)
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 2000))
+
+    # Hybrid retrieval: BM25 and vector rankings merged by weighted reciprocal rank fusion
+    HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", 1.0))
+    HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", 1.0))  # 0 = vector search only
+    HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", 60))
+    HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 50))  # chunks taken from each ranking before fusion
+    # Above this many chunks in scope, only the best lexical matches are vector-scored (0 = never)
+    LEXICAL_PREFILTER_THRESHOLD = int(os.getenv("LEXICAL_PREFILTER_THRESHOLD", 0))
+    LEXICAL_PREFILTER_SIZE = int(os.getenv("LEXICAL_PREFILTER_SIZE", 1000))
+
+    # Semantic answer cache: reuse an answer when a question in the same scope is this similar
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))  # cosine similarity
+    ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 86400))  # seconds
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 200))  # per user and scope
+
+    # Reranking: "lexical" (query-term overlap), "cross-encoder" (local CPU model) or "none"
+    RERANKER = os.getenv("RERANKER", "none")  # "cross-encoder", "lexical" or "none"
+    RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 100))  # first-stage candidates, overridable per request
+    RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", 32))
+    RERANK_TIMEOUT = float(os.getenv("RERANK_TIMEOUT", 2.0))  # seconds before unscored candidates keep their order
+    RERANK_LEXICAL_WEIGHT = float(os.getenv("RERANK_LEXICAL_WEIGHT", 0.3))  # share of the lexical score, the rest first-stage
+    MAX_TOP_K = int(os.getenv("MAX_TOP_K", 20))  # upper bounds for the top_k and candidate_pool request parameters
+    MAX_CANDIDATE_POOL = int(os.getenv("MAX_CANDIDATE_POOL", 500))
+
+    # Bulk upload limits, per request and per file (archive members included)
+    BULK_UPLOAD_MAX_FILES = int(os.getenv("BULK_UPLOAD_MAX_FILES", 5000))
+    BULK_UPLOAD_MAX_FILE_MB = int(os.getenv("BULK_UPLOAD_MAX_FILE_MB", 100))
+
+    # JWT identity -> user id cache, for tokens issued without the user_id claim
+    IDENTITY_CACHE_TTL = int(os.getenv("IDENTITY_CACHE_TTL", 300))  # seconds
+    IDENTITY_CACHE_MAX = int(os.getenv("IDENTITY_CACHE_MAX", 10000))
+
+    # Document listing page sizes (GET /getdocuments?limit=)
+    DOCUMENTS_PAGE_SIZE = int(os.getenv("DOCUMENTS_PAGE_SIZE", 50))
+    DOCUMENTS_MAX_PAGE_SIZE = int(os.getenv("DOCUMENTS_MAX_PAGE_SIZE", 500))
+
+    # Observability: Prometheus metrics at GET /metrics, Server-Timing response headers and,
+    # when the opentelemetry packages are installed, a span per pipeline stage
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() == "true"
+    OTEL_ENABLED = os.getenv("OTEL_ENABLED", "false").lower() == "true"
+
+    # Model provider: "gemini" (needs GEMINI_API_KEY) or "fake", a deterministic offline provider
+    # for tests, benchmarks and local development, answering after the given latencies. The
+    # client is created on the first model call.
+    LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    FAKE_EMBED_LATENCY_MS = float(os.getenv("FAKE_EMBED_LATENCY_MS", 0))  # per embedding call
+    FAKE_CHAT_LATENCY_MS = float(os.getenv("FAKE_CHAT_LATENCY_MS", 0))  # before the first token
\ No newline at end of file
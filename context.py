@@ -0,0 +1,117 @@
+import math
+from dataclasses import dataclass, field
+from embeddings import normalize_text
+
+CHARS_PER_TOKEN = 4  # rough average for English prose; avoids a tokenizer call per question
+MIN_PASSAGE_TOKENS = 50  # a passage that would be cut shorter than this is left out instead
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+@dataclass
+class Passage:
+    chunk: object  # the RetrievedChunk it came from
+    text: str  # formatted for the prompt, with overlap already sent dropped
+
+
+@dataclass
+class PackedContext:
+    passages: list = field(default_factory=list)
+    seen: list = field(default_factory=list)  # chunks the chat session was given on earlier turns
+    tokens_used: int = 0
+    tokens_trimmed: int = 0  # tokens of relevant passages left out to stay within the budget
+    duplicates: int = 0  # passages already covered by higher-scoring ones
+
+    @property
+    def text(self):
+        return "\n\n".join(passage.text for passage in self.passages)
+
+    @property
+    def chunks(self):
+        """Chunks the model can draw on: those sent now and those it was sent before, best first."""
+        chunks = [passage.chunk for passage in self.passages] + self.seen
+        return sorted(chunks, key=lambda chunk: chunk.score, reverse=True)
+
+    def report(self):
+        return {
+            "tokens_used": self.tokens_used,
+            "tokens_trimmed": self.tokens_trimmed,
+            "passages": len(self.passages),
+            "duplicates": self.duplicates,
+            "already_seen": len(self.seen),
+        }
+
+
+def _uncovered(start, end, covered):
+    """Returns the parts of [start, end) not inside any of the covered ranges."""
+    pieces = []
+    for covered_start, covered_end in sorted(covered):
+        if covered_end <= start or covered_start >= end:
+            continue
+        if covered_start > start:
+            pieces.append((start, covered_start))
+        start = max(start, covered_end)
+    if start < end:
+        pieces.append((start, end))
+    return pieces
+
+
+def _cut(text, max_chars):
+    """Shortens text to at most max_chars, at a word boundary where there is one."""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars - 3]
+    space = cut.rfind(" ")
+    if space > max_chars // 2:
+        cut = cut[:space]
+    return cut + "..."
+
+
+def build_context(chunks, token_budget, seen_chunk_ids=()):
+    """
+    Packs the highest-scoring chunks into at most token_budget (estimated) tokens.
+
+    Chunks in seen_chunk_ids are not sent again. Text that overlaps a higher-scoring chunk of the
+    same document (neighbouring chunks share CHUNK_OVERLAP characters) is dropped, as are exact
+    duplicates. The last passage that fits only in part is cut to the remaining budget.
+    """
+    packed = PackedContext()
+    seen_chunk_ids = {str(chunk_id) for chunk_id in seen_chunk_ids}
+    covered = {}  # document_id -> [(start, end)] of text already in the context
+    texts = set()
+
+    for chunk in sorted(chunks, key=lambda chunk: chunk.score, reverse=True):
+        if str(chunk.chunk_id) in seen_chunk_ids:
+            packed.seen.append(chunk)
+            continue
+
+        key = normalize_text(chunk.chunk_text)
+        pieces = _uncovered(chunk.start_offset, chunk.end_offset, covered.get(chunk.document_id, []))
+        if key in texts or not pieces:
+            packed.duplicates += 1
+            continue
+        body = " ... ".join(
+            chunk.chunk_text[start - chunk.start_offset:end - chunk.start_offset].strip() for start, end in pieces
+        )
+        text = f"{chunk.document_name} (page {chunk.page_number}): {body}"
+
+        tokens = estimate_tokens(text)
+        remaining = token_budget - packed.tokens_used
+        if tokens > remaining:
+            if remaining < MIN_PASSAGE_TOKENS:
+                packed.tokens_trimmed += tokens
+                continue
+            text = _cut(text, remaining * CHARS_PER_TOKEN)
+            packed.tokens_trimmed += tokens - estimate_tokens(text)
+            tokens = estimate_tokens(text)
+        else:
+            # Only text sent in full counts as covered for the chunks that follow
+            covered.setdefault(chunk.document_id, []).extend(pieces)
+
+        texts.add(key)
+        packed.passages.append(Passage(chunk, text))
+        packed.tokens_used += tokens
+
+    return packed
@@ -0,0 +1,307 @@
+import hashlib
+import queue
+import random
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from extensions import db
+from metrics import metrics
+from models import EmbeddingCacheEntry
+
+EMBEDDING_MODEL = "text-embedding-004"
+PIPELINE_VERSION = "1"
+EMBED_BATCH_SIZE = 100  # Maximum number of contents per embed_content call
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def normalize_text(text):
+    """Canonical form used for cache keys: NFC unicode with collapsed whitespace."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def content_hash(model, text):
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+def text_hash(text):
+    """Model-independent hash of a chunk's text, used to spot unchanged chunks across uploads."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingVersion(namedtuple("EmbeddingVersion", "model pipeline")):
+    """
+    What produced a stored embedding: the provider model, and a pipeline version to bump when
+    anything else that changes the vectors changes. Vectors of different versions are not comparable.
+    """
+
+    @property
+    def key(self):
+        return f"{self.model}@{self.pipeline}"
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of embeddings keyed by content_hash(model, text).
+
+    The first tier is an in-process LRU bounded by entry count and TTL; it holds float32 arrays
+    (3 KB for 768 dimensions, against about 25 KB as a list of floats) and hands out lists. The
+    second is the embedding_cache table, shared by every worker and kept across restarts.
+    """
+
+    def __init__(self, app=None):
+        self.max_entries = 10000
+        self.ttl = 3600
+        self.persist = True
+        self._entries = OrderedDict()  # key -> (stored_at, vector)
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config["EMBEDDING_CACHE_SIZE"]
+        self.ttl = app.config["EMBEDDING_CACHE_TTL"]
+        self.persist = app.config["EMBEDDING_CACHE_PERSIST"]
+        app.extensions["embedding_cache"] = self
+
+    def _get_memory(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return entry[1].tolist()
+
+    def _put_memory(self, key, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_many(self, keys):
+        """Returns {key: vector} for the keys found in either tier."""
+        found = {}
+        for key in set(keys):
+            vector = self._get_memory(key)
+            if vector is not None:
+                found[key] = vector
+        memory_hits = len(found)
+
+        missing = [key for key in set(keys) if key not in found]
+        if missing and self.persist:
+            rows = db.session.execute(
+                select(EmbeddingCacheEntry.content_hash, EmbeddingCacheEntry.embedding_vector)
+                .where(EmbeddingCacheEntry.content_hash.in_(missing))
+            ).all()
+            for key, vector in rows:
+                found[key] = np.asarray(vector, dtype=np.float32).tolist()
+                self._put_memory(key, vector)
+
+        with self._lock:
+            self.stats["memory_hits"] += memory_hits
+            self.stats["db_hits"] += len(found) - memory_hits
+            self.stats["misses"] += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, model, items, session=None):
+        """
+        Stores {key: vector} in both tiers. The table write joins session's transaction when given,
+        otherwise it is committed on its own connection.
+        """
+        for key, vector in items.items():
+            self._put_memory(key, vector)
+        if not items or not self.persist:
+            return
+
+        dialect = postgresql if db.engine.dialect.name == "postgresql" else sqlite
+        stmt = dialect.insert(EmbeddingCacheEntry).values([
+            {"content_hash": key, "model_name": model, "embedding_vector": vector}
+            for key, vector in items.items()
+        ]).on_conflict_do_nothing(index_elements=["content_hash"])
+        if session is not None:
+            session.execute(stmt)
+            return
+        # Written on its own connection so the caller's transaction is left untouched
+        with db.engine.begin() as connection:
+            connection.execute(stmt)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._entries)
+        lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["db_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def is_retryable(error):
+    """Rate limits and transient server errors are worth retrying; bad requests are not."""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if code in RETRYABLE_STATUS_CODES:
+        return True
+    return "RESOURCE_EXHAUSTED" in str(error) or isinstance(error, (ConnectionError, TimeoutError))
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces embedding requests from concurrent callers into provider batches.
+
+    Texts are queued and a dispatcher thread sends them once max_batch_size are pending or
+    max_wait seconds after the first one arrived, whichever comes first. Batches are sent by a
+    small thread pool, throttled to max_qps calls per second, and retried with exponential
+    backoff and jitter on rate limits and transient errors.
+    """
+
+    def __init__(self, client, model=EMBEDDING_MODEL, max_batch_size=EMBED_BATCH_SIZE, max_wait=0.005,
+                 max_qps=None, max_retries=5, backoff=0.5, max_backoff=30.0, max_concurrency=4):
+        self.client = client
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_qps = max_qps
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_concurrency = max_concurrency
+        self.stats = {"batches": 0, "texts": 0, "retries": 0, "failures": 0}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._next_call_at = 0.0
+        self._dispatcher = None
+        self._pool = None
+
+    def _ensure_started(self):
+        # Started lazily so forked workers get their own threads
+        with self._lock:
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="embed-batch")
+                self._dispatcher = threading.Thread(target=self._dispatch, name="embed-dispatcher", daemon=True)
+                self._dispatcher.start()
+
+    def submit(self, texts, model=None):
+        """Queues texts for model (default: the batcher's) and returns one Future per text resolving to its vector."""
+        self._ensure_started()
+        model = model or self.model
+        futures = []
+        for text in texts:
+            future = Future()
+            self._queue.put((model, text, future))
+            futures.append(future)
+        return futures
+
+    def embed(self, texts, timeout=None, model=None):
+        return [future.result(timeout=timeout) for future in self.submit(texts, model)]
+
+    def _dispatch(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Each provider call embeds with a single model
+            by_model = {}
+            for model, text, future in batch:
+                by_model.setdefault(model, []).append((text, future))
+            for model, items in by_model.items():
+                self._pool.submit(self._send, model, items)
+
+    def _throttle(self):
+        if not self.max_qps:
+            return
+        with self._lock:
+            now = time.monotonic()
+            call_at = max(now, self._next_call_at)
+            self._next_call_at = call_at + 1.0 / self.max_qps
+        if call_at > now:
+            time.sleep(call_at - now)
+
+    def _send(self, model, batch):
+        texts = [text for text, _ in batch]
+        for attempt in range(self.max_retries + 1):
+            self._throttle()
+            try:
+                result = self.client.models.embed_content(model=model, contents=texts)
+                vectors = [list(embedding.values) for embedding in result.embeddings or []]
+                if len(vectors) != len(texts):
+                    raise ValueError("No embeddings received")
+                metrics.external_calls.inc(api="embedding", outcome="success")
+                break
+            except Exception as e:
+                metrics.external_calls.inc(api="embedding", outcome="error")
+                if attempt == self.max_retries or not is_retryable(e):
+                    with self._lock:
+                        self.stats["failures"] += 1
+                    for _, future in batch:
+                        future.set_exception(e)
+                    return
+                with self._lock:
+                    self.stats["retries"] += 1
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+                time.sleep(random.uniform(delay / 2, delay))
+
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats["texts"] += len(texts)
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+
+class EmbeddingService:
+    """
+    Embeds texts through the cache, sending only texts it has never seen to the batcher.
+    Methods embed with version, by default the configured one (self.version).
+    """
+
+    def __init__(self, batcher, cache, pipeline_version=PIPELINE_VERSION):
+        self.batcher = batcher
+        self.cache = cache
+        self.version = EmbeddingVersion(batcher.model, pipeline_version)
+
+    def embed_texts(self, texts, session=None, version=None):
+        """
+        Returns one vector per text in the same order.
+        Pass the session of an open write transaction to store new cache entries in it, so the
+        cache write does not wait on locks that transaction holds.
+        """
+        version = version or self.version
+        keys = [content_hash(version.key, text) for text in texts]
+        found = self.cache.get_many(keys)
+
+        # Each distinct missing text is embedded once, even if it repeats within the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.batcher.embed(list(missing.values()), model=version.model)
+            computed = dict(zip(missing, vectors))
+            self.cache.put_many(version.key, computed, session=session)
+            found.update(computed)
+
+        return [found[key] for key in keys]
+
+    def embed_query(self, text, version=None):
+        return self.embed_texts([text], version=version)[0]
+
+
+embedding_cache = EmbeddingCache()
@@ -1,5 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
+from vector_index import LocalVectorIndex
 
 db = SQLAlchemy()
-jwt = JWTManager()
\ No newline at end of file
+jwt = JWTManager()
+vector_index = LocalVectorIndex()
\ No newline at end of file
@@ -0,0 +1,645 @@
+import csv
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+import re
+import resource
+import signal
+import tarfile
+import threading
+import unicodedata
+import zipfile
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from html.parser import HTMLParser
+from xml.etree import ElementTree
+
+TEXT_BLOCK_SIZE = 64 * 1024  # characters per block when streaming text formats
+COPY_BLOCK_SIZE = 1024 * 1024  # bytes per read when saving uploads
+SNIFF_BYTES = 8 * 1024  # bytes read to identify a file's type
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2")
+SUPPORTED_FORMATS = "PDF, DOCX, HTML, Markdown, CSV or plain text"
+logger = logging.getLogger(__name__)
+
+PDF = "application/pdf"
+DOCX = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+HTML = "text/html"
+MARKDOWN = "text/markdown"
+CSV = "text/csv"
+TEXT = "text/plain"
+
+
+class PageTimeout(Exception):
+    pass
+
+
+######## PDF
+
+_pdfium_lock = threading.Lock()  # PDFium must not be called from two threads at once
+
+
+def needs_layout(text):
+    """Whether a page's text layer is missing or garbled, so layout-aware extraction is worth trying."""
+    text = text.strip()
+    if not text:
+        return True
+    garbled = sum(
+        1 for c in text
+        if c == "\ufffd" or (unicodedata.category(c) in ("Cc", "Co") and c not in "\n\t")
+    )
+    return garbled > len(text) * 0.05
+
+
+class PdfDocument:
+    """
+    A PDF read page by page: from its text layer with PDFium, which is fast, falling back to
+    pdfplumber's layout analysis for pages whose text layer is missing or garbled. With mode
+    "layout" every page goes through pdfplumber.
+    """
+
+    def __init__(self, path, mode="auto"):
+        import pypdfium2  # imported on first use, keeping it out of app start-up
+        self.path = path
+        self.mode = mode
+        self.layout = None  # pdfplumber document, opened when a page first needs it
+        with _pdfium_lock:
+            self.pdfium = pypdfium2.PdfDocument(path)
+            self.page_count = len(self.pdfium)
+
+    def _text_layer(self, index):
+        with _pdfium_lock:
+            page = self.pdfium[index]
+            textpage = page.get_textpage()
+            try:
+                text = textpage.get_text_range()
+            finally:
+                textpage.close()
+                page.close()
+        return "\n".join(line.rstrip() for line in text.replace("\r\n", "\n").split("\n"))
+
+    def page_text(self, index):
+        text = ""
+        if self.mode != "layout":
+            text = self._text_layer(index)
+            if not needs_layout(text):
+                return text
+        if self.layout is None:
+            import pdfplumber
+            self.layout = pdfplumber.open(self.path)
+        page = self.layout.pages[index]
+        layout_text = page.extract_text() or ""
+        page.close()  # drop the page's cached layout objects
+        return layout_text if layout_text.strip() else text
+
+    def close(self):
+        with _pdfium_lock:
+            self.pdfium.close()
+        if self.layout is not None:
+            try:
+                self.layout.close()
+            except Exception:
+                self.layout.stream.close()
+            self.layout = None
+
+
+######## PROCESS POOL WORKERS
+
+_worker_pdf = None  # PdfDocument kept open between pages of the same file
+
+
+def _init_worker(memory_limit_mb):
+    # The address-space limit turns a runaway page into a MemoryError inside this process
+    if memory_limit_mb:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    # Pool processes skip atexit handlers; close the last document before PDFium is torn down
+    multiprocessing.util.Finalize(None, _close_worker_pdf, exitpriority=10)
+
+
+_page_timed_out = False
+
+
+def _raise_page_timeout(signum, frame):
+    global _page_timed_out
+    _page_timed_out = True
+    raise PageTimeout()
+
+
+def _close_worker_pdf():
+    global _worker_pdf
+    if _worker_pdf is not None:
+        try:
+            _worker_pdf.close()
+        except Exception:
+            pass
+        _worker_pdf = None
+
+
+def _extract_page(path, page_index, timeout, mode="auto"):
+    """Extracts one page in a pool process; returns (text, error)."""
+    global _worker_pdf, _page_timed_out
+    _page_timed_out = False
+    signal.signal(signal.SIGALRM, _raise_page_timeout)
+    if timeout:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        if _worker_pdf is None or _worker_pdf.path != path or _worker_pdf.mode != mode:
+            _close_worker_pdf()
+            _worker_pdf = PdfDocument(path, mode)
+        return _worker_pdf.page_text(page_index), None
+    except Exception as e:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        # An interrupted parser may leave the document half-loaded: reopen it for the next page
+        _close_worker_pdf()
+        # pdfplumber re-raises parser errors wrapped, so the timeout is detected by its flag
+        if _page_timed_out:
+            return "", f"timed out after {timeout}s"
+        if isinstance(e, MemoryError):
+            return "", "exceeded the memory limit"
+        return "", str(e) or type(e).__name__
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+######## PAGE ITERATORS
+
+MAX_IDLE_POOLS = 4  # extraction pools kept for reuse between documents
+PAGE_TIMEOUT_GRACE = 1.0  # seconds the parent waits past the page timeout before killing the pool
+_idle_pools = []  # (pool, (workers, memory_limit_mb)) not in use by any document
+_pools_lock = threading.Lock()
+
+
+def _checkout_pool(workers, memory_limit_mb):
+    """
+    A process pool for one document: reused from an earlier document when one is idle. A document's
+    pool is its own while in use, so replacing it after a crash never disturbs other documents.
+    """
+    key = (workers, memory_limit_mb)
+    with _pools_lock:
+        for i, (pool, pool_key) in enumerate(_idle_pools):
+            if pool_key == key:
+                del _idle_pools[i]
+                return pool
+    # spawn: the web process runs threads, which fork() does not copy safely
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(memory_limit_mb,),
+    )
+
+
+def _checkin_pool(pool, workers, memory_limit_mb):
+    with _pools_lock:
+        if len(_idle_pools) < MAX_IDLE_POOLS:
+            _idle_pools.append((pool, (workers, memory_limit_mb)))
+            return
+    pool.shutdown(wait=False)
+
+
+def _discard_pool(pool, kill=False):
+    if kill:
+        # A worker may be stuck in native code (PDFium), which the page timer cannot interrupt
+        for process in list((pool._processes or {}).values()):
+            process.kill()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_pdf_pages(path, workers=0, page_timeout=None, memory_limit_mb=None, mode="auto"):
+    """
+    Yields (page_number, text) for each page of a PDF, in order, without holding the whole document.
+    With workers > 0 pages are extracted in a process pool, a bounded window ahead of the consumer,
+    under a per-page time and memory limit; a page that fails is yielded as empty text.
+    """
+    document = PdfDocument(path, mode)
+    if not workers:
+        try:
+            for index in range(document.page_count):
+                yield index + 1, document.page_text(index)
+        finally:
+            document.close()
+        return
+
+    page_count = document.page_count
+    document.close()
+    pool = _checkout_pool(workers, memory_limit_mb)
+    wait = page_timeout + PAGE_TIMEOUT_GRACE if page_timeout else None
+    window = workers * 4
+    pending = deque()
+    next_index = 0
+    finished = False
+    try:
+        while next_index < page_count or pending:
+            while next_index < page_count and len(pending) < window:
+                pending.append((next_index, pool.submit(_extract_page, path, next_index, page_timeout, mode)))
+                next_index += 1
+
+            page_index, future = pending.popleft()
+            try:
+                text, error = future.result(timeout=wait)
+            except (BrokenProcessPool, TimeoutError) as e:
+                # A worker died (e.g. killed by the OOM killer) or hangs past the page timer: replace
+                # the pool and resubmit the window
+                timed_out = isinstance(e, TimeoutError)
+                text, error = "", f"timed out after {page_timeout}s" if timed_out else "extraction worker crashed"
+                _discard_pool(pool, kill=timed_out)
+                pool = _checkout_pool(workers, memory_limit_mb)
+                pending = deque(
+                    (index, pool.submit(_extract_page, path, index, page_timeout, mode)) for index, _ in pending
+                )
+            if error:
+                logger.warning("Skipping page %d of %s: %s", page_index + 1, path, error)
+            yield page_index + 1, text
+        finished = True
+    finally:
+        # A document abandoned midway may leave pages in flight; its pool is not reused
+        if finished:
+            _checkin_pool(pool, workers, memory_limit_mb)
+        else:
+            _discard_pool(pool)
+
+
+######## TEXT FORMATS
+# Formats without pages are numbered by section instead (a heading starts the next one), so every
+# parser produces the same (page_number, text) stream for chunking.
+
+def _line_blocks(lines, block_size):
+    """
+    Groups (section_number, line) pairs into (section_number, text) blocks of whole lines, at most
+    about block_size characters and one section each. The final newline of a block is dropped.
+    """
+    section, block, size = None, [], 0
+    for number, line in lines:
+        if block and (number != section or size >= block_size):
+            text = "".join(block)
+            yield section, text[:-1] if text.endswith("\n") else text
+            block, size = [], 0
+        section = number
+        block.append(line)
+        size += len(line)
+    if block:
+        text = "".join(block)
+        yield section, text[:-1] if text.endswith("\n") else text
+
+
+def iter_text_pages(path, block_size=TEXT_BLOCK_SIZE):
+    """
+    Yields a text file as (1, block) pairs of whole lines, reading it incrementally.
+    Each block drops its final newline, so joining blocks with newlines restores the file.
+    """
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        yield from _line_blocks(((1, line) for line in f), block_size)
+
+
+MARKDOWN_HEADING = re.compile(r" {0,3}#{1,6}(\s|$)")
+MARKDOWN_FENCE = re.compile(r" {0,3}(```|~~~)")
+
+
+def iter_markdown_sections(path, block_size=TEXT_BLOCK_SIZE):
+    """Yields (section_number, text) for a Markdown file; each heading outside a code block starts a section."""
+    def lines(f):
+        section, fenced, seen_text = 1, False, False
+        for line in f:
+            if MARKDOWN_FENCE.match(line):
+                fenced = not fenced
+            elif not fenced and MARKDOWN_HEADING.match(line) and seen_text:
+                section += 1
+            seen_text = seen_text or bool(line.strip())
+            yield section, line
+
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        yield from _line_blocks(lines(f), block_size)
+
+
+class _HtmlText(HTMLParser):
+    """Collects the visible text of an HTML document as (section_number, line) pairs."""
+
+    BLOCK_TAGS = {
+        "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "figcaption", "footer",
+        "form", "h4", "h5", "h6", "header", "hr", "li", "main", "nav", "ol", "p", "pre", "section", "table",
+        "td", "th", "title", "tr", "ul",
+    }
+    SECTION_TAGS = {"h1", "h2", "h3"}
+    HIDDEN_TAGS = {"script", "style", "noscript", "template", "svg"}
+
+    def __init__(self):
+        super().__init__()
+        self.section = 1
+        self.lines = []
+        self._text = []
+        self._hidden = 0
+        self._pre = 0
+        self._seen_text = False
+
+    def _flush(self):
+        text = "".join(self._text)
+        self._text = []
+        if self._pre:
+            lines = [line.rstrip() for line in text.split("\n")]
+        else:
+            lines = [" ".join(text.split())]
+        for line in lines:
+            if line:
+                self.lines.append((self.section, line + "\n"))
+                self._seen_text = True
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.HIDDEN_TAGS:
+            self._hidden += 1
+        elif tag in self.SECTION_TAGS:
+            self._flush()
+            if self._seen_text:
+                self.section += 1
+        elif tag in self.BLOCK_TAGS:
+            self._flush()
+        if tag == "pre":
+            self._pre += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.HIDDEN_TAGS:
+            self._hidden = max(0, self._hidden - 1)
+        elif tag in self.SECTION_TAGS or tag in self.BLOCK_TAGS:
+            self._flush()
+        if tag == "pre":
+            self._flush()
+            self._pre = max(0, self._pre - 1)
+
+    def handle_data(self, data):
+        if not self._hidden:
+            self._text.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+    def drain(self):
+        lines, self.lines = self.lines, []
+        return lines
+
+
+def iter_html_sections(path, block_size=TEXT_BLOCK_SIZE):
+    """Yields (section_number, text) for the visible text of an HTML file; h1 to h3 headings start sections."""
+    def lines():
+        parser = _HtmlText()
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            while True:
+                data = f.read(block_size)
+                if not data:
+                    break
+                parser.feed(data)
+                yield from parser.drain()
+        parser.close()
+        yield from parser.drain()
+
+    return _line_blocks(lines(), block_size)
+
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def _docx_heading(paragraph):
+    properties = paragraph.find(f"{W}pPr")
+    if properties is None:
+        return False
+    style = properties.find(f"{W}pStyle")
+    style = style.get(f"{W}val", "") if style is not None else ""
+    return style.startswith(("Heading", "Title")) or properties.find(f"{W}outlineLvl") is not None
+
+
+def iter_docx_sections(path, block_size=TEXT_BLOCK_SIZE):
+    """
+    Yields (section_number, text) for the paragraphs of a DOCX file, parsing its XML incrementally;
+    heading paragraphs start sections.
+    """
+    def lines():
+        section, seen_text = 1, False
+        with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as document:
+            for _, element in ElementTree.iterparse(document):
+                if element.tag != f"{W}p":
+                    continue
+                parts = []
+                for node in element.iter():
+                    if node.tag == f"{W}t" and node.text:
+                        parts.append(node.text)
+                    elif node.tag == f"{W}tab":
+                        parts.append("\t")
+                    elif node.tag in (f"{W}br", f"{W}cr"):
+                        parts.append("\n")
+                text = "".join(parts).strip()
+                if text:
+                    if _docx_heading(element) and seen_text:
+                        section += 1
+                    seen_text = True
+                    yield section, text + "\n"
+                element.clear()
+
+    return _line_blocks(lines(), block_size)
+
+
+NUMBER = re.compile(r"[-+]?(\d[\d,]*\.?\d*|\.\d+)([eE][-+]?\d+)?")
+
+
+def _csv_sample(text, lines=5, size=2048):
+    """The first whole lines of text, enough for csv.Sniffer, which is slow on long samples."""
+    kept = text.splitlines(keepends=True)[:lines + 1]
+    if len(kept) > 1 and not kept[-1].endswith(("\n", "\r")):
+        kept.pop()  # cut off by the read
+    sample = "".join(kept[:lines])
+    while len(sample) > size and kept[1:lines]:
+        lines -= 1
+        sample = "".join(kept[:lines])
+    return sample
+
+
+def iter_csv_sections(path, block_size=TEXT_BLOCK_SIZE):
+    """
+    Yields the rows of a CSV file as "column: value" lines, so every chunk names its columns.
+    Sections are consecutive blocks of rows.
+    """
+    def lines():
+        with open(path, "r", newline="", encoding="utf-8", errors="replace") as f:
+            sample = _csv_sample(f.read(SNIFF_BYTES))
+            f.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+            except csv.Error:
+                dialect = csv.excel
+            reader = csv.reader(f, dialect)
+            header = next(reader, None)
+            if header is None:
+                return
+            # The first row names the columns unless it holds numbers, which column names rarely are
+            if any(NUMBER.fullmatch(cell.strip()) for cell in header):
+                f.seek(0)
+                reader = csv.reader(f, dialect)
+                header = [f"column {i + 1}" for i in range(len(header))]
+            size = 0
+            for row in reader:
+                line = "; ".join(
+                    f"{name.strip() or f'column {i + 1}'}: {value.strip()}"
+                    for i, (name, value) in enumerate(zip(header, row)) if value.strip()
+                )
+                if line:
+                    yield 1 + size // block_size, line + "\n"
+                    size += len(line) + 1
+
+    return _line_blocks(lines(), block_size)
+
+
+######## FORMAT DETECTION
+
+Parser = namedtuple("Parser", ["mime", "extension", "parse"])
+
+PARSERS = {}  # MIME type -> Parser
+
+
+def register_parser(mime, extension, parse):
+    """
+    parse(path, options) yields the (page_number, text) pairs of a file of this type; options are
+    the extraction settings (workers, page_timeout, memory_limit_mb, pdf_mode). Saved uploads of
+    the type get extension.
+    """
+    PARSERS[mime] = Parser(mime, extension, parse)
+
+
+register_parser(PDF, ".pdf", lambda path, options: iter_pdf_pages(
+    path, options.get("workers", 0), options.get("page_timeout"), options.get("memory_limit_mb"),
+    options.get("pdf_mode", "auto"),
+))
+register_parser(DOCX, ".docx", lambda path, options: iter_docx_sections(path))
+register_parser(HTML, ".html", lambda path, options: iter_html_sections(path))
+register_parser(MARKDOWN, ".md", lambda path, options: iter_markdown_sections(path))
+register_parser(CSV, ".csv", lambda path, options: iter_csv_sections(path))
+register_parser(TEXT, ".txt", lambda path, options: iter_text_pages(path))
+
+HTML_START = re.compile(r"<(!doctype\s+html|html|head|body)\b", re.IGNORECASE)
+
+
+def _looks_like_csv(text):
+    sample = _csv_sample(text)
+    if sample.count("\n") < 2:
+        return False
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+    except csv.Error:
+        return False
+    widths = {len(row) for row in csv.reader(sample.splitlines(), dialect) if row}
+    return len(widths) == 1 and widths.pop() > 1
+
+
+def sniff_mime(path, filename=None):
+    """
+    The MIME type of a file from its content. The extension of filename (or path) only decides
+    between plain text, Markdown and CSV when the content alone does not tell them apart.
+    """
+    with open(path, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+    if head.startswith(b"%PDF-"):
+        return PDF
+    if head.startswith(b"PK\x03\x04"):
+        try:
+            with zipfile.ZipFile(path) as archive:
+                names = set(archive.namelist())
+        except zipfile.BadZipFile:
+            return "application/octet-stream"
+        return DOCX if "word/document.xml" in names else "application/zip"
+    text = head.decode("utf-8", errors="replace")
+    control = sum(1 for c in text if unicodedata.category(c) == "Cc" and c not in "\n\r\t\f")
+    if b"\x00" in head or control > len(text) * 0.01:
+        return "application/octet-stream"
+
+    if HTML_START.search(text.lstrip("\ufeff \t\r\n")[:1024]):
+        return HTML
+    extension = os.path.splitext(filename or path)[1].lower()
+    if extension in (".md", ".markdown"):
+        return MARKDOWN
+    if extension in (".csv", ".tsv"):
+        return CSV
+    if extension in (".htm", ".html"):
+        return HTML
+    if extension == ".txt":
+        return TEXT
+    if _looks_like_csv(text):
+        return CSV
+    if any(MARKDOWN_HEADING.match(line) for line in text.splitlines()):
+        return MARKDOWN
+    return TEXT
+
+
+def parser_for(path, filename=None):
+    """The Parser for a file's sniffed type, or None when the type is not supported."""
+    return PARSERS.get(sniff_mime(path, filename))
+
+
+def iter_pages(path, workers=0, page_timeout=None, memory_limit_mb=None, pdf_mode="auto"):
+    """Streams the (page_number, text) pairs of a saved upload with the parser for its type."""
+    parser = parser_for(path)
+    if parser is None:
+        raise ValueError(f"Unsupported file type; upload {SUPPORTED_FORMATS}")
+    options = {"workers": workers, "page_timeout": page_timeout, "memory_limit_mb": memory_limit_mb, "pdf_mode": pdf_mode}
+    return parser.parse(path, options)
+
+
+######## UPLOADED FILES AND ARCHIVES
+
+def save_stream(source, path, max_bytes):
+    """Copies a readable binary stream to path in blocks; raises ValueError past max_bytes."""
+    size = 0
+    try:
+        with open(path, "wb") as target:
+            while True:
+                block = source.read(COPY_BLOCK_SIZE)
+                if not block:
+                    break
+                size += len(block)
+                if size > max_bytes:
+                    raise ValueError(f"File is larger than {max_bytes // (1024 * 1024)} MB")
+                target.write(block)
+    except BaseException:
+        os.remove(path)
+        raise
+
+
+def rename_by_type(path, filename=None):
+    """
+    Gives a saved upload the extension of its sniffed type and returns the new path. An upload no
+    parser handles is deleted, and None returned.
+    """
+    parser = parser_for(path, filename)
+    if parser is None:
+        os.remove(path)
+        return None
+    typed_path = os.path.splitext(path)[0] + parser.extension
+    os.replace(path, typed_path)
+    return typed_path
+
+
+def is_archive(filename):
+    return (filename or "").lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def archive_members(path):
+    """
+    Yields (name, binary stream) for each regular file in a zip or tar archive, one at a time.
+    Each stream is only valid until the next member is requested.
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and not _is_metadata(info.filename):
+                    with archive.open(info) as member:
+                        yield info.filename, member
+        return
+
+    # "r|*" reads the tar sequentially, compressed or not, without seeking back
+    with tarfile.open(path, "r|*") as archive:
+        for info in archive:
+            if info.isfile() and not _is_metadata(info.name):
+                yield info.name, archive.extractfile(info)
+
+
+def _is_metadata(name):
+    # Folders and AppleDouble files macOS adds to archives
+    return name.startswith("__MACOSX/") or os.path.basename(name).startswith(".")
@@ -0,0 +1,97 @@
+import hashlib
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+import numpy as np
+
+WORD = re.compile(r"\w+")
+
+
+def hashed_embedding(text, dimensions=768):
+    """
+    Deterministic unit vector for text: words are hashed into signed buckets, so texts sharing
+    words are similar, as they would be with a real embedding model.
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in WORD.findall(text.lower()):
+        digest = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+        vector[digest % dimensions] += 1.0 if digest >> 63 else -1.0
+    norm = np.linalg.norm(vector)
+    if not norm:
+        vector[0], norm = 1.0, 1.0
+    return (vector / norm).tolist()
+
+
+class FakeClient:
+    """
+    Offline stand-in for genai.Client, covering the calls this app makes: models.embed_content,
+    chats.create(...).send_message and .send_message_stream.
+
+    Embeddings are hashed_embedding() vectors and answers quote the start of the document
+    context, so results are the same on every run. Each call sleeps for the configured latency
+    (seconds), and failure_rate of the calls raise a retryable ConnectionError.
+    """
+
+    def __init__(self, embed_latency=0.0, embed_latency_per_text=0.0, chat_latency=0.0, token_latency=0.0,
+                 answer_words=40, failure_rate=0.0, dimensions=768, seed=0):
+        self.embed_latency = embed_latency
+        self.embed_latency_per_text = embed_latency_per_text
+        self.chat_latency = chat_latency
+        self.token_latency = token_latency
+        self.answer_words = answer_words
+        self.failure_rate = failure_rate
+        self.dimensions = dimensions
+        self.stats = {"embed_calls": 0, "embedded_texts": 0, "chat_calls": 0, "failures": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.models = SimpleNamespace(embed_content=self.embed_content)
+        self.chats = SimpleNamespace(create=lambda model, history=None, config=None: _FakeChat(self))
+
+    def _call(self, stat, count=1):
+        with self._lock:
+            self.stats[stat] += count
+            failed = self.failure_rate and self._random.random() < self.failure_rate
+            if failed:
+                self.stats["failures"] += 1
+        if failed:
+            raise ConnectionError("Fake provider failure")
+
+    def embed_content(self, model, contents, config=None):
+        if isinstance(contents, str):
+            contents = [contents]
+        time.sleep(self.embed_latency + self.embed_latency_per_text * len(contents))
+        self._call("embed_calls")
+        with self._lock:
+            self.stats["embedded_texts"] += len(contents)
+        return SimpleNamespace(embeddings=[
+            SimpleNamespace(values=hashed_embedding(text, self.dimensions)) for text in contents
+        ])
+
+    def answer(self, message):
+        """The answer's text chunks (one per word) and token usage for message."""
+        context = message.split("Relevant information:", 1)[-1]
+        words = ["Based", "on", "the", "documents:"] + context.split()[:self.answer_words]
+        usage = SimpleNamespace(prompt_token_count=len(message.split()), candidates_token_count=len(words))
+        return [word + " " for word in words], usage
+
+
+class _FakeChat:
+    def __init__(self, client):
+        self.client = client
+
+    def send_message(self, message, config=None):
+        chunks, usage = self.client.answer(message)
+        time.sleep(self.client.chat_latency + self.client.token_latency * (len(chunks) - 1))
+        self.client._call("chat_calls")
+        return SimpleNamespace(text="".join(chunks).strip(), usage_metadata=usage)
+
+    def send_message_stream(self, message, config=None):
+        time.sleep(self.client.chat_latency)
+        self.client._call("chat_calls")
+        chunks, usage = self.client.answer(message)
+        for i, text in enumerate(chunks):
+            if i:
+                time.sleep(self.client.token_latency)
+            yield SimpleNamespace(text=text, usage_metadata=usage if i == len(chunks) - 1 else None)
@@ -0,0 +1,9 @@
+import os
+
+# Threaded workers: every request gets a thread of its own, so a streamed answer holds one thread
+# instead of the process. Model calls block their request's thread, so WEB_THREADS bounds the questions in flight.
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = "gthread"
+workers = int(os.getenv("WEB_WORKERS", 2))
+threads = int(os.getenv("WEB_THREADS", 16))
+timeout = int(os.getenv("WEB_TIMEOUT", 120))
@@ -0,0 +1,96 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from flask import g
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from sqlalchemy import event, inspect, select
+from extensions import db
+from models import User
+
+USER_ID_CLAIM = "user_id"
+
+
+class IdentityCache:
+    """
+    Maps JWT identities (emails) to user ids for tokens issued before the user_id claim, in an LRU
+    bounded by IDENTITY_CACHE_MAX entries and IDENTITY_CACHE_TTL seconds. Entries are dropped
+    when a user is updated or deleted through the ORM.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 300
+        self.max_entries = 10000
+        self._entries = OrderedDict()  # email -> (cached_at, user_id)
+        self._lock = threading.Lock()
+        event.listen(User, "after_update", self._on_user_change)
+        event.listen(User, "after_delete", self._on_user_change)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config["IDENTITY_CACHE_TTL"]
+        self.max_entries = app.config["IDENTITY_CACHE_MAX"]
+        self.clear()
+        app.extensions["identity_cache"] = self
+
+    def get(self, email):
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl:
+                del self._entries[email]
+                return None
+            self._entries.move_to_end(email)
+            return entry[1]
+
+    def put(self, email, user_id):
+        with self._lock:
+            self._entries[email] = (time.monotonic(), user_id)
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, email):
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _on_user_change(self, mapper, connection, user):
+        # A changed email invalidates the old mapping as well as the new one
+        for email in [user.email, *inspect(user).attrs.email.history.deleted]:
+            self.invalidate(email)
+
+
+identity_cache = IdentityCache()
+
+
+def access_token_claims(user):
+    """Extra claims for a user's access token, so requests carry the id and skip the users table."""
+    return {USER_ID_CLAIM: str(user.id)}
+
+
+def current_user_id():
+    """
+    The authenticated user's id, or None if the identity has no user. Resolved once per request:
+    from the token's user_id claim, else from the identity cache, else from the users table.
+    """
+    if "user_id" in g:
+        return g.user_id
+
+    claim = get_jwt().get(USER_ID_CLAIM)
+    if claim:
+        user_id = uuid.UUID(claim)
+    else:
+        email = get_jwt_identity()
+        user_id = identity_cache.get(email)
+        if user_id is None:
+            user_id = db.session.execute(select(User.id).where(User.email == email)).scalar()
+            if user_id is not None:
+                identity_cache.put(email, user_id)
+    g.user_id = user_id
+    return user_id
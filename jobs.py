@@ -0,0 +1,192 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, or_, and_
+from extensions import db
+from metrics import metrics
+from models import IngestionJob
+
+ACTIVE_STATES = ("extracting", "embedding")
+logger = logging.getLogger(__name__)
+
+
+def utcnow():
+    return datetime.utcnow()
+
+
+def start_stage(job, status):
+    """Moves a job to its next state and commits so /documentstatus sees it immediately."""
+    job.status = status
+    job.updated_at = utcnow()
+    db.session.commit()
+
+
+class JobReclaimed(Exception):
+    """The job was reclaimed by another worker after its updates stopped; this run must not commit."""
+
+
+def _held(job):
+    # The claim holds while started_at is still the one this run started with (run() records it, as
+    # a reload of the job after a commit would read another worker's)
+    return and_(IngestionJob.id == job.id, IngestionJob.started_at == job.claimed_at)
+
+
+def heartbeat(job):
+    """
+    Marks a running job alive so it is not reclaimed as stale, committed on a connection of its own
+    since the job's session holds its document uncommitted. Raises JobReclaimed if it was reclaimed.
+    """
+    if db.engine.dialect.name == "sqlite":
+        # SQLite allows one writer: the open ingestion transaction blocks any reclaim until it ends
+        return
+    with db.engine.begin() as connection:
+        alive = connection.execute(update(IngestionJob).where(_held(job)).values(updated_at=utcnow())).rowcount
+    if alive != 1:
+        raise JobReclaimed(str(job.id))
+
+
+def confirm_claim(job):
+    """
+    Refreshes the job in the current transaction, before its commit; raises JobReclaimed if another
+    worker took it over, so the commit is abandoned. Under the row lock a reclaim cannot slip in after.
+    """
+    held = db.session.execute(
+        update(IngestionJob).where(_held(job)).values(updated_at=utcnow()).execution_options(synchronize_session=False)
+    ).rowcount
+    if held != 1:
+        raise JobReclaimed(str(job.id))
+
+
+def remove_upload(path):
+    """Deletes a failed job's uploaded file; nothing else refers to it once the job has failed."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning("Could not remove upload %s: %s", path, e)
+
+
+def record_timing(job, stage, seconds):
+    job.timings = {**(job.timings or {}), stage: round(seconds, 4)}
+    metrics.observe_stage("upload", stage, seconds)
+
+
+class IngestionQueue:
+    """
+    Background ingestion backed by the ingestion_jobs table, so no external broker is needed.
+
+    Upload requests insert a queued job and wake the worker threads; any worker (in any process
+    sharing the database) claims it with a conditional UPDATE and runs the registered handler.
+    Workers also poll, which picks up jobs left queued by a restart and reclaims jobs whose
+    worker died mid-run.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.handler = None
+        self.enabled = True
+        self.workers = 2
+        self.poll_interval = 1.0
+        self.job_timeout = 600
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        # In sync mode uploads are processed in the request and no worker threads run
+        self.enabled = app.config["INGESTION_MODE"] == "async"
+        self.workers = app.config["INGESTION_WORKERS"]
+        self.poll_interval = app.config["INGESTION_POLL_INTERVAL"]
+        self.job_timeout = app.config["INGESTION_JOB_TIMEOUT"]
+        app.extensions["ingestion_queue"] = self
+
+    def register_handler(self, handler):
+        """handler(job) runs the pipeline for a claimed job and raises on failure."""
+        self.handler = handler
+
+    def start(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            for i in range(len(self._threads), self.workers):
+                thread = threading.Thread(target=self._work, name=f"ingestion-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def notify(self):
+        self.start()
+        self._wakeup.set()
+
+    def _claim(self):
+        """Atomically takes the oldest runnable job; returns its id or None."""
+        stale_before = utcnow() - timedelta(seconds=self.job_timeout)
+        runnable = or_(
+            IngestionJob.status == "queued",
+            and_(IngestionJob.status.in_(ACTIVE_STATES), IngestionJob.updated_at < stale_before),
+        )
+        job_id = db.session.execute(
+            select(IngestionJob.id).where(runnable).order_by(IngestionJob.created_at).limit(1)
+        ).scalar()
+        if job_id is None:
+            return None
+
+        now = utcnow()
+        claimed = db.session.execute(
+            update(IngestionJob)
+            .where(IngestionJob.id == job_id, runnable)
+            .values(status="extracting", started_at=now, updated_at=now)
+        ).rowcount
+        db.session.commit()
+        return job_id if claimed == 1 else None
+
+    def run(self, job_id):
+        """Runs a job in the current thread and returns it in its final state."""
+        job = db.session.get(IngestionJob, job_id)
+        claimed_at = job.claimed_at = job.started_at
+        try:
+            try:
+                self.handler(job)
+                job.status = "ready"
+            except JobReclaimed:
+                raise
+            except Exception as e:
+                db.session.rollback()
+                job = db.session.get(IngestionJob, job_id)
+                job.claimed_at = claimed_at
+                job.status = "failed"
+                job.error = str(e)
+            job.finished_at = job.updated_at = utcnow()
+            if claimed_at:
+                record_timing(job, "total", (job.finished_at - claimed_at).total_seconds())
+            confirm_claim(job)
+            db.session.commit()
+            if job.status == "failed":
+                remove_upload(job.file_path)
+        except JobReclaimed:
+            # Another worker runs the job now; its outcome is the one that counts
+            db.session.rollback()
+            logger.warning("Ingestion job %s was reclaimed by another worker; abandoning this run", job_id)
+            job = db.session.get(IngestionJob, job_id)
+        return job
+
+    def _work(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    job_id = self._claim()
+                    if job_id is not None:
+                        self.run(job_id)
+                        continue
+            except Exception:
+                logger.exception("Ingestion worker error")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+
+ingestion_queue = IngestionQueue()
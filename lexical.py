@@ -0,0 +1,102 @@
+import math
+import re
+from collections import Counter
+from sqlalchemy import select, func
+from extensions import db
+from models import ChunkTerm, Document, DocumentChunk
+
+# Keeps identifiers such as ERR-042, v1.2.3, snake_case and paths/like/this as single terms
+TOKEN_PATTERN = re.compile(r"\w+(?:[-_.:/]\w+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in is it its me my not of on or "
+    "that the their there this to was we were what when where which who why will with you your".split()
+)
+MAX_TERM_LENGTH = 100
+BM25_K1 = 1.2
+BM25_B = 0.75
+COMMON_TERM_RATIO = 0.5  # terms in more chunks than this are ignored when the query has rarer ones
+
+
+def tokenize(text):
+    """Lowercased terms of text, without stopwords."""
+    return [
+        term for term in TOKEN_PATTERN.findall(text.lower())
+        if term not in STOPWORDS and len(term) <= MAX_TERM_LENGTH
+    ]
+
+
+def chunk_postings(chunk_id, document_id, text):
+    """Returns (term_count, chunk_terms rows) for one chunk."""
+    frequencies = Counter(tokenize(text))
+    rows = [
+        {"term": term, "chunk_id": chunk_id, "document_id": document_id, "frequency": frequency}
+        for term, frequency in frequencies.items()
+    ]
+    return sum(frequencies.values()), rows
+
+
+def _in_scope(stmt, document_column, user_id, document_ids):
+    stmt = stmt.join(Document, Document.id == document_column).where(Document.user_id == user_id)
+    if document_ids:
+        stmt = stmt.where(Document.id.in_(document_ids))
+    return stmt
+
+
+def search_lexical(query, user_id, document_ids=None, limit=50):
+    """
+    Ranks the chunks in scope against query with BM25 over the chunk_terms postings.
+    Returns ([(chunk_id, score)] best first, number of chunks in scope).
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return [], 0
+
+    chunk_count, average_length = db.session.execute(
+        _in_scope(
+            select(func.count(DocumentChunk.id), func.avg(DocumentChunk.term_count)),
+            DocumentChunk.document_id, user_id, document_ids,
+        )
+        .where(DocumentChunk.term_count.isnot(None))
+    ).one()
+    if not chunk_count:
+        return [], 0
+    average_length = float(average_length) or 1.0
+
+    postings = select(ChunkTerm.term, func.count(ChunkTerm.chunk_id)).where(ChunkTerm.term.in_(terms))
+    document_frequency = dict(db.session.execute(
+        _in_scope(postings, ChunkTerm.document_id, user_id, document_ids).group_by(ChunkTerm.term)
+    ).all())
+    if not document_frequency:
+        return [], chunk_count
+
+    # Very common terms add little to the ranking but most of the rows to read
+    rare = {term for term, df in document_frequency.items() if df <= chunk_count * COMMON_TERM_RATIO}
+    terms = rare or set(document_frequency)
+    idf = {
+        term: math.log(1 + (chunk_count - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+        for term in terms
+    }
+
+    rows = db.session.execute(_in_scope(
+        select(ChunkTerm.chunk_id, ChunkTerm.term, ChunkTerm.frequency, DocumentChunk.term_count)
+        .join(DocumentChunk, DocumentChunk.id == ChunkTerm.chunk_id)
+        .where(ChunkTerm.term.in_(terms)),
+        ChunkTerm.document_id, user_id, document_ids,
+    ))
+    scores = Counter()
+    for chunk_id, term, frequency, length in rows:
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * (length or 0) / average_length)
+        scores[chunk_id] += idf[term] * frequency * (BM25_K1 + 1) / (frequency + norm)
+    return scores.most_common(limit), chunk_count
+
+
+def reciprocal_rank_fusion(rankings, weights, k=60):
+    """
+    Merges ranked [(id, score)] lists: each id scores sum(weight / (k + rank)) over the lists it is in.
+    Returns [(id, fused score)] best first.
+    """
+    fused = Counter()
+    for ranking, weight in zip(rankings, weights):
+        for rank, (item, _) in enumerate(ranking, start=1):
+            fused[item] += weight / (k + rank)
+    return fused.most_common()
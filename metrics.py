@@ -0,0 +1,245 @@
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+logger = logging.getLogger(__name__)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """A monotonically increasing count per label set."""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Gauge(Counter):
+    """A value per label set that is set rather than counted."""
+
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """Observations counted into cumulative buckets per label set, with their sum and count."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._values = {}  # label values -> (bucket counts, sum)
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + [("le", _format_value(bound))], cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Metrics:
+    """
+    Process-wide metrics in the Prometheus text format, served by /metrics.
+
+    Pipeline stages are timed with stage() (or observe_stage() for durations measured elsewhere),
+    which also adds them to the request's Server-Timing header and, with OTEL_ENABLED and the
+    opentelemetry API installed, records them as spans. Each process keeps its own counts, so
+    every worker is scraped on its own.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.server_timing = True
+        self.tracer = None
+        self._metrics = []
+        self._collectors = []  # (name, documentation, label name, read) for counts kept elsewhere
+
+        self.stage_seconds = self.histogram(
+            "pipeline_stage_seconds", "Duration of upload and question answering stages", ("pipeline", "stage"),
+        )
+        self.request_seconds = self.histogram(
+            "http_request_duration_seconds", "Request handling time by endpoint", ("method", "endpoint", "status"),
+        )
+        self.db_queries = self.counter("db_queries_total", "Database statements executed")
+        self.db_queries_per_request = self.histogram(
+            "db_queries_per_request", "Database statements executed per request", buckets=COUNT_BUCKETS,
+        )
+        self.external_calls = self.counter(
+            "external_api_requests_total", "Embedding and generation API calls by outcome", ("api", "outcome"),
+        )
+        self.llm_tokens = self.counter("llm_tokens_total", "Tokens reported by the generation API", ("type",))
+        self.context_tokens = self.histogram(
+            "qa_context_tokens", "Estimated document context tokens sent per question", buckets=TOKEN_BUCKETS,
+        )
+        self.startup_seconds = self.gauge(
+            "app_startup_seconds", "Start-up time by phase: importing the app's modules, then create_app()", ("phase",),
+        )
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config["METRICS_ENABLED"]
+        self.server_timing = app.config["SERVER_TIMING"]
+        self.tracer = None
+        if app.config["OTEL_ENABLED"]:
+            try:
+                from opentelemetry import trace  # optional dependency, only needed for tracing
+                self.tracer = trace.get_tracer("ai-document-qa")
+            except ImportError as e:
+                logger.warning("OpenTelemetry unavailable, tracing disabled: %s", e)
+        if not event.contains(Engine, "before_cursor_execute", self._on_query):
+            event.listen(Engine, "before_cursor_execute", self._on_query)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions["metrics"] = self
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, documentation, labelnames=()):
+        metric = Gauge(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, name, documentation, label, read):
+        """Exposes counts kept elsewhere as a counter: read() returns {label value: count}."""
+        self._collectors.append((name, documentation, label, read))
+
+    def observe_stage(self, pipeline, stage, seconds, timings=None):
+        """Records a stage that took seconds and just finished; also stores it in timings when given."""
+        self.stage_seconds.observe(seconds, pipeline=pipeline, stage=stage)
+        if timings is not None:
+            timings[stage] = round(seconds, 4)
+        if has_request_context():
+            g.setdefault("stage_timings", []).append((f"{pipeline}.{stage}", seconds))
+        if self.tracer is not None:
+            end = time.time_ns()
+            span = self.tracer.start_span(f"{pipeline}.{stage}", start_time=end - int(seconds * 1e9))
+            span.end(end_time=end)
+
+    @contextmanager
+    def stage(self, pipeline, stage, timings=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(pipeline, stage, time.perf_counter() - started, timings)
+
+    def record_generation(self, outcome, usage=None):
+        """Counts a generation API call and the tokens it reports."""
+        self.external_calls.inc(api="generation", outcome=outcome)
+        if usage is not None:
+            self.llm_tokens.inc(getattr(usage, "prompt_token_count", None) or 0, type="prompt")
+            self.llm_tokens.inc(getattr(usage, "candidates_token_count", None) or 0, type="completion")
+
+    def _on_query(self, *args):
+        self.db_queries.inc()
+        # The listener is process-wide; only requests of this instance's app count towards their own total
+        if has_request_context() and current_app.extensions.get("metrics") is self:
+            g.db_queries = g.get("db_queries", 0) + 1
+
+    def _before_request(self):
+        g.request_started = time.perf_counter()
+
+    def _after_request(self, response):
+        seconds = time.perf_counter() - g.get("request_started", time.perf_counter())
+        queries = g.get("db_queries", 0)
+        # The route's endpoint name rather than the path keeps label values bounded
+        self.request_seconds.observe(
+            seconds, method=request.method, endpoint=request.endpoint or "unmatched", status=str(response.status_code),
+        )
+        self.db_queries_per_request.observe(queries)
+        if self.server_timing:
+            entries = [f"{name};dur={stage_seconds * 1000:.1f}" for name, stage_seconds in g.get("stage_timings", [])]
+            entries.append(f'db;desc="{queries} queries"')
+            entries.append(f"total;dur={seconds * 1000:.1f}")
+            response.headers["Server-Timing"] = ", ".join(entries)
+        return response
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for name, documentation, label, read in self._collectors:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} counter")
+            for value, count in sorted(read().items()):
+                lines.append(f"{name}{_format_labels([(label, value)])} {_format_value(count)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
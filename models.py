@@ -1,10 +1,17 @@
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy import ForeignKey, Column
 import uuid
+from datetime import datetime, timezone
 from extensions import db
 from pgvector.sqlalchemy import Vector
 
+def utcnow():
+    # Set in Python rather than by the database: SQLite's CURRENT_TIMESTAMP has whole seconds and a
+    # different text format from bound datetimes, which broke keyset comparisons on uploaded_at
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class User(db.Model):
     __tablename__ = 'users'
     
@@ -14,7 +21,8 @@ class User(db.Model):
     password_hash = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.TIMESTAMP, default=db.func.current_timestamp())
 
-    documents = relationship("Document", back_populates="user", cascade="all, delete-orphan", lazy="joined")
+    # Loaded only when accessed; deletes are left to ON DELETE CASCADE instead of loading the rows first
+    documents = relationship("Document", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Document(db.Model):
@@ -24,11 +32,37 @@ class Document(db.Model):
     user_id = db.Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
     document_name = db.Column(db.String(255), nullable=False)
     document_path = db.Column(db.Text, nullable=False)
-    document_text = db.Column(db.Text)
-    uploaded_at = db.Column(db.TIMESTAMP, default=db.func.current_timestamp())
+    document_text = deferred(db.Column(db.Text))  # full extracted text, loaded only when accessed
+    page_count = db.Column(db.Integer)
+    uploaded_at = db.Column(db.TIMESTAMP, default=utcnow)
+
+    # Serves the keyset-paginated listing, newest first
+    __table_args__ = (db.Index("ix_documents_user_uploaded", "user_id", "uploaded_at", "id"),)
+
+    user = relationship("User", back_populates="documents")
+    embeddings = relationship("Embedding", back_populates="document", cascade="all, delete-orphan", passive_deletes=True)
+    chunks = relationship(
+        "DocumentChunk", back_populates="document", cascade="all, delete-orphan",
+        order_by="DocumentChunk.chunk_index", passive_deletes=True,
+    )
+
+
+class DocumentChunk(db.Model):
+    __tablename__ = 'document_chunks'
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    document_id = db.Column(UUID(as_uuid=True), ForeignKey('documents.id', ondelete="CASCADE"), nullable=False, index=True)
+    chunk_index = db.Column(db.Integer, nullable=False)
+    page_number = db.Column(db.Integer)
+    start_offset = db.Column(db.Integer, nullable=False)
+    end_offset = db.Column(db.Integer, nullable=False)
+    chunk_text = db.Column(db.Text, nullable=False)
+    term_count = db.Column(db.Integer)  # indexed terms, the BM25 document length
+    content_hash = db.Column(db.String(64), index=True)  # embeddings.text_hash, to reuse vectors of unchanged chunks
+    created_at = db.Column(db.TIMESTAMP, default=db.func.current_timestamp())
 
-    user = relationship("User", back_populates="documents", lazy="joined")
-    embeddings = relationship("Embedding", back_populates="document", cascade="all, delete-orphan", lazy="joined")
+    document = relationship("Document", back_populates="chunks")
+    embeddings = relationship("Embedding", back_populates="chunk", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Embedding(db.Model):
@@ -36,7 +70,82 @@ class Embedding(db.Model):
 
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     document_id = db.Column(UUID(as_uuid=True), ForeignKey('documents.id', ondelete="CASCADE"), nullable=False)
-    embedding_vector = db.Column(Vector(768), nullable=False)  # ✅ Use pgvector's Vector type
+    chunk_id = db.Column(UUID(as_uuid=True), ForeignKey('document_chunks.id', ondelete="CASCADE"), index=True)
+    embedding_vector = deferred(db.Column(Vector(768), nullable=False))  # ✅ Use pgvector's Vector type
+    # The EmbeddingVersion that produced the vector; searches only compare vectors of the serving version
+    model_name = db.Column(db.String(100))
+    pipeline_version = db.Column(db.String(32))
+    created_at = db.Column(db.TIMESTAMP, default=db.func.current_timestamp())
+
+    __table_args__ = (db.Index("ix_embeddings_version", "model_name", "pipeline_version"),)
+
+    document = relationship("Document", back_populates="embeddings")
+    chunk = relationship("DocumentChunk", back_populates="embeddings")
+
+
+class ChunkTerm(db.Model):
+    __tablename__ = 'chunk_terms'
+
+    term = db.Column(db.String(100), primary_key=True)
+    chunk_id = db.Column(UUID(as_uuid=True), ForeignKey('document_chunks.id', ondelete="CASCADE"), primary_key=True, index=True)
+    document_id = db.Column(UUID(as_uuid=True), ForeignKey('documents.id', ondelete="CASCADE"), nullable=False)
+    frequency = db.Column(db.Integer, nullable=False)
+
+
+class EmbeddingCacheEntry(db.Model):
+    __tablename__ = 'embedding_cache'
+
+    content_hash = db.Column(db.String(64), primary_key=True)  # sha256 of (embedding version key, normalized text)
+    model_name = db.Column(db.String(100), nullable=False)  # EmbeddingVersion.key
+    embedding_vector = db.Column(Vector(768), nullable=False)
+    created_at = db.Column(db.TIMESTAMP, default=db.func.current_timestamp())
+
+
+class AnswerCacheEntry(db.Model):
+    __tablename__ = 'answer_cache'
+    __table_args__ = (db.Index("ix_answer_cache_user_scope", "user_id", "scope_key"),)
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = db.Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
+    scope_key = db.Column(db.String(64), nullable=False)  # "all" or a hash of the selected document ids
+    document_ids = db.Column(db.JSON)  # the selected document ids, null for all documents
+    query_text = db.Column(db.Text, nullable=False)
+    query_vector = db.Column(Vector(768), nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    sources = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.TIMESTAMP, nullable=False)
+
+
+class IngestionJob(db.Model):
+    __tablename__ = 'ingestion_jobs'
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = db.Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete="CASCADE"), nullable=False, index=True)
+    document_id = db.Column(UUID(as_uuid=True), ForeignKey('documents.id', ondelete="SET NULL"))
+    document_name = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="queued", index=True)  # queued, extracting, embedding, ready, failed
+    error = db.Column(db.Text)
+    timings = db.Column(db.JSON, default=dict)  # seconds per stage
     created_at = db.Column(db.TIMESTAMP, default=db.func.current_timestamp())
+    started_at = db.Column(db.TIMESTAMP)
+    updated_at = db.Column(db.TIMESTAMP)
+    finished_at = db.Column(db.TIMESTAMP)
+
+
+class ChatSession(db.Model):
+    __tablename__ = 'chat_sessions'
 
-    document = relationship("Document", back_populates="embeddings", lazy="joined")
+    user_id = db.Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete="CASCADE"), primary_key=True)
+    history = db.Column(db.JSON, nullable=False, default=list)  # [{"role": "user" | "model", "text": ...}]
+    updated_at = db.Column(db.TIMESTAMP, nullable=False, index=True)
+
+
+class EmbeddingVersionState(db.Model):
+    __tablename__ = 'embedding_versions'
+
+    model_name = db.Column(db.String(100), primary_key=True)
+    pipeline_version = db.Column(db.String(32), primary_key=True)
+    state = db.Column(db.String(16), nullable=False)  # serving (exactly one) or retired
+    created_at = db.Column(db.TIMESTAMP, default=db.func.current_timestamp())
+    switched_at = db.Column(db.TIMESTAMP)
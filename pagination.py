@@ -0,0 +1,58 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from sqlalchemy import select, func, tuple_
+from extensions import db
+from models import Document
+
+
+def encode_cursor(uploaded_at, document_id):
+    """Opaque cursor pointing just after a listed document."""
+    raw = json.dumps([uploaded_at.isoformat(), str(document_id)])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Returns (uploaded_at, document_id); raises ValueError for malformed cursors."""
+    try:
+        uploaded_at, document_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(uploaded_at), uuid.UUID(document_id)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def _filtered(stmt, user_id, name_prefix=None, uploaded_after=None, uploaded_before=None):
+    stmt = stmt.where(Document.user_id == user_id)
+    if name_prefix:
+        stmt = stmt.where(Document.document_name.startswith(name_prefix, autoescape=True))
+    if uploaded_after:
+        stmt = stmt.where(Document.uploaded_at >= uploaded_after)
+    if uploaded_before:
+        stmt = stmt.where(Document.uploaded_at < uploaded_before)
+    return stmt
+
+
+def list_documents(user_id, limit, cursor=None, name_prefix=None, uploaded_after=None, uploaded_before=None,
+                   include_total=False):
+    """
+    One page of a user's documents, newest first, by keyset pagination on (uploaded_at, id) over the
+    ix_documents_user_uploaded index: each page costs the same however many documents come before it.
+    Returns (rows, next cursor or None, total matching documents or None).
+    """
+    filters = (user_id, name_prefix, uploaded_after, uploaded_before)
+    stmt = _filtered(select(Document.id, Document.document_name, Document.uploaded_at), *filters)
+    if cursor:
+        stmt = stmt.where(tuple_(Document.uploaded_at, Document.id) < tuple_(*decode_cursor(cursor)))
+    rows = db.session.execute(
+        stmt.order_by(Document.uploaded_at.desc(), Document.id.desc()).limit(limit + 1)
+    ).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].uploaded_at, rows[-1].id)
+    total = None
+    if include_total:
+        total = db.session.execute(_filtered(select(func.count(Document.id)), *filters)).scalar()
+    return rows, next_cursor, total
@@ -0,0 +1,67 @@
+import threading
+
+
+def _gemini(config):
+    from google import genai  # imported on first use: the SDK takes most of a second to import
+    return genai.Client(api_key=config["GEMINI_API_KEY"])
+
+
+def _fake(config):
+    from fake_provider import FakeClient
+    return FakeClient(
+        embed_latency=config["FAKE_EMBED_LATENCY_MS"] / 1000,
+        chat_latency=config["FAKE_CHAT_LATENCY_MS"] / 1000,
+    )
+
+
+class LazyClient:
+    """
+    The model provider client selected by LLM_PROVIDER, from a registry of factories.
+
+    Stands in for the client itself: .models and .chats are those of the provider's
+    client, which is created on first use, so the app starts without the provider SDK loaded
+    and without credentials until a model is actually called.
+    """
+
+    def __init__(self, app=None):
+        self.provider = None
+        self.config = None
+        self._factories = {"gemini": _gemini, "fake": _fake}
+        self._client = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        provider = app.config["LLM_PROVIDER"]
+        if provider not in self._factories:
+            raise ValueError(f"Unknown LLM_PROVIDER {provider!r}; expected one of {', '.join(sorted(self._factories))}")
+        self.provider = provider
+        self.config = app.config
+        self._client = None
+        app.extensions["llm_client"] = self
+
+    def register(self, name, factory):
+        """factory(config) returns a client with the genai.Client interface."""
+        self._factories[name] = factory
+
+    def get(self):
+        """The provider's client, created on the first call."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    if self.provider is None:
+                        raise RuntimeError("LazyClient used before init_app")
+                    self._client = self._factories[self.provider](self.config)
+        return self._client
+
+    @property
+    def models(self):
+        return self.get().models
+
+    @property
+    def chats(self):
+        return self.get().chats
+
+
+llm_client = LazyClient()
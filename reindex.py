@@ -0,0 +1,252 @@
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import select, insert, update, delete, exists, func
+from chunking import chunk_pages
+from extensions import db
+from embeddings import text_hash
+from lexical import chunk_postings
+from models import ChunkTerm, Document, DocumentChunk, Embedding
+from vector_store import index_chunks, drop_version
+from versions import embedding_versions, version_filter
+
+logger = logging.getLogger(__name__)
+
+
+def _stale(version):
+    """Condition matching chunks without an embedding from version."""
+    return ~exists().where(Embedding.chunk_id == DocumentChunk.id, version_filter(version))
+
+
+class Reindexer:
+    """
+    Background re-embedding after an embedding version change.
+
+    Chunks without an embedding from the target version are embedded in batches of
+    REINDEX_BATCH_SIZE, REINDEX_INTERVAL seconds apart, walking the chunks in id order; the
+    embedding QPS limit applies on top. Queries keep using the serving version meanwhile. Once a
+    pass finds no chunk left, the target becomes the serving version. Embeddings of a retired
+    version are deleted REINDEX_RETIRE_AFTER seconds after the switch, when no worker can still be
+    serving them.
+
+    Documents stored before chunking (text in document_text, one document-level embedding) are
+    split into chunks first, so the same pass embeds them and they become searchable again.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.embed = None
+        self.enabled = True
+        self.batch_size = 100
+        self.interval = 1.0
+        self.idle_interval = 60.0
+        self.retire_after = 300
+        self.chunk_size = 1000
+        self.chunk_overlap = 200
+        self._legacy_pending = True  # documents from before chunking are looked for once per process
+        self._unchunkable = set()  # legacy documents whose text yields no chunk
+        self._after = None  # keyset position of the current pass
+        self._pass_pending = True  # one pass runs at start-up, catching chunks left without embeddings
+        self._retiring = set()
+        self._thread = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config["REINDEX_ENABLED"]
+        self.batch_size = app.config["REINDEX_BATCH_SIZE"]
+        self.interval = app.config["REINDEX_INTERVAL"]
+        self.idle_interval = app.config["REINDEX_IDLE_INTERVAL"]
+        self.retire_after = app.config["REINDEX_RETIRE_AFTER"]
+        self.chunk_size = app.config["CHUNK_SIZE"]
+        self.chunk_overlap = app.config["CHUNK_OVERLAP"]
+        app.extensions["reindexer"] = self
+
+    def register_embedder(self, embed):
+        """embed(texts, session=..., version=...) returns one vector per text."""
+        self.embed = embed
+
+    def start(self):
+        with self._lock:
+            if self.enabled and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._work, name="reindexer", daemon=True)
+                self._thread.start()
+
+    def run_once(self):
+        """
+        One unit of work: a batch of legacy documents to chunk, a batch of chunks to embed, the switch
+        to the target version, or a batch of retired embeddings to delete. Returns a report; "idle"
+        is True when nothing was left to do.
+        """
+        embedding_versions.ensure_serving()
+        target = embedding_versions.target
+        serving = embedding_versions.serving(fresh=True)
+        report = {"chunked": 0, "embedded": 0, "switched": False, "deleted": 0, "idle": False}
+
+        if self._legacy_pending:
+            report["chunked"] = self._chunk_legacy_documents()
+            if report["chunked"]:
+                self._pass_pending = True
+                return report
+            self._legacy_pending = False
+
+        if serving != target or self._pass_pending:
+            rows = self._stale_chunks(target)
+            if rows:
+                self._embed(rows, target, serving)
+                self._after = rows[-1].id
+                report["embedded"] = len(rows)
+                return report
+            if self._after is not None:
+                # Chunks added behind the pass are found by the next one, from the start
+                self._after = None
+                return report
+            self._pass_pending = False
+            if serving != target:
+                embedding_versions.switch(target)
+                report["switched"] = True
+                return report
+
+        report["deleted"] = self._delete_retired(target)
+        report["idle"] = not report["deleted"]
+        return report
+
+    def _chunk_legacy_documents(self):
+        """Chunks a batch of documents stored before chunking; returns how many were chunked."""
+        stmt = (
+            select(Document.id, Document.document_text)
+            .where(Document.document_text.isnot(None), ~exists().where(DocumentChunk.document_id == Document.id))
+            .order_by(Document.id)
+            .limit(self.batch_size)
+            .with_for_update(of=Document, skip_locked=True)
+        )
+        if self._unchunkable:
+            stmt = stmt.where(Document.id.notin_(self._unchunkable))
+        documents = db.session.execute(stmt).all()
+
+        chunk_rows, postings = [], []
+        for document in documents:
+            # The stored text is the pages joined together, so page numbers are unknown
+            chunks = list(chunk_pages([(None, document.document_text)], self.chunk_size, self.chunk_overlap))
+            if not chunks:
+                self._unchunkable.add(document.id)
+            for chunk in chunks:
+                chunk_id = uuid.uuid4()
+                term_count, chunk_terms = chunk_postings(chunk_id, document.id, chunk.text)
+                postings.extend(chunk_terms)
+                chunk_rows.append({
+                    "id": chunk_id,
+                    "document_id": document.id,
+                    "chunk_index": chunk.chunk_index,
+                    "page_number": None,
+                    "start_offset": chunk.start_offset,
+                    "end_offset": chunk.end_offset,
+                    "chunk_text": chunk.text,
+                    "term_count": term_count,
+                    "content_hash": text_hash(chunk.text),
+                })
+        chunked = {row["document_id"] for row in chunk_rows}
+        if chunk_rows:
+            db.session.execute(insert(DocumentChunk), chunk_rows)
+            if postings:
+                db.session.execute(insert(ChunkTerm), postings)
+            # The document-level vectors are never searched; the chunks' replace them
+            db.session.execute(
+                delete(Embedding).where(Embedding.document_id.in_(chunked), Embedding.chunk_id.is_(None))
+            )
+        db.session.commit()
+        return len(chunked)
+
+    def _stale_chunks(self, target):
+        stmt = (
+            select(DocumentChunk.id, DocumentChunk.document_id, DocumentChunk.chunk_text, DocumentChunk.content_hash, Document.user_id)
+            .join(Document, Document.id == DocumentChunk.document_id)
+            .where(_stale(target))
+            .order_by(DocumentChunk.id)
+            .limit(self.batch_size)
+            # Workers in other processes take different chunks
+            .with_for_update(of=DocumentChunk, skip_locked=True)
+        )
+        if self._after is not None:
+            stmt = stmt.where(DocumentChunk.id > self._after)
+        return db.session.execute(stmt).all()
+
+    def _embed(self, rows, target, serving):
+        vectors = self.embed([row.chunk_text for row in rows], session=db.session, version=target)
+        db.session.execute(insert(Embedding), [
+            {
+                "id": uuid.uuid4(),
+                "document_id": row.document_id,
+                "chunk_id": row.id,
+                "embedding_vector": vector,
+                "model_name": target.model,
+                "pipeline_version": target.pipeline,
+            }
+            for row, vector in zip(rows, vectors)
+        ])
+        # Chunks stored before content hashes were recorded get one, so re-uploads can reuse them
+        unhashed = [{"id": row.id, "content_hash": text_hash(row.chunk_text)} for row in rows if row.content_hash is None]
+        if unhashed:
+            db.session.execute(update(DocumentChunk), unhashed)
+        db.session.commit()
+
+        if target == serving:
+            # Already being served: add them to the local index shards too
+            by_document = {}
+            for row, vector in zip(rows, vectors):
+                by_document.setdefault((row.user_id, row.document_id), []).append((row.id, vector))
+            for (user_id, document_id), items in by_document.items():
+                chunk_ids, document_vectors = zip(*items)
+                index_chunks(user_id, document_id, list(chunk_ids), np.asarray(document_vectors, dtype=np.float32), target)
+
+    def _delete_retired(self, target):
+        before = datetime.utcnow() - timedelta(seconds=self.retire_after)
+        for version in embedding_versions.retired(before):
+            if version == target:
+                continue
+            batch = select(Embedding.id).where(version_filter(version)).limit(self.batch_size * 10)
+            deleted = db.session.execute(delete(Embedding).where(Embedding.id.in_(batch.scalar_subquery()))).rowcount
+            db.session.commit()
+            if deleted:
+                self._retiring.add(version)
+                return deleted
+            if version in self._retiring:
+                self._retiring.discard(version)
+                drop_version(version)
+                # Chunks whose only embedding was of this version (stored by a worker that had not
+                # seen the switch yet) are embedded again
+                self._pass_pending = True
+        return 0
+
+    def get_status(self):
+        target = embedding_versions.target
+        serving = embedding_versions.serving(fresh=True)
+        stale = db.session.execute(select(func.count(DocumentChunk.id)).where(_stale(target))).scalar()
+        return {
+            "serving": serving._asdict(),
+            "target": target._asdict(),
+            "migrating": serving != target,
+            "stale_chunks": stale,
+        }
+
+    def _work(self):
+        while True:
+            idle = True
+            try:
+                with self.app.app_context():
+                    try:
+                        idle = self.run_once()["idle"]
+                    except Exception:
+                        db.session.rollback()
+                        raise
+            except Exception:
+                logger.exception("Re-indexer error")
+            time.sleep(self.idle_interval if idle else self.interval)
+
+
+reindexer = Reindexer()
@@ -0,0 +1,139 @@
+import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from lexical import tokenize
+
+logger = logging.getLogger(__name__)
+
+
+class LexicalOverlapReranker:
+    """
+    Scores passages by how much of the question they contain: the share of query terms present,
+    plus credit for query terms appearing next to each other as they do in the question.
+    Needs no model, so it is also the fallback when a model cannot be loaded. Word overlap says
+    little about meaning, so its score is blended with the first stage's rather than replacing it.
+    """
+
+    name = "lexical"
+    blended = True
+
+    def score(self, query, texts):
+        terms = tokenize(query)
+        unique = set(terms)
+        bigrams = set(zip(terms, terms[1:]))
+        scores = []
+        for text in texts:
+            words = tokenize(text)
+            coverage = len(unique & set(words)) / len(unique) if unique else 0.0
+            adjacency = len(bigrams & set(zip(words, words[1:]))) / len(bigrams) if bigrams else 0.0
+            scores.append(0.8 * coverage + 0.2 * adjacency)
+        return scores
+
+
+class CrossEncoderReranker:
+    """Scores (question, passage) pairs with a local sentence-transformers cross-encoder on CPU."""
+
+    name = "cross-encoder"
+    blended = False
+
+    def __init__(self, model_name):
+        from sentence_transformers import CrossEncoder  # optional dependency, only needed for this reranker
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def score(self, query, texts):
+        logits = self.model.predict([(query, text) for text in texts], batch_size=len(texts), show_progress_bar=False)
+        return [1.0 / (1.0 + math.exp(-float(logit))) for logit in logits]
+
+
+class Reranking:
+    """
+    Second retrieval stage: rescores the first stage's candidates and keeps the best top_k.
+
+    Candidates are scored in batches of RERANK_BATCH_SIZE on a small thread pool. Batches not
+    finished within RERANK_TIMEOUT seconds are skipped and their candidates keep their
+    first-stage order after the scored ones, so a slow reranker degrades rather than fails.
+    A blended reranker's score is mixed with the first-stage score, scaled to [0, 1] over the
+    candidates, with RERANK_LEXICAL_WEIGHT going to the reranker.
+    """
+
+    def __init__(self, app=None):
+        self.kind = "none"
+        self.model_name = None
+        self.lexical_weight = 0.3
+        self.batch_size = 32
+        self.timeout = 2.0
+        self._reranker = None
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rerank")
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.kind = app.config["RERANKER"]
+        self.model_name = app.config["RERANK_MODEL"]
+        self.lexical_weight = app.config["RERANK_LEXICAL_WEIGHT"]
+        self.batch_size = app.config["RERANK_BATCH_SIZE"]
+        self.timeout = app.config["RERANK_TIMEOUT"]
+        self._reranker = None
+        app.extensions["reranking"] = self
+
+    @property
+    def enabled(self):
+        return self.kind != "none"
+
+    def get_reranker(self):
+        # Models are loaded on first use, not at startup
+        with self._lock:
+            if self._reranker is None:
+                if self.kind == "cross-encoder":
+                    try:
+                        self._reranker = CrossEncoderReranker(self.model_name)
+                    except Exception as e:
+                        logger.warning("Cross-encoder %s unavailable, reranking lexically: %s", self.model_name, e)
+                        self._reranker = LexicalOverlapReranker()
+                else:
+                    self._reranker = LexicalOverlapReranker()
+            return self._reranker
+
+    def rerank(self, query, chunks, top_k):
+        """
+        Reorders RetrievedChunk candidates by reranker score (stored in chunk.score) and returns
+        (best top_k chunks, report).
+        """
+        reranker = self.get_reranker()
+        batches = [chunks[i:i + self.batch_size] for i in range(0, len(chunks), self.batch_size)]
+        futures = [self._pool.submit(reranker.score, query, [chunk.chunk_text for chunk in batch]) for batch in batches]
+        done, pending = wait(futures, timeout=self.timeout)
+        for future in pending:
+            future.cancel()
+
+        first_stage = {}
+        if reranker.blended and chunks:
+            low, high = min(chunk.score for chunk in chunks), max(chunk.score for chunk in chunks)
+            first_stage = {id(chunk): (chunk.score - low) / (high - low) if high > low else 1.0 for chunk in chunks}
+
+        scored, unscored = [], []
+        for batch, future in zip(batches, futures):
+            if future in done and future.exception() is None:
+                for chunk, score in zip(batch, future.result()):
+                    if reranker.blended:
+                        score = (1 - self.lexical_weight) * first_stage[id(chunk)] + self.lexical_weight * score
+                    chunk.score = score
+                    scored.append(chunk)
+            else:
+                unscored.extend(batch)
+        scored.sort(key=lambda chunk: chunk.score, reverse=True)
+        for chunk in unscored:
+            chunk.score = 0.0  # ranks after every scored candidate, in first-stage order
+
+        report = {
+            "reranker": reranker.name,
+            "candidates": len(chunks),
+            "reranked": len(scored),
+            "degraded": bool(unscored),
+        }
+        return (scored + unscored)[:top_k], report
+
+
+reranking = Reranking()
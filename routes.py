@@ -1,8 +1,13 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+import uuid
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from flask_jwt_extended import create_access_token, get_jwt_identity, jwt_required
 from services import UserService, DocumentService,QAService
 from datetime import timedelta
-from models import User
+from identity import access_token_claims, current_user_id
+from embeddings import embedding_cache
+from answer_cache import answer_cache
+from reindex import reindexer
+from metrics import metrics
 
 routes = Blueprint('routes', __name__)
 
@@ -18,12 +23,16 @@ async def login():
     user = await UserService.authenticate_user(data.get('email'), data.get('password'))
 
     if user:
-        print(user)
-        access_token = create_access_token(identity=user.email)
+        access_token = create_access_token(identity=user.email, additional_claims=access_token_claims(user))
         return jsonify(access_token=access_token,expires_delta=False), 200
 
     return jsonify({"msg": "Invalid credentials"}), 401
 
+@routes.route('/protected', methods=['GET'])
+@jwt_required()
+def protected():
+    return jsonify(logged_in_as=get_jwt_identity()), 200
+
 
 #document management
 @routes.route("/documentupload", methods=["POST"])
@@ -31,6 +40,16 @@ async def login():
 async def documentupload():
     return await DocumentService.uploadDocument()
 
+@routes.route("/documentbulkupload", methods=["POST"])
+@jwt_required()
+async def documentbulkupload():
+    return await DocumentService.bulkUploadDocuments()
+
+@routes.route("/documentstatus/<job_id>", methods=["GET"])
+@jwt_required()
+async def documentstatus(job_id):
+    return await DocumentService.getDocumentStatus(job_id)
+
 @routes.route("/getdocuments", methods=["GET"])
 @jwt_required()
 async def getdocuments():
@@ -41,28 +60,111 @@ async def getdocuments():
 async def documentdelete():
     return await DocumentService.deleteDocument()
 
+@routes.route("/embeddingcachestats", methods=["GET"])
+@jwt_required()
+def embeddingcachestats():
+    return jsonify(embedding_cache.get_stats()), 200
+
+@routes.route("/answercachestats", methods=["GET"])
+@jwt_required()
+def answercachestats():
+    return jsonify(answer_cache.get_stats()), 200
+
+@routes.route("/embeddingversions", methods=["GET"])
+@jwt_required()
+def embeddingversions():
+    return jsonify(reindexer.get_status()), 200
+
+@routes.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Prometheus scrape endpoint; unauthenticated, so expose it on an internal network only."""
+    if not metrics.enabled:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 
 
 
 #QA Routes
 
-@routes.route('/askquestion', methods=['POST'])
-@jwt_required()
-def ask_question():
-    """Handles user queries and returns AI-generated responses using stored embeddings."""
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
-    
-    if not user:
+def _bounded_int(data, name, low, high):
+    """Reads an optional integer parameter in [low, high]; returns (value, error)."""
+    value = data.get(name)
+    if value is None:
+        return None, None
+    if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+        return None, ({"error": f"{name} must be an integer between {low} and {high}"}, 400)
+    return value, None
+
+def _document_ids(data):
+    """Reads the optional document_ids filter as a list of UUIDs; returns (ids, error)."""
+    value = data.get("document_ids")
+    if not value:
+        return None, None
+    error = ({"error": "document_ids must be a list of document ids"}, 400)
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        return None, error
+    try:
+        return list(dict.fromkeys(uuid.UUID(item) for item in value)), None
+    except ValueError:
+        return None, error
+
+def _question_request():
+    """
+    Reads the question payload; returns (query, user_id, document_ids, new_chat, top_k, candidate_pool)
+    or an error tuple.
+    """
+    user_id = current_user_id()
+    if not user_id:
         return {"error": "User not found"}, 404
 
     data = request.get_json()
     query = data.get("query", "").strip()
-    document_ids = data.get("document_ids", None)  # Optional document filtering
     new_chat = data.get("new_chat", 0)
     if not query:
         return {"error": "Query is required"}, 400
 
+    # Optional document filtering; ownership is checked where the documents are searched
+    document_ids, error = _document_ids(data)
+    if error:
+        return error
+
+    # Optional retrieval sizes: passages sent to the model, and candidates the reranker scores
+    top_k, error = _bounded_int(data, "top_k", 1, current_app.config["MAX_TOP_K"])
+    if error:
+        return error
+    candidate_pool, error = _bounded_int(data, "candidate_pool", top_k or 1, current_app.config["MAX_CANDIDATE_POOL"])
+    if error:
+        return error
+    return query, user_id, document_ids, new_chat, top_k, candidate_pool
+
+@routes.route('/askquestion', methods=['POST'])
+@jwt_required()
+def ask_question():
+    """Handles user queries and returns AI-generated responses using stored embeddings."""
+    question = _question_request()
+    if len(question) == 2:
+        return question
+
     # Call QA Service to generate response
-    response =  QAService.generate_answer(query, user.id, document_ids,new_chat)
-    return jsonify(response)
\ No newline at end of file
+    response, status_code = QAService.generate_answer(*question)
+    return jsonify(response), status_code
+
+@routes.route('/askquestion/stream', methods=['POST'])
+@jwt_required()
+def ask_question_stream():
+    """Same as /askquestion, but streams the answer as Server-Sent Events while it is generated."""
+    question = _question_request()
+    if len(question) == 2:
+        return question
+
+    events = QAService.stream_answer(*question)
+    if isinstance(events, tuple):
+        response, status_code = events
+        return jsonify(response), status_code
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
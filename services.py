@@ -1,40 +1,74 @@
 import os
 import uuid
 #import google.generativeai as genai
-from flask import request, jsonify, Blueprint
-from flask_jwt_extended import get_jwt_identity
-from models import User, Document, Embedding
+from flask import request, jsonify, Blueprint, current_app
+from models import User, Document, DocumentChunk, Embedding, IngestionJob, ChunkTerm
 from extensions import db
 import bcrypt
-from google import genai
-from google.genai import types
-import pdfplumber
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 import base64
-import asyncio
+import itertools
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import json
+import time
+from datetime import datetime
+from sqlalchemy import insert
+from chunking import chunk_pages
+from context import build_context
+from lexical import chunk_postings
+from rerank import reranking
+from extraction import SUPPORTED_FORMATS, iter_pages, archive_members, is_archive, rename_by_type, save_stream
+from config import Config
+from embeddings import EmbeddingBatcher, EmbeddingService, embedding_cache, text_hash
+from jobs import ingestion_queue, start_stage, record_timing, heartbeat, confirm_claim
+from metrics import metrics
+from providers import llm_client
+from sessions import chat_store
+from answer_cache import answer_cache
+from identity import current_user_id
+from pagination import list_documents
+from vector_store import search_chunks, index_chunks, remove_document, stored_vectors
+from versions import embedding_versions
+from reindex import reindexer
 
 qa_bp = Blueprint("qa", __name__)
 
-client = genai.Client(api_key=<gemini-api-key>)
-chat_sessions = {}
-UPLOAD_FOLDER = os.path.join(os.getcwd(), "uploads")  # Upload directory
+UPLOAD_FOLDER = os.path.join(os.getcwd(), "uploads")  # Upload directory, created on the first upload
+
+
+def upload_path(filename):
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    return os.path.join(UPLOAD_FOLDER, filename)
+
+
+embedding_service = EmbeddingService(
+    EmbeddingBatcher(
+        llm_client,
+        model=Config.EMBEDDING_MODEL,
+        max_batch_size=Config.EMBED_BATCH_SIZE,
+        max_wait=Config.EMBED_BATCH_WAIT_MS / 1000,
+        max_qps=Config.EMBED_MAX_QPS,
+        max_retries=Config.EMBED_MAX_RETRIES,
+        max_concurrency=Config.EMBED_MAX_CONCURRENCY,
+    ),
+    embedding_cache,
+    pipeline_version=Config.EMBEDDING_PIPELINE_VERSION,
+)
 
-# Ensure the uploads folder exists
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
 
 ######## USER SERVICES
 class UserService:
     @staticmethod
     async def register_user(username, email, password):
-        # Hash password
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-
         # Check if user exists
         if User.query.filter_by(email=email).first():
             return {"msg": "User already exists"}, 400
 
+        # Hash password
+        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+
         # Create user
         new_user = User(username=username, email=email, password_hash=hashed_password.decode('utf-8'))
         db.session.add(new_user)
@@ -55,9 +89,8 @@ class DocumentService:
     @staticmethod
     async def uploadDocument():
         """Handles document upload, stores in DB, and generates embeddings."""
-        current_user_email = get_jwt_identity()
-        user = User.query.filter_by(email=current_user_email).first()
-        if not user:
+        user_id = current_user_id()
+        if not user_id:
             return {"error": "User not found"}, 404
 
         if "file" not in request.files:
@@ -67,81 +100,319 @@ class DocumentService:
         if file.filename == "":
             return {"error": "No selected file"}, 400
 
-        # Save file
-        file_ext = file.filename.split('.')[-1]
-        filename = f"{uuid.uuid4()}.{file_ext}"
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
+        # Save file; its type is sniffed from the content, and the parser for it chosen at ingestion
+        timings = {}
+        file_path = upload_path(f"{uuid.uuid4()}.upload")
+        with metrics.stage("upload", "save", timings):
+            file.save(file_path)
+            file_path = rename_by_type(file_path, file.filename)
+        if file_path is None:
+            return {"error": f"Unsupported file type; upload {SUPPORTED_FORMATS}"}, 400
+
+        # Extraction, chunking and embedding run in the background ingestion workers
+        job = IngestionJob(
+            user_id=user_id,
+            document_name=file.filename,
+            file_path=file_path,
+            status="queued",
+            timings=timings
+        )
+        db.session.add(job)
+
+        if current_app.config["INGESTION_MODE"] == "sync":
+            job.status = "extracting"
+            job.started_at = job.updated_at = datetime.utcnow()
+            db.session.commit()
+            job = ingestion_queue.run(job.id)
+            if job.status == "failed":
+                return {"error": job.error, "job_id": str(job.id)}, 500
+            return {"message": "Document uploaded successfully!", "job_id": str(job.id), "document_id": str(job.document_id)}, 201
 
-        
-        # Read file content
+        db.session.commit()
+        ingestion_queue.notify()
+        return {"message": "Document queued for processing", "job_id": str(job.id), "status": job.status}, 202
 
-        def extract_text_from_pdf(file_path):
+    @staticmethod
+    async def bulkUploadDocuments():
+        """
+        Accepts many documents and zip or tar archives of them in the "files" field. Each file is
+        streamed to disk and gets an ingestion job; the jobs are inserted together and processed by
+        the bounded ingestion workers. Returns a manifest with one entry per file.
+        """
+        user_id = current_user_id()
+        if not user_id:
+            return {"error": "User not found"}, 404
+
+        uploads = request.files.getlist("files")
+        if not uploads:
+            return {"error": "No files part"}, 400
+
+        config = current_app.config
+        max_files = config["BULK_UPLOAD_MAX_FILES"]
+        max_bytes = config["BULK_UPLOAD_MAX_FILE_MB"] * 1024 * 1024
+        manifest, jobs = [], []
+
+        def accept(name, source):
+            # Archive member paths are never used on disk, only as the document name
+            name = os.path.basename(name)
+            if len(jobs) >= max_files:
+                manifest.append({"file": name, "status": "rejected", "error": f"More than {max_files} files"})
+                return
+            timings = {}
+            file_path = upload_path(f"{uuid.uuid4()}.upload")
             try:
-                with pdfplumber.open(file_path) as pdf:
-                    text = ""
-                    for page in pdf.pages:
-                        text += page.extract_text()
-                return text
-            except Exception as e:
-                return {"error": f"Error extracting text from PDF: {str(e)}"}, 500
-            
-        if(file_ext=='pdf'):
-            document_content = extract_text_from_pdf(file_path)
-            if isinstance(document_content, dict):  # Error response from extract_text_from_pdf
-                return document_content
-        
-        elif(file_ext=='txt'):
-            with open(file_path, "r", encoding="utf-8") as f:
-                document_content = f.read()
-        else:
-            return {"error": "Only pdf or txt file is acceptable"}, 400
-        try:
-            # Generate embedding using the correct method
-            result = client.models.embed_content(
-                model="text-embedding-004",
-                contents=document_content
+                with metrics.stage("upload", "save", timings):
+                    save_stream(source, file_path, max_bytes)
+                    file_path = rename_by_type(file_path, name)
+            except ValueError as e:
+                manifest.append({"file": name, "status": "rejected", "error": str(e)})
+                return
+            if file_path is None:
+                manifest.append({"file": name, "status": "rejected", "error": f"Unsupported file type; upload {SUPPORTED_FORMATS}"})
+                return
+            job = IngestionJob(
+                id=uuid.uuid4(),
+                user_id=user_id,
+                document_name=name,
+                file_path=file_path,
+                status="queued",
+                timings=timings
             )
-            if result.embeddings and len(result.embeddings) > 0:
-                embedding_vector = result.embeddings[0].values  # Correct extraction
+            jobs.append(job)
+            manifest.append({"file": name, "status": "queued", "job_id": str(job.id)})
+
+        for upload in uploads:
+            if is_archive(upload.filename):
+                # Members are copied out one at a time, so the archive is never unpacked in memory
+                archive_path = upload_path(f"{uuid.uuid4()}.archive")
+                upload.save(archive_path)
+                try:
+                    for name, member in archive_members(archive_path):
+                        accept(name, member)
+                except (zipfile.BadZipFile, tarfile.TarError) as e:
+                    manifest.append({"file": upload.filename, "status": "rejected", "error": f"Unreadable archive: {e}"})
+                finally:
+                    os.remove(archive_path)
             else:
-                return {"error": "Embedding generation failed: No embeddings received"}, 500
+                accept(upload.filename, upload.stream)
+
+        if not jobs:
+            return {"error": "No acceptable files", "files": manifest}, 400
+
+        sync = config["INGESTION_MODE"] == "sync"
+        if sync:
+            # Claimed up front so background workers leave these jobs to this request
+            now = datetime.utcnow()
+            for job in jobs:
+                job.status, job.started_at, job.updated_at = "extracting", now, now
+        db.session.add_all(jobs)
+        db.session.commit()
 
+        if not sync:
+            ingestion_queue.notify()
+            return {"message": f"{len(jobs)} documents queued for processing", "files": manifest}, 202
+
+        # Same bound as the background workers: INGESTION_WORKERS documents in flight at once
+        app = current_app._get_current_object()
+
+        def run(job_id):
+            with app.app_context():
+                job = ingestion_queue.run(job_id)
+                return str(job.id), job.status, job.document_id, job.error
+
+        with ThreadPoolExecutor(max_workers=config["INGESTION_WORKERS"]) as pool:
+            results = {job_id: (status, document_id, error) for job_id, status, document_id, error in pool.map(run, [job.id for job in jobs])}
+        for entry in manifest:
+            if entry.get("job_id") in results:
+                status, document_id, error = results[entry["job_id"]]
+                entry["status"] = status
+                if document_id:
+                    entry["document_id"] = str(document_id)
+                if error:
+                    entry["error"] = error
+        return {"message": "Documents processed", "files": manifest}, 200
 
-            # Store document in DB
-            new_document = Document(
-                user_id=user.id,
-                document_name=file.filename,
-                document_path=file_path,
-                document_text=document_content
-            )
-            db.session.add(new_document)
-            db.session.commit()
+    @staticmethod
+    def ingest(job):
+        """
+        Streams the pages of a claimed ingestion job through chunking and embedding, storing chunks
+        batch by batch so the document is never held in memory as a whole. Records per-stage timings.
+        """
+        config = current_app.config
+        timings = {"extract": 0.0, "embed": 0.0, "store": 0.0}
+        page_count = 0
+
+        def pages():
+            nonlocal page_count
+            for page_number, text in iter_pages(
+                job.file_path,
+                workers=config["EXTRACTION_WORKERS"],
+                page_timeout=config["EXTRACTION_PAGE_TIMEOUT"],
+                memory_limit_mb=config["EXTRACTION_PAGE_MEMORY_MB"],
+                pdf_mode=config["PDF_TEXT_MODE"],
+            ):
+                page_count = page_number
+                yield page_number, text
+
+        chunks = chunk_pages(pages(), chunk_size=config["CHUNK_SIZE"], chunk_overlap=config["CHUNK_OVERLAP"])
+        # Stored vectors are tagged with the version being served, so the document is searchable right away
+        version = embedding_versions.serving()
+        document_id = None
+        chunk_ids, vectors = [], []
+        while True:
+            # Extraction of the next batch of chunks (pages are extracted ahead in the process pool)
+            started = time.perf_counter()
+            try:
+                batch = list(itertools.islice(chunks, config["EMBED_BATCH_SIZE"]))
+            except Exception as e:
+                raise ValueError(f"Error extracting text: {str(e)}") from e
+            timings["extract"] += time.perf_counter() - started
+            if not batch:
+                break
 
-            # Store embedding in DB
-            new_embedding = Embedding(
-                document_id=new_document.id,
-                embedding_vector=embedding_vector
-            )
-            db.session.add(new_embedding)
-            db.session.commit()
-            return {"message": "Document uploaded successfully!"}, 201
+            if document_id is not None:
+                heartbeat(job)  # keeps a long document from looking stale and being ingested twice
+            else:
+                start_stage(job, "embedding")
+                new_document = Document(
+                    user_id=job.user_id,
+                    document_name=job.document_name,
+                    document_path=job.file_path
+                )
+                db.session.add(new_document)
+                db.session.flush()
+                document_id = new_document.id
+
+            started = time.perf_counter()
+            # Chunks whose text the user has already uploaded (e.g. a re-upload) reuse the stored vector
+            hashes = [text_hash(chunk.text) for chunk in batch]
+            reused = stored_vectors(job.user_id, hashes, version)
+            try:
+                # Generate one embedding per new chunk
+                embedded = iter(embedding_service.embed_texts(
+                    [chunk.text for chunk, content_hash in zip(batch, hashes) if content_hash not in reused],
+                    session=db.session,
+                    version=version,
+                ))
+            except Exception as e:
+                raise RuntimeError(f"Embedding generation failed: {str(e)}") from e
+            embedding_vectors = [reused[content_hash] if content_hash in reused else next(embedded) for content_hash in hashes]
+            timings["embed"] += time.perf_counter() - started
+
+            # Store chunks, their embeddings and BM25 postings in DB, one multi-row INSERT per table
+            started = time.perf_counter()
+            chunk_rows, embedding_rows, postings = [], [], []
+            for chunk, content_hash, embedding_vector in zip(batch, hashes, embedding_vectors):
+                chunk_id = uuid.uuid4()
+                term_count, chunk_terms = chunk_postings(chunk_id, document_id, chunk.text)
+                postings.extend(chunk_terms)
+                chunk_rows.append({
+                    "id": chunk_id,
+                    "document_id": document_id,
+                    "chunk_index": chunk.chunk_index,
+                    "page_number": chunk.page_number,
+                    "start_offset": chunk.start_offset,
+                    "end_offset": chunk.end_offset,
+                    "chunk_text": chunk.text,
+                    "term_count": term_count,
+                    "content_hash": content_hash,
+                })
+                embedding_rows.append({
+                    "id": uuid.uuid4(),
+                    "document_id": document_id,
+                    "chunk_id": chunk_id,
+                    "embedding_vector": embedding_vector,
+                    "model_name": version.model,
+                    "pipeline_version": version.pipeline,
+                })
+                chunk_ids.append(chunk_id)
+            db.session.execute(insert(DocumentChunk), chunk_rows)
+            db.session.execute(insert(Embedding), embedding_rows)
+            if postings:
+                db.session.execute(insert(ChunkTerm), postings)
+            vectors.append(np.asarray(embedding_vectors, dtype=np.float32))
+            timings["store"] += time.perf_counter() - started
+
+        if document_id is None:
+            raise ValueError("No text could be extracted from the document")
+
+        started = time.perf_counter()
+        new_document.page_count = page_count
+        job.document_id = document_id
+        job.updated_at = datetime.utcnow()
+        # Nothing is committed if the job was reclaimed meanwhile, so the document is not stored twice
+        confirm_claim(job)
+        db.session.commit()
+        timings["store"] += time.perf_counter() - started
+        for stage, seconds in timings.items():
+            record_timing(job, stage, seconds)
 
-        except Exception as e:
-            db.session.rollback()
-            return {"error": f"Embedding generation failed: {str(e)}"}, 500
+        index_chunks(job.user_id, document_id, chunk_ids, np.vstack(vectors), version)
+        # Answers over all of the user's documents may change now that this one is searchable
+        answer_cache.invalidate(job.user_id, document_id)
 
+    @staticmethod
+    async def getDocumentStatus(job_id):
+        """Reports the state and per-stage timings of an ingestion job owned by the authenticated user."""
+        user_id = current_user_id()
+        if not user_id:
+            return {"error": "User not found"}, 404
 
+        try:
+            job = IngestionJob.query.filter_by(id=uuid.UUID(job_id), user_id=user_id).first()
+        except ValueError:
+            job = None
+        if not job:
+            return {"error": "Job not found"}, 404
+
+        return {
+            "job_id": str(job.id),
+            "document_name": job.document_name,
+            "document_id": str(job.document_id) if job.document_id else None,
+            "status": job.status,
+            "error": job.error,
+            "timings": job.timings or {},
+            "created_at": job.created_at.strftime("%Y-%m-%d %H:%M:%S") if job.created_at else None,
+            "finished_at": job.finished_at.strftime("%Y-%m-%d %H:%M:%S") if job.finished_at else None,
+        }, 200
 
     @staticmethod
     async def getAllDocuments():
-        """Lists all uploaded documents for the authenticated user."""
-        current_user_email = get_jwt_identity()
-        user = User.query.filter_by(email=current_user_email).first()
-        if not user:
+        """
+        Lists the authenticated user's documents, newest first, one page at a time. Query parameters:
+        limit, cursor (next_cursor of the previous page), name_prefix, uploaded_after and
+        uploaded_before (ISO dates), and include_total.
+        """
+        user_id = current_user_id()
+        if not user_id:
             return {"error": "User not found"}, 404
 
-        documents = Document.query.filter_by(user_id=user.id).all()
+        args = request.args
+        max_limit = current_app.config["DOCUMENTS_MAX_PAGE_SIZE"]
+        try:
+            limit = int(args.get("limit", current_app.config["DOCUMENTS_PAGE_SIZE"]))
+            uploaded_after, uploaded_before = (
+                datetime.fromisoformat(args[name]) if args.get(name) else None
+                for name in ("uploaded_after", "uploaded_before")
+            )
+        except ValueError:
+            return {"error": "limit must be an integer and uploaded_after/uploaded_before ISO dates"}, 400
+        if not 1 <= limit <= max_limit:
+            return {"error": f"limit must be between 1 and {max_limit}"}, 400
+
+        try:
+            documents, next_cursor, total = list_documents(
+                user_id,
+                limit,
+                cursor=args.get("cursor"),
+                name_prefix=args.get("name_prefix"),
+                uploaded_after=uploaded_after,
+                uploaded_before=uploaded_before,
+                include_total=args.get("include_total", "false").lower() == "true",
+            )
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
         document_list = [
             {
                 "id": str(doc.id),
@@ -150,21 +421,22 @@ class DocumentService:
             }
             for doc in documents
         ]
-
-        return {"documents": document_list}, 200
+        response = {"documents": document_list, "next_cursor": next_cursor}
+        if total is not None:
+            response["total"] = total
+        return response, 200
 
     @staticmethod
     async def deleteDocument():
         """Deletes a document (and associated embeddings) for the authenticated user."""
-        current_user_email = get_jwt_identity()
-        user = User.query.filter_by(email=current_user_email).first()
-        if not user:
+        user_id = current_user_id()
+        if not user_id:
             return {"error": "User not found"}, 404
 
         data = request.get_json()
         document_id = data.get("document_id")
 
-        document = Document.query.filter_by(id=document_id, user_id=user.id).first()
+        document = Document.query.filter_by(id=document_id, user_id=user_id).first()
         if not document:
             return {"error": "Document not found"}, 404
 
@@ -173,8 +445,11 @@ class DocumentService:
             os.remove(document.document_path)
 
         # Delete document and associated embeddings from DB
+        document_id = document.id
         db.session.delete(document)
         db.session.commit()
+        remove_document(user_id, document_id)
+        answer_cache.invalidate(user_id, document_id)
 
         return {"msg": "Document deleted successfully"}, 200
 
@@ -186,79 +461,265 @@ class DocumentService:
 
 class QAService:
     @staticmethod
-    def get_relevant_documents(query, user_id, document_ids=None):
+    def get_relevant_documents(query, user_id, document_ids=None, top_k=None, candidate_pool=None, report=None,
+                               query_embedding=None, version=None):
         """
-        Retrieves relevant document embeddings based on cosine similarity to the query embedding.
-        Filters based on selected document IDs or all user-uploaded documents.
+        Retrieves the document chunks that best match the query, best match first, in two stages:
+        embedding similarity fused with BM25 keyword ranking selects candidate_pool candidates, and
+        the reranker keeps the best top_k of them. Details of the rerank stage are added to report.
+        Filters based on selected document IDs or all user-uploaded documents. The query is embedded
+        here unless its embedding by version is passed in.
         """
-        # Fetch embeddings based on selected document IDs or all user-uploaded documents
-        if document_ids:
-            embeddings = Embedding.query.filter(Embedding.document_id.in_(document_ids)).all()
-        else:
-            user_documents = Document.query.filter_by(user_id=user_id).all()
-            doc_ids = [doc.id for doc in user_documents]
-            embeddings = Embedding.query.filter(Embedding.document_id.in_(doc_ids)).all()
-
-        if not embeddings:
+        config = current_app.config
+        top_k = top_k or config["RETRIEVAL_TOP_K"]
+        candidate_pool = max(candidate_pool or config["RERANK_CANDIDATES"], top_k) if reranking.enabled else top_k
+
+        if query_embedding is None:
+            # The query is compared with stored vectors of the version being served
+            version = embedding_versions.serving()
+            try:
+                # Generate embedding for the user query (cached for repeated questions)
+                query_embedding = embedding_service.embed_query(query, version)
+            except Exception as e:
+                return {"error": f"Embedding generation failed: {str(e)}"}, 500
+
+        # Nearest-neighbour search runs in the database (pgvector) where available; the query text
+        # also drives the lexical ranking, which catches exact identifiers and names
+        candidates = search_chunks(query_embedding, user_id, document_ids, candidate_pool, query_text=query, version=version)
+        if not candidates:
             return {"error": "No embeddings found"}, 404
+        if not reranking.enabled:
+            return candidates
+
+        started = time.perf_counter()
+        relevant_chunks, rerank_report = reranking.rerank(query, candidates, top_k)
+        if report is not None:
+            report.update(rerank_report, seconds=round(time.perf_counter() - started, 4))
+        return relevant_chunks
+    
+    @staticmethod
+    def format_question(query, context):
+        """Builds the message sent to the model for one question and the new document context."""
+        # Construct a conversational message format
+        messages = [
+            {"role": "system", "content": "You are an AI assistant providing answers based on uploaded documents.'"},
+            {"role": "user", "content": query},
+            # Provide document context; passages sent on earlier turns are already in the chat history
+            {"role": "assistant", "content": f"Relevant information:\n{context or 'See the documents quoted earlier in this conversation.'}"}
+        ]
+        return "\n".join([f"{msg['role'].capitalize()}: {msg['content']}" for msg in messages])
 
-        try:
-            # Generate embedding for the user query using Gemini API
-            result = client.models.embed_content(
-                model="text-embedding-004",
-                contents=query
+    @staticmethod
+    def start_turn(query_embedding, user_id, document_ids=None, new_chat=0, timings=None):
+        """
+        Loads the user's conversation and, when it has no earlier turns to depend on, looks the
+        question's embedding up in the answer cache. Returns (history, cached answer or None, timings).
+        """
+        timings = {} if timings is None else timings
+        # The conversation so far is replayed from the session store, so any worker can continue it
+        if new_chat == 1:
+            chat_store.reset(user_id)
+        history = chat_store.history(user_id)
+
+        cached = None
+        with metrics.stage("qa", "cache_lookup", timings):
+            if answer_cache.enabled:
+                if history:
+                    answer_cache.skip_follow_up()
+                else:
+                    cached = answer_cache.lookup(user_id, document_ids, query_embedding)
+        return history, cached, timings
+
+    @staticmethod
+    def cached_answer(query, user_id, cached, timings):
+        """Response for an answer cache hit; the exchange is still recorded in the chat history."""
+        entry, similarity = cached
+        chat_store.append(user_id, query, entry.response)
+        return {
+            "response": entry.response,
+            "sources": entry.sources,
+            "cached": True,
+            "similarity": round(similarity, 4),
+            "timings": timings,
+        }
+
+    @staticmethod
+    def prepare_answer(query, query_embedding, version, user_id, document_ids, history, timings, top_k=None, candidate_pool=None):
+        """
+        Retrieves the context for a question, embedded by version, and converts its chat history for
+        the model. Returns (history contents, message, context, retrieval report, timings), or an error tuple.
+        """
+        retrieval = {}
+        with metrics.stage("qa", "retrieval", timings):
+            relevant_chunks = QAService.get_relevant_documents(
+                query, user_id, document_ids, top_k, candidate_pool, retrieval, query_embedding, version
             )
-            query_embedding = np.array(result.embeddings[0].values).reshape(1, -1)
-        except Exception as e:
-            return {"error": f"Embedding generation failed: {str(e)}"}, 500
+        
+        if isinstance(relevant_chunks, tuple):
+            return relevant_chunks  # If error occurs, return it
+
+        # Pack the best passages into the token budget, leaving out those this chat has already seen
+        with metrics.stage("qa", "context", timings):
+            context = build_context(
+                relevant_chunks,
+                current_app.config["CONTEXT_TOKEN_BUDGET"],
+                chat_store.seen_chunk_ids(user_id, history),
+            )
+        metrics.context_tokens.observe(context.tokens_used)
 
-        # Compare query embedding with stored embeddings using cosine similarity
-        document_similarities = []
-        for embedding in embeddings:
-            doc_embedding = np.array(embedding.embedding_vector).reshape(1, -1)
-            similarity = cosine_similarity(query_embedding, doc_embedding)
-            document_similarities.append((embedding.document, similarity[0][0]))
+        contents = QAService.history_contents(history)
+        return contents, QAService.format_question(query, context.text), context, retrieval, timings
 
-        # Sort by similarity score (highest first)
-        document_similarities.sort(key=lambda x: x[1], reverse=True)
+    @staticmethod
+    def history_contents(history):
+        """The chat history as model messages."""
+        if not history:
+            return []
+        from google.genai import types  # the SDK is imported on first use, not at start-up
+        return [
+            types.Content(role=message["role"], parts=[types.Part(text=(
+                QAService.format_question(message["text"], message.get("context"))
+                if message["role"] == "user" else message["text"]
+            ))])
+            for message in history
+        ]
 
-        # Return top 3 relevant documents
-        top_documents = [doc[0] for doc in document_similarities[:3]]
-        return top_documents
-    
     @staticmethod
-    def generate_answer(query, user_id, document_ids=None, new_chat=0):
+    def answer_metadata(context, retrieval=None, timings=None):
+        """Sources, retrieval details and context usage reported alongside an answer."""
+        metadata = {
+            "sources": [
+                {
+                    "document_id": str(chunk.document_id),
+                    "document_name": chunk.document_name,
+                    "page_number": chunk.page_number,
+                    "score": round(chunk.score, 4),
+                }
+                for chunk in context.chunks
+            ],
+            "context": context.report(),
+        }
+        if retrieval:
+            metadata["retrieval"] = retrieval
+        if timings is not None:
+            metadata["timings"] = timings
+        return metadata
+
+    @staticmethod
+    def generate_answer(query, user_id, document_ids=None, new_chat=0, top_k=None, candidate_pool=None):
         """
-        Retrieves relevant documents and generates an answer using Gemini API in a conversational format.
+        Retrieves relevant document chunks and generates an answer using Gemini API in a conversational format.
+        A similar enough question already answered over the same documents is served from the answer cache.
         """
-        
-        relevant_documents = QAService.get_relevant_documents(query, user_id, document_ids)
-        
-        if "error" in relevant_documents:
-            return relevant_documents  # If error occurs, return it
+        timings = {}
+        version = embedding_versions.serving()
+        try:
+            # Embedded once; the answer cache, retrieval and the cache entry share the vector
+            with metrics.stage("qa", "query_embed", timings):
+                query_embedding = embedding_service.embed_query(query, version)
+        except Exception as e:
+            return {"error": f"Embedding generation failed: {str(e)}"}, 500
 
-        
-        # Extract relevant content from the top documents
-        context = "\n\n".join([f"{doc.document_name}: {doc.document_text}" for doc in relevant_documents])
-       
-        
-        user_chat_key = str(user_id)  # Using user ID as the key for chat sessions
-        print(chat_sessions)
-        if new_chat == 1 or user_chat_key not in chat_sessions:
-            chat_sessions[user_chat_key] = client.chats.create(model="gemini-1.5-flash")
+        history, cached, timings = QAService.start_turn(query_embedding, user_id, document_ids, new_chat, timings)
+        if cached:
+            return QAService.cached_answer(query, user_id, cached, timings), 200
 
-        chat = chat_sessions[user_chat_key]  # Retrieve chat instance
+        prepared = QAService.prepare_answer(
+            query, query_embedding, version, user_id, document_ids, history, timings, top_k, candidate_pool
+        )
+        if len(prepared) == 2:
+            return prepared
+        contents, message, context, retrieval, timings = prepared
 
-        # Construct a conversational message format
-        messages = [
-            {"role": "system", "content": "You are an AI assistant providing answers based on uploaded documents.'"},
-            {"role": "user", "content": query},
-            {"role": "assistant", "content": f"Relevant information:\n{context}"}  # Provide document context
-        ]
         try:
-            if(new_chat==1):
-                chat = client.chats.create(model='gemini-1.5-flash')
-            response = chat.send_message(message="\n".join([f"{msg['role'].capitalize()}: {msg['content']}" for msg in messages]))
-            return {"response": response.text}, 200
+            with metrics.stage("qa", "generation", timings):
+                chat = llm_client.chats.create(model="gemini-1.5-flash", history=contents)
+                response = chat.send_message(message=message)
         except Exception as e:
+            metrics.record_generation("error")
             return {"error": f"Answer generation failed: {str(e)}"}, 500
+        metrics.record_generation("success", getattr(response, "usage_metadata", None))
+        QAService.finish_turn(query, query_embedding, user_id, document_ids, history, response.text or "", context)
+        return {"response": response.text, **QAService.answer_metadata(context, retrieval, timings), "cached": False}, 200
+
+    @staticmethod
+    def finish_turn(query, query_embedding, user_id, document_ids, history, answer, context):
+        """Records a generated answer in the chat history and, for a conversation's first question, the answer cache."""
+        chat_store.append(user_id, query, answer, context.text, [p.chunk.chunk_id for p in context.passages])
+        if not history and answer:
+            sources = QAService.answer_metadata(context)["sources"]
+            answer_cache.store(user_id, document_ids, query, query_embedding, answer, sources)
+
+    @staticmethod
+    def stream_answer(query, user_id, document_ids=None, new_chat=0, top_k=None, candidate_pool=None):
+        """
+        Streaming variant of generate_answer. Retrieval runs before anything is sent, so its errors
+        are returned as an error tuple; otherwise returns a generator of Server-Sent Events: one
+        "token" event per text chunk from the model, then a "done" event with sources and timings.
+        An answer cache hit is sent as a single "token" event.
+        """
+        timings = {}
+        version = embedding_versions.serving()
+        try:
+            # Embedded once, like generate_answer
+            with metrics.stage("qa", "query_embed", timings):
+                query_embedding = embedding_service.embed_query(query, version)
+        except Exception as e:
+            return {"error": f"Embedding generation failed: {str(e)}"}, 500
+
+        history, cached, timings = QAService.start_turn(query_embedding, user_id, document_ids, new_chat, timings)
+        if cached:
+            answer = QAService.cached_answer(query, user_id, cached, timings)
+            return iter([
+                sse_event("token", {"text": answer.pop("response")}),
+                sse_event("done", answer),
+            ])
+
+        prepared = QAService.prepare_answer(
+            query, query_embedding, version, user_id, document_ids, history, timings, top_k, candidate_pool
+        )
+        if len(prepared) == 2:
+            return prepared
+        contents, message, context, retrieval, timings = prepared
+
+        def events():
+            started = time.perf_counter()
+            answer, usage = [], None
+            try:
+                chat = llm_client.chats.create(model="gemini-1.5-flash", history=contents)
+                for chunk in chat.send_message_stream(message=message):
+                    # Token counts come with the final chunk
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    if not chunk.text:
+                        continue
+                    if "first_token" not in timings:
+                        metrics.observe_stage("qa", "first_token", time.perf_counter() - started, timings)
+                    answer.append(chunk.text)
+                    yield sse_event("token", {"text": chunk.text})
+            except Exception as e:
+                metrics.record_generation("error")
+                yield sse_event("error", {"error": f"Answer generation failed: {str(e)}"})
+                return
+            metrics.observe_stage("qa", "generation", time.perf_counter() - started, timings)
+            metrics.record_generation("success", usage)
+            QAService.finish_turn(query, query_embedding, user_id, document_ids, history, "".join(answer), context)
+            yield sse_event("done", {**QAService.answer_metadata(context, retrieval, timings), "cached": False})
+
+        return events()
+
+
+def sse_event(event, data):
+    """Formats one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+ingestion_queue.register_handler(DocumentService.ingest)
+metrics.register_collector(
+    "embedding_cache_lookups_total", "Embedding cache lookups by result", "result",
+    lambda: {result: count for result, count in embedding_cache.get_stats().items() if result in ("memory_hits", "db_hits", "misses")},
+)
+metrics.register_collector(
+    "answer_cache_lookups_total", "Answer cache lookups by result", "result",
+    lambda: {result: count for result, count in answer_cache.get_stats().items() if result in ("hits", "misses")},
+)
+reindexer.register_embedder(embedding_service.embed_texts)
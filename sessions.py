@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import ChatSession
+
+MAX_MESSAGE_CHARS = 4000  # longer messages are truncated before they are stored
+PURGE_EVERY = 100  # appends between sweeps of expired chat_sessions rows
+
+
+def trim_history(history, max_turns):
+    """
+    Keeps the last max_turns question/answer pairs, each message's text cut to MAX_MESSAGE_CHARS.
+    The document context stored with a question is already bounded by the context token budget.
+    """
+    history = history[-2 * max_turns:] if max_turns > 0 else []
+    return [{**message, "text": message["text"][:MAX_MESSAGE_CHARS]} for message in history]
+
+
+class MemorySessionBackend:
+    """Conversations held in this worker, in an LRU bounded by count and idle time."""
+
+    def __init__(self, max_sessions=1000, ttl=86400):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # key -> (touched_at, history)
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        entry = self._sessions.get(key)
+        if entry is None:
+            return []
+        if time.monotonic() - entry[0] > self.ttl:
+            del self._sessions[key]
+            return []
+        self._sessions.move_to_end(key)
+        return entry[1]
+
+    def load(self, key):
+        with self._lock:
+            return list(self._get(key))
+
+    def append(self, key, messages, max_turns):
+        with self._lock:
+            history = trim_history(self._get(key) + messages, max_turns)
+            self._sessions[key] = (time.monotonic(), history)
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+
+class DatabaseSessionBackend:
+    """
+    Conversations in the chat_sessions table, so any worker can continue them and they survive
+    restarts. Appends lock the row, so concurrent requests from one user do not drop turns.
+    """
+
+    def __init__(self, ttl=86400):
+        self.ttl = ttl
+        self._appends = 0
+
+    def _expired_before(self):
+        return datetime.utcnow() - timedelta(seconds=self.ttl)
+
+    def load(self, key):
+        row = db.session.get(ChatSession, key, populate_existing=True)
+        if row is None or row.updated_at < self._expired_before():
+            return []
+        return list(row.history)
+
+    def append(self, key, messages, max_turns):
+        for attempt in range(2):
+            row = db.session.get(ChatSession, key, with_for_update=True, populate_existing=True)
+            if row is None:
+                row = ChatSession(user_id=key, history=[])
+                db.session.add(row)
+            history = [] if row.updated_at and row.updated_at < self._expired_before() else row.history
+            row.history = trim_history(history + messages, max_turns)
+            row.updated_at = datetime.utcnow()
+            try:
+                db.session.commit()
+                break
+            except IntegrityError:
+                # Another worker created the row first: append to theirs
+                db.session.rollback()
+                if attempt:
+                    raise
+
+        self._appends += 1
+        if self._appends % PURGE_EVERY == 0:
+            db.session.execute(delete(ChatSession).where(ChatSession.updated_at < self._expired_before()))
+            db.session.commit()
+
+    def delete(self, key):
+        db.session.execute(delete(ChatSession).where(ChatSession.user_id == key))
+        db.session.commit()
+
+
+class ChatSessionStore:
+    """
+    Chat history per user, replayed to the model on each question instead of keeping a live chat
+    object per user. The backend is chosen by CHAT_SESSION_BACKEND; either way only the last
+    CHAT_HISTORY_MAX_TURNS question/answer pairs are kept.
+    """
+
+    def __init__(self, app=None):
+        self.backend = MemorySessionBackend()
+        self.max_turns = 10
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if app.config["CHAT_SESSION_BACKEND"] == "memory":
+            self.backend = MemorySessionBackend(app.config["CHAT_SESSION_MAX"], app.config["CHAT_SESSION_TTL"])
+        else:
+            self.backend = DatabaseSessionBackend(app.config["CHAT_SESSION_TTL"])
+        self.max_turns = app.config["CHAT_HISTORY_MAX_TURNS"]
+        app.extensions["chat_sessions"] = self
+
+    def history(self, key):
+        """
+        Returns the stored messages, oldest first, as {"role", "text"} dicts. Questions also carry
+        the "context" sent with them and the ids of its "chunks".
+        """
+        return self.backend.load(key)
+
+    def seen_chunk_ids(self, key, history=None):
+        """Ids of the chunks whose text is still part of the replayed history."""
+        history = self.history(key) if history is None else history
+        return {chunk_id for message in history for chunk_id in message.get("chunks", ())}
+
+    def append(self, key, question, answer, context="", chunk_ids=()):
+        question = {"role": "user", "text": question, "context": context, "chunks": [str(i) for i in chunk_ids]}
+        self.backend.append(key, [question, {"role": "model", "text": answer}], self.max_turns)
+
+    def reset(self, key):
+        self.backend.delete(key)
+
+
+chat_store = ChatSessionStore()
@@ -7,7 +7,6 @@ import psycopg2
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
-print(DATABASE_URL)
 
 
 def enable_pgvector(conn):
@@ -17,52 +16,199 @@ def enable_pgvector(conn):
     cur.close()
     print("pgvector extension enabled.")
 
-try:
-    conn = psycopg2.connect(DATABASE_URL)
-    print("Connection to neontech PostgreSQL successful!")
-
-    # Create a cursor to execute queries
-    cursor = conn.cursor()
-    enable_pgvector(conn)
-
-    # Check if the tables exist or create them
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-            username VARCHAR(100) UNIQUE NOT NULL,
-            email VARCHAR(255) UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        
-        CREATE TABLE IF NOT EXISTS documents (
-            id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-            user_id UUID REFERENCES users(id) ON DELETE CASCADE,
-            document_name VARCHAR(255) NOT NULL,
-            document_path TEXT NOT NULL,
-            document_text TEXT,
-            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-
-        CREATE TABLE IF NOT EXISTS embeddings (
-            id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-            document_id UUID REFERENCES documents(id) ON DELETE CASCADE,
-            embedding_vector VECTOR(768),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    """)
-
-    # Commit the changes
-    conn.commit()
-
-    # Close cursor and connection
-    cursor.close()
-    conn.close()
 
-    print("Tables checked/created successfully!")
-
-except Exception as error:
-    print("Error connecting to the database:", error)
+# Approximate nearest-neighbour index per PGVECTOR_QUANTIZATION; the expressions must match
+# vector_store._quantized_distance for queries to use them
+VECTOR_INDEXES = {
+    "none": """
+        CREATE INDEX IF NOT EXISTS ix_embeddings_vector_hnsw
+            ON embeddings USING hnsw (embedding_vector vector_cosine_ops)
+            WITH (m = 16, ef_construction = 64)""",
+    "halfvec": """
+        CREATE INDEX IF NOT EXISTS ix_embeddings_vector_halfvec_hnsw
+            ON embeddings USING hnsw ((embedding_vector::halfvec(768)) halfvec_cosine_ops)
+            WITH (m = 16, ef_construction = 64)""",
+    "binary": """
+        CREATE INDEX IF NOT EXISTS ix_embeddings_vector_binary_hnsw
+            ON embeddings USING hnsw ((binary_quantize(embedding_vector)::bit(768)) bit_hamming_ops)
+            WITH (m = 16, ef_construction = 64)""",
+}
+VECTOR_INDEX_NAMES = {
+    "none": "ix_embeddings_vector_hnsw",
+    "halfvec": "ix_embeddings_vector_halfvec_hnsw",
+    "binary": "ix_embeddings_vector_binary_hnsw",
+}
+
+
+def create_vector_index(cursor, quantization):
+    """Creates the HNSW index for quantization and drops the other variants, which would only take space."""
+    if quantization not in VECTOR_INDEXES:
+        print(f"Unknown PGVECTOR_QUANTIZATION {quantization!r}; expected none, halfvec or binary.")
+        return
+    if quantization != "none":
+        cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        version = tuple(int(part) for part in cursor.fetchone()[0].split(".")[:2])
+        if version < (0, 7):
+            print(f"PGVECTOR_QUANTIZATION={quantization} needs pgvector 0.7 or later; vector index left unchanged.")
+            return
+    cursor.execute(VECTOR_INDEXES[quantization])
+    for other, name in VECTOR_INDEX_NAMES.items():
+        if other != quantization:
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def main():
+    print(DATABASE_URL)
+    try:
+        conn = psycopg2.connect(DATABASE_URL)
+        print("Connection to neontech PostgreSQL successful!")
+
+        # Create a cursor to execute queries
+        cursor = conn.cursor()
+        enable_pgvector(conn)
+
+        # Check if the tables exist or create them
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                username VARCHAR(100) UNIQUE NOT NULL,
+                email VARCHAR(255) UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        
+            CREATE TABLE IF NOT EXISTS documents (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+                document_name VARCHAR(255) NOT NULL,
+                document_path TEXT NOT NULL,
+                document_text TEXT,
+                uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE TABLE IF NOT EXISTS document_chunks (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                document_id UUID NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+                chunk_index INTEGER NOT NULL,
+                page_number INTEGER,
+                start_offset INTEGER NOT NULL,
+                end_offset INTEGER NOT NULL,
+                chunk_text TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE TABLE IF NOT EXISTS embeddings (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                document_id UUID REFERENCES documents(id) ON DELETE CASCADE,
+                embedding_vector VECTOR(768),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                content_hash VARCHAR(64) PRIMARY KEY,
+                model_name VARCHAR(100) NOT NULL,
+                embedding_vector VECTOR(768) NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                document_id UUID REFERENCES documents(id) ON DELETE SET NULL,
+                document_name VARCHAR(255) NOT NULL,
+                file_path TEXT NOT NULL,
+                status VARCHAR(20) NOT NULL DEFAULT 'queued',
+                error TEXT,
+                timings JSON,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                updated_at TIMESTAMP,
+                finished_at TIMESTAMP
+            );
+
+            -- BM25 postings: one row per (term, chunk)
+            CREATE TABLE IF NOT EXISTS chunk_terms (
+                term VARCHAR(100) NOT NULL,
+                chunk_id UUID NOT NULL REFERENCES document_chunks(id) ON DELETE CASCADE,
+                document_id UUID NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+                frequency INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            );
+
+            CREATE TABLE IF NOT EXISTS answer_cache (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                scope_key VARCHAR(64) NOT NULL,
+                document_ids JSON,
+                query_text TEXT NOT NULL,
+                query_vector VECTOR(768) NOT NULL,
+                response TEXT NOT NULL,
+                sources JSON NOT NULL,
+                created_at TIMESTAMP NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS chat_sessions (
+                user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+                history JSON NOT NULL,
+                updated_at TIMESTAMP NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS embedding_versions (
+                model_name VARCHAR(100) NOT NULL,
+                pipeline_version VARCHAR(32) NOT NULL,
+                state VARCHAR(16) NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                switched_at TIMESTAMP,
+                PRIMARY KEY (model_name, pipeline_version)
+            );
+
+            CREATE INDEX IF NOT EXISTS ix_ingestion_jobs_user_id ON ingestion_jobs (user_id);
+            CREATE INDEX IF NOT EXISTS ix_ingestion_jobs_status ON ingestion_jobs (status);
+            CREATE INDEX IF NOT EXISTS ix_chat_sessions_updated_at ON chat_sessions (updated_at);
+            CREATE INDEX IF NOT EXISTS ix_answer_cache_user_scope ON answer_cache (user_id, scope_key);
+
+            ALTER TABLE documents ADD COLUMN IF NOT EXISTS page_count INTEGER;
+            ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS term_count INTEGER;
+            ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+
+            -- Embedding versions: rows stored before versioning came from text-embedding-004
+            ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS model_name VARCHAR(100);
+            ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS pipeline_version VARCHAR(32);
+            UPDATE embeddings SET model_name = 'text-embedding-004', pipeline_version = '1' WHERE model_name IS NULL;
+            INSERT INTO embedding_versions (model_name, pipeline_version, state, switched_at)
+                SELECT 'text-embedding-004', '1', 'serving', CURRENT_TIMESTAMP
+                WHERE NOT EXISTS (SELECT 1 FROM embedding_versions);
+
+            -- Chunk-level embeddings (rows created before chunking have no chunk; the re-indexer chunks and
+            -- embeds those documents from document_text when the app starts)
+            ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS chunk_id UUID REFERENCES document_chunks(id) ON DELETE CASCADE;
+
+            CREATE INDEX IF NOT EXISTS ix_document_chunks_document_id ON document_chunks (document_id);
+            CREATE INDEX IF NOT EXISTS ix_embeddings_chunk_id ON embeddings (chunk_id);
+            CREATE INDEX IF NOT EXISTS ix_chunk_terms_chunk_id ON chunk_terms (chunk_id);
+            CREATE INDEX IF NOT EXISTS ix_document_chunks_content_hash ON document_chunks (content_hash);
+            CREATE INDEX IF NOT EXISTS ix_embeddings_version ON embeddings (model_name, pipeline_version);
+            CREATE INDEX IF NOT EXISTS ix_embeddings_document_id ON embeddings (document_id);
+            CREATE INDEX IF NOT EXISTS ix_documents_user_id ON documents (user_id);
+            CREATE INDEX IF NOT EXISTS ix_documents_user_uploaded ON documents (user_id, uploaded_at, id);
+        """)
+        create_vector_index(cursor, os.getenv("PGVECTOR_QUANTIZATION", "none"))
+
+        # Commit the changes
+        conn.commit()
+
+        # Close cursor and connection
+        cursor.close()
+        conn.close()
+
+        print("Tables checked/created successfully!")
+
+    except Exception as error:
+        print("Error connecting to the database:", error)
+
+
+if __name__ == "__main__":
+    main()
 
 
 
@@ -0,0 +1,88 @@
+import unittest
+import uuid
+from types import SimpleNamespace
+import numpy as np
+from flask import Flask
+from answer_cache import AnswerCache, scope_key
+from extensions import db
+from models import User
+
+
+def vector(*head):
+    values = np.zeros(768, dtype=np.float32)
+    values[:len(head)] = head
+    return values.tolist()
+
+
+class TestAnswerCache(unittest.TestCase):
+    def setUp(self):
+        """Create a cache over an in-memory database with one user"""
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.init_app(app)
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all()
+
+        self.user_id = uuid.uuid4()
+        db.session.add(User(id=self.user_id, username="u", email="u@example.com", password_hash="x"))
+        db.session.commit()
+        self.cache = AnswerCache(SimpleNamespace(extensions={}, config={
+            "ANSWER_CACHE_ENABLED": True,
+            "ANSWER_CACHE_THRESHOLD": 0.95,
+            "ANSWER_CACHE_TTL": 3600,
+            "ANSWER_CACHE_MAX_ENTRIES": 2,
+        }))
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def test_similar_questions_hit(self):
+        """Test a hit needs similarity above the threshold within the same scope"""
+        self.cache.store(self.user_id, None, "q", vector(1.0, 0.0), "answer", [])
+
+        entry, similarity = self.cache.lookup(self.user_id, None, vector(1.0, 0.1))
+        self.assertEqual(entry.response, "answer")
+        self.assertGreater(similarity, 0.99)
+        self.assertIsNone(self.cache.lookup(self.user_id, None, vector(1.0, 1.0)))
+        self.assertIsNone(self.cache.lookup(self.user_id, ["some-document"], vector(1.0, 0.0)))
+
+    def test_follow_ups_are_counted_apart(self):
+        """Test follow-up questions show in the stats without counting as lookups"""
+        self.cache.skip_follow_up()
+        self.assertIsNone(self.cache.lookup(self.user_id, None, vector(1.0, 0.0)))
+
+        stats = self.cache.get_stats()
+        self.assertEqual(stats["follow_ups"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hit_rate"], 0.0)
+
+    def test_scope_ignores_selection_order(self):
+        """Test the same document selection in any order shares a scope"""
+        self.assertEqual(scope_key(["b", "a"]), scope_key(["a", "b", "a"]))
+        self.assertNotEqual(scope_key(["a"]), scope_key(None))
+
+    def test_invalidation_follows_the_scope(self):
+        """Test uploads or deletes drop all-document answers and selections naming the document"""
+        kept, dropped = str(uuid.uuid4()), str(uuid.uuid4())
+        self.cache.store(self.user_id, None, "q", vector(1.0), "all", [])
+        self.cache.store(self.user_id, [kept], "q", vector(1.0), "kept", [])
+        self.cache.store(self.user_id, [kept, dropped], "q", vector(1.0), "dropped", [])
+
+        self.cache.invalidate(self.user_id, dropped)
+        self.assertIsNone(self.cache.lookup(self.user_id, None, vector(1.0)))
+        self.assertIsNone(self.cache.lookup(self.user_id, [kept, dropped], vector(1.0)))
+        self.assertEqual(self.cache.lookup(self.user_id, [kept], vector(1.0))[0].response, "kept")
+
+    def test_entries_per_scope_are_capped(self):
+        """Test only the newest entries of a scope are kept"""
+        for i in range(3):
+            self.cache.store(self.user_id, None, f"q{i}", vector(1.0, float(i)), f"answer {i}", [])
+        self.assertIsNone(self.cache.lookup(self.user_id, None, vector(1.0, 0.0)))
+        self.assertEqual(self.cache.lookup(self.user_id, None, vector(1.0, 2.0))[0].response, "answer 2")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+from benchmarks.corpus import Corpus
+from benchmarks.run import compare
+
+
+class TestCorpus(unittest.TestCase):
+    def test_documents_and_questions(self):
+        """Test documents are reproducible and each question's answer is in its document"""
+        corpus = Corpus(50, paragraphs=4, seed=1)
+        self.assertEqual(corpus.document(7), Corpus(50, paragraphs=4, seed=1).document(7))
+        self.assertNotEqual(corpus.document(7)[1], Corpus(50, paragraphs=4, seed=2).document(7)[1])
+
+        questions = corpus.questions(10)
+        self.assertEqual(len(questions), 10)
+        for question, index in questions:
+            name, text = corpus.document(index)
+            self.assertIn(f"project {corpus.project(index)} is", text)
+            self.assertIn(corpus.project(index), question)
+            self.assertEqual(name, f"{corpus.project(index)}.txt")
+
+
+class TestCompare(unittest.TestCase):
+    def test_regressions(self):
+        """Test slower latencies, lower throughput and fewer hits beyond the tolerance are reported"""
+        baseline = {
+            "config": {"documents": 100},
+            "upload": {"documents_per_second": 100.0},
+            "retrieval": {"p50_ms": 10.0, "p95_ms": 20.0, "hit_rate": 1.0},
+        }
+        self.assertEqual(compare(baseline, baseline, 0.2), [])
+        results = {
+            "config": {"documents": 200},
+            "upload": {"documents_per_second": 80.0},
+            "retrieval": {"p50_ms": 11.0, "p95_ms": 30.0, "hit_rate": 0.9},
+        }
+        self.assertEqual(compare(results, baseline, 0.2), [
+            "upload.documents_per_second: 100.0 -> 80.0",
+            "retrieval.p95_ms: 20.0 -> 30.0",
+            "retrieval.hit_rate: 1.0 -> 0.9",
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from chunking import chunk_pages
+
+
+class TestChunking(unittest.TestCase):
+    def test_offsets_point_into_joined_pages(self):
+        """Test chunk offsets slice the chunk text out of the joined document text"""
+        pages = [
+            (1, "First sentence here. Second sentence follows! Third one?"),
+            (2, "Another page with its own text. It ends here."),
+        ]
+        document_text = "\n".join(text for _, text in pages)
+        chunks = list(chunk_pages(pages, chunk_size=40, chunk_overlap=10))
+
+        self.assertGreater(len(chunks), 2)
+        for chunk in chunks:
+            self.assertEqual(document_text[chunk.start_offset:chunk.end_offset], chunk.text)
+            self.assertLessEqual(len(chunk.text), 40)
+        self.assertEqual([chunk.chunk_index for chunk in chunks], list(range(len(chunks))))
+
+    def test_chunks_do_not_cross_pages(self):
+        """Test every chunk comes from a single page"""
+        pages = [(1, "Page one text."), (2, "Page two text.")]
+        chunks = list(chunk_pages(pages, chunk_size=1000, chunk_overlap=0))
+
+        self.assertEqual([(c.page_number, c.text) for c in chunks], [(1, "Page one text."), (2, "Page two text.")])
+
+    def test_overlap_repeats_trailing_sentences(self):
+        """Test neighbouring chunks share the sentences that fit in the overlap"""
+        text = "Aaaa aaaa. Bbbb bbbb. Cccc cccc. Dddd dddd."
+        chunks = list(chunk_pages([(1, text)], chunk_size=32, chunk_overlap=12))
+
+        self.assertEqual(chunks[0].text, "Aaaa aaaa. Bbbb bbbb. Cccc cccc.")
+        self.assertEqual(chunks[1].text, "Cccc cccc. Dddd dddd.")
+
+    def test_long_sentences_are_split(self):
+        """Test a sentence longer than the chunk size is split at whitespace"""
+        text = " ".join(["word"] * 100)
+        chunks = list(chunk_pages([(1, text)], chunk_size=50, chunk_overlap=0))
+
+        self.assertTrue(all(len(chunk.text) <= 50 for chunk in chunks))
+        self.assertEqual(" ".join(chunk.text for chunk in chunks).split(), text.split())
+
+    def test_empty_pages_produce_no_chunks(self):
+        """Test pages without text are skipped"""
+        self.assertEqual(list(chunk_pages([(1, ""), (2, None), (3, "  \n ")])), [])
+
+    def test_invalid_overlap(self):
+        """Test overlap must be smaller than the chunk size"""
+        with self.assertRaises(ValueError):
+            list(chunk_pages([(1, "text")], chunk_size=10, chunk_overlap=10))
+
+
+if __name__ == '__main__':
+    unittest.main()
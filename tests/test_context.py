@@ -0,0 +1,70 @@
+import unittest
+import uuid
+from context import build_context, estimate_tokens
+from vector_store import RetrievedChunk
+
+DOCUMENT_TEXT = " ".join(f"Sentence number {i} of the document." for i in range(100))
+
+
+def make_chunk(start, end, score, document_id="doc", text=None):
+    return RetrievedChunk(
+        chunk_id=uuid.uuid4(),
+        document_id=document_id,
+        document_name="report.pdf",
+        page_number=1,
+        chunk_text=DOCUMENT_TEXT[start:end] if text is None else text,
+        start_offset=start,
+        end_offset=end,
+        score=score,
+    )
+
+
+class TestBuildContext(unittest.TestCase):
+    def test_passages_are_packed_best_first(self):
+        """Test passages are ordered by score and the tokens used are counted"""
+        low, high = make_chunk(0, 300, 0.2), make_chunk(1000, 1300, 0.9)
+        packed = build_context([low, high], token_budget=1000)
+
+        self.assertEqual([passage.chunk for passage in packed.passages], [high, low])
+        self.assertEqual(packed.tokens_used, sum(estimate_tokens(p.text) for p in packed.passages))
+        self.assertEqual(packed.tokens_trimmed, 0)
+
+    def test_overlap_is_sent_once(self):
+        """Test text shared with a higher-scoring chunk is dropped and contained chunks are skipped"""
+        first, neighbour, inside = make_chunk(0, 400, 0.9), make_chunk(300, 700, 0.8), make_chunk(100, 200, 0.7)
+        packed = build_context([first, neighbour, inside], token_budget=1000)
+
+        self.assertEqual(len(packed.passages), 2)
+        self.assertIn(DOCUMENT_TEXT[400:700].strip(), packed.passages[1].text)
+        self.assertNotIn(DOCUMENT_TEXT[300:400].strip(), packed.passages[1].text)
+        self.assertEqual(packed.duplicates, 1)
+
+    def test_identical_text_in_another_document_is_skipped(self):
+        """Test exact duplicates across documents are sent once"""
+        packed = build_context([make_chunk(0, 300, 0.9), make_chunk(0, 300, 0.8, document_id="copy")], 1000)
+        self.assertEqual(len(packed.passages), 1)
+        self.assertEqual(packed.duplicates, 1)
+
+    def test_budget_is_respected(self):
+        """Test passages beyond the budget are cut or left out and reported as trimmed"""
+        chunks = [make_chunk(i * 1000, i * 1000 + 800, 1.0 - i / 10) for i in range(3)]
+        packed = build_context(chunks, token_budget=300)
+
+        self.assertLessEqual(packed.tokens_used, 300)
+        self.assertEqual(len(packed.passages), 2)
+        self.assertTrue(packed.passages[1].text.endswith("..."))
+        total = sum(estimate_tokens(f"report.pdf (page 1): {c.chunk_text.strip()}") for c in chunks)
+        self.assertEqual(packed.tokens_used + packed.tokens_trimmed, total)
+
+    def test_seen_chunks_are_not_resent(self):
+        """Test chunks already given to the chat are skipped but still listed as sources"""
+        seen, fresh = make_chunk(0, 300, 0.9), make_chunk(1000, 1300, 0.5)
+        packed = build_context([seen, fresh], 1000, seen_chunk_ids=[str(seen.chunk_id)])
+
+        self.assertEqual([passage.chunk for passage in packed.passages], [fresh])
+        self.assertEqual(packed.chunks, [seen, fresh])
+        self.assertEqual(packed.report()["already_seen"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
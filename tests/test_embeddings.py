@@ -0,0 +1,140 @@
+import threading
+import unittest
+from types import SimpleNamespace
+import numpy as np
+from embeddings import EmbeddingBatcher, EmbeddingCache, EmbeddingService, EmbeddingVersion, content_hash
+
+
+class RateLimitError(Exception):
+    code = 429
+
+
+class FakeEmbeddingModels:
+    """Stands in for client.models, embedding each text as [len(text), 1.0]."""
+
+    def __init__(self, failures=()):
+        self.calls = []
+        self.models = []
+        self.failures = list(failures)
+        self._lock = threading.Lock()
+
+    def embed_content(self, model, contents):
+        with self._lock:
+            if self.failures:
+                raise self.failures.pop(0)
+            self.calls.append(list(contents))
+            self.models.append(model)
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=[float(len(text)), 1.0]) for text in contents])
+
+
+class TestEmbeddingService(unittest.TestCase):
+    def setUp(self):
+        """Create a service with an in-memory only cache"""
+        self.models = FakeEmbeddingModels()
+        self.cache = EmbeddingCache()
+        self.cache.persist = False
+        self.service = EmbeddingService(EmbeddingBatcher(SimpleNamespace(models=self.models)), self.cache)
+
+    def test_cache_key_normalizes_whitespace(self):
+        """Test equivalent texts share a cache key and models do not"""
+        self.assertEqual(content_hash("m", "a  b\n"), content_hash("m", " a b"))
+        self.assertNotEqual(content_hash("m", "a b"), content_hash("other", "a b"))
+
+    def test_repeated_texts_are_embedded_once(self):
+        """Test duplicates within and across calls cost a single provider call"""
+        vectors = self.service.embed_texts(["alpha", "beta", "alpha"])
+        self.assertEqual(vectors[0], vectors[2])
+        self.assertEqual(self.models.calls, [["alpha", "beta"]])
+
+        self.assertEqual(self.service.embed_query("beta"), vectors[1])
+        self.assertEqual(len(self.models.calls), 1)
+
+        stats = self.cache.get_stats()
+        self.assertEqual(stats["memory_hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+
+    def test_memory_tier_holds_float32_arrays(self):
+        """Test cached vectors are kept as compact float32 arrays and returned as lists"""
+        vector = self.service.embed_query("delta")
+        _, stored = next(iter(self.cache._entries.values()))
+        self.assertEqual(stored.dtype, np.float32)
+        self.assertEqual(stored.nbytes, 8)
+        self.assertEqual(self.service.embed_query("delta"), vector)
+        self.assertIsInstance(self.service.embed_query("delta"), list)
+
+    def test_versions_have_separate_cache_entries(self):
+        """Test a text embedded for one version is embedded again for another"""
+        self.service.embed_query("alpha")
+        self.service.embed_query("alpha", EmbeddingVersion(self.service.version.model, "2"))
+        self.service.embed_query("alpha", EmbeddingVersion("other-model", "1"))
+        self.assertEqual(len(self.models.calls), 3)
+        self.assertEqual(self.models.models[2], "other-model")
+
+    def test_ttl_expiry(self):
+        """Test entries older than the TTL are embedded again"""
+        self.cache.ttl = 0
+        self.service.embed_query("alpha")
+        self.service.embed_query("alpha")
+        self.assertEqual(len(self.models.calls), 2)
+
+    def test_lru_eviction(self):
+        """Test the least recently used entry is evicted first"""
+        self.cache.max_entries = 2
+        self.service.embed_texts(["a", "b"])
+        self.service.embed_query("a")
+        self.service.embed_query("c")
+        self.service.embed_query("a")
+        self.service.embed_query("b")
+        self.assertEqual(self.models.calls, [["a", "b"], ["c"], ["b"]])
+
+
+class TestEmbeddingBatcher(unittest.TestCase):
+    def _batcher(self, models, **kwargs):
+        return EmbeddingBatcher(SimpleNamespace(models=models), backoff=0.001, **kwargs)
+
+    def test_concurrent_requests_share_a_batch(self):
+        """Test texts submitted within the batch window are sent together"""
+        models = FakeEmbeddingModels()
+        batcher = self._batcher(models, max_wait=0.2)
+        futures = batcher.submit(["a"]) + batcher.submit(["bb", "ccc"])
+
+        self.assertEqual([future.result(timeout=5) for future in futures], [[1.0, 1.0], [2.0, 1.0], [3.0, 1.0]])
+        self.assertEqual(models.calls, [["a", "bb", "ccc"]])
+
+    def test_models_are_not_mixed_in_a_batch(self):
+        """Test texts for different models in the same window are sent in separate calls"""
+        models = FakeEmbeddingModels()
+        batcher = self._batcher(models, max_wait=0.2)
+        futures = batcher.submit(["a", "b"]) + batcher.submit(["c"], model="other-model")
+
+        self.assertEqual(len([future.result(timeout=5) for future in futures]), 3)
+        self.assertEqual(sorted(zip(models.models, models.calls)), [("other-model", ["c"]), ("text-embedding-004", ["a", "b"])])
+
+    def test_batches_are_capped(self):
+        """Test a batch is flushed as soon as it reaches the size cap"""
+        models = FakeEmbeddingModels()
+        batcher = self._batcher(models, max_batch_size=2, max_wait=0.2)
+        batcher.embed(["a", "b", "c", "d", "e"], timeout=5)
+
+        self.assertEqual(sorted(len(call) for call in models.calls), [1, 2, 2])
+
+    def test_rate_limits_are_retried(self):
+        """Test rate-limited batches are retried with backoff"""
+        models = FakeEmbeddingModels(failures=[RateLimitError("429"), RateLimitError("429")])
+        batcher = self._batcher(models)
+
+        self.assertEqual(batcher.embed(["a"], timeout=5), [[1.0, 1.0]])
+        self.assertEqual(batcher.stats["retries"], 2)
+
+    def test_other_errors_fail_the_batch(self):
+        """Test non-retryable errors are raised to every caller in the batch"""
+        models = FakeEmbeddingModels(failures=[ValueError("bad request")])
+        batcher = self._batcher(models)
+
+        with self.assertRaises(ValueError):
+            batcher.embed(["a"], timeout=5)
+        self.assertEqual(batcher.stats["retries"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+import io
+import os
+import signal
+import tarfile
+import tempfile
+import time
+import unittest
+import zipfile
+from unittest import mock
+from benchmarks.parsers import write_docx
+import extraction
+from extraction import (
+    CSV, DOCX, HTML, MARKDOWN, PDF, TEXT, archive_members, iter_pages, iter_pdf_pages, iter_text_pages,
+    needs_layout, rename_by_type, save_stream, sniff_mime,
+)
+
+SAMPLE_PDF = os.path.join(os.path.dirname(__file__), "sample.pdf")
+
+
+def hang_in_native_code(path, page_index, timeout, mode="auto"):
+    # Stands in for a PDFium call that never returns: the page timer's signal is never handled
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+    time.sleep(60)
+
+
+class TestExtraction(unittest.TestCase):
+    def test_text_blocks_rejoin_to_the_file(self):
+        """Test streamed text blocks joined with newlines reproduce the file"""
+        content = "".join(f"line {i} of the file\n" for i in range(500)) + "last line"
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="utf-8") as f:
+            f.write(content)
+        try:
+            blocks = list(iter_text_pages(f.name, block_size=1000))
+        finally:
+            os.remove(f.name)
+
+        self.assertGreater(len(blocks), 1)
+        self.assertEqual("\n".join(text for _, text in blocks), content)
+        self.assertTrue(all(len(text) < 1100 for _, text in blocks))
+
+    def test_pdf_pages_in_process(self):
+        """Test pages are yielded with their page numbers"""
+        pages = list(iter_pdf_pages(SAMPLE_PDF))
+        self.assertEqual([page_number for page_number, _ in pages], [1])
+        self.assertTrue(pages[0][1].strip())
+
+    def test_pdf_pages_in_process_pool(self):
+        """Test the process pool extracts the same text as in-process extraction"""
+        pooled = list(iter_pdf_pages(SAMPLE_PDF, workers=1, page_timeout=30, memory_limit_mb=2048))
+        self.assertEqual(pooled, list(iter_pdf_pages(SAMPLE_PDF)))
+
+    def test_concurrent_documents_get_their_own_pools(self):
+        """Test documents extracted at the same time use separate pools, which later documents reuse"""
+        documents = [iter_pdf_pages(SAMPLE_PDF, workers=1, page_timeout=30, memory_limit_mb=1536) for _ in range(2)]
+        for document in documents:
+            next(document)
+        pools = [document.gi_frame.f_locals["pool"] for document in documents]
+        self.assertIsNot(pools[0], pools[1])
+        for document in documents:
+            self.assertEqual(list(document), [])
+        idle = [pool for pool, key in extraction._idle_pools if key == (1, 1536)]
+        self.assertEqual(len(idle), 2)
+
+        # A document abandoned midway does not hand its pool back
+        abandoned = iter_pdf_pages(SAMPLE_PDF, workers=1, page_timeout=30, memory_limit_mb=1536)
+        next(abandoned)
+        self.assertIn(abandoned.gi_frame.f_locals["pool"], idle)
+        abandoned.close()
+        self.assertEqual(len([key for _, key in extraction._idle_pools if key == (1, 1536)]), 1)
+        extraction._idle_pools[:] = [(pool, key) for pool, key in extraction._idle_pools if key != (1, 1536)]
+        for pool in idle:
+            pool.shutdown()
+
+    def test_page_hung_in_native_code_is_skipped(self):
+        """Test a page the worker's timer cannot interrupt is given up on and its pool replaced"""
+        started = time.perf_counter()
+        with mock.patch.object(extraction, "_extract_page", hang_in_native_code), self.assertLogs("extraction", "WARNING") as logs:
+            pages = list(iter_pdf_pages(SAMPLE_PDF, workers=1, page_timeout=0.5, memory_limit_mb=1280))
+        self.assertEqual(pages, [(1, "")])
+        self.assertIn("Skipping page 1", logs.output[0])
+        self.assertLess(time.perf_counter() - started, 10)
+        self.assertTrue(list(iter_pdf_pages(SAMPLE_PDF, workers=1, page_timeout=30, memory_limit_mb=1280))[0][1])
+
+    def test_pdf_text_layer_matches_layout_extraction(self):
+        """Test the fast text layer yields the same words as layout analysis"""
+        fast = list(iter_pdf_pages(SAMPLE_PDF, mode="auto"))
+        layout = list(iter_pdf_pages(SAMPLE_PDF, mode="layout"))
+        self.assertEqual(fast[0][1].split(), layout[0][1].split())
+        self.assertNotIn("\r", fast[0][1])
+
+    def test_needs_layout(self):
+        """Test empty or garbled text layers fall back to layout analysis"""
+        self.assertTrue(needs_layout("  \n "))
+        self.assertTrue(needs_layout("ab\ufffd\ufffd\ufffd cd"))
+        self.assertTrue(needs_layout("text \ue000\ue001\ue002"))
+        self.assertFalse(needs_layout("An ordinary page of text.\n\tIndented line."))
+
+
+class TestFormats(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def _write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "wb" if isinstance(content, bytes) else "w", encoding=None if isinstance(content, bytes) else "utf-8") as f:
+            f.write(content)
+        return path
+
+    def test_sniff_mime(self):
+        """Test types are detected from the content, with the extension only separating text formats"""
+        docx = os.path.join(self.directory, "report.bin")
+        write_docx(docx, [(None, "Body")])
+        self.assertEqual(sniff_mime(docx), DOCX)
+        self.assertEqual(sniff_mime(self._write("scan.txt", b"%PDF-1.7\n...")), PDF)
+        self.assertEqual(sniff_mime(self._write("page.txt", "<!DOCTYPE html><p>Hi</p>")), HTML)
+        self.assertEqual(sniff_mime(self._write("notes", "# Title\n\nSome text\n")), MARKDOWN)
+        self.assertEqual(sniff_mime(self._write("notes.txt", "# Title\n\nSome text\n")), TEXT)
+        self.assertEqual(sniff_mime(self._write("table", "a,b,c\n1,2,3\n4,5,6\n7,8,9\n")), CSV)
+        self.assertEqual(sniff_mime(self._write("plain", "Just a sentence, nothing more.\n")), TEXT)
+        self.assertEqual(sniff_mime(self._write("image.txt", b"\x89PNG\r\n\x1a\n\x00\x00")), "application/octet-stream")
+
+    def test_rename_by_type(self):
+        """Test uploads get their type's extension and unsupported ones are deleted"""
+        path = rename_by_type(self._write("upload", "# Title\n\nText\n"), "readme.md")
+        self.assertTrue(path.endswith(".md"))
+        self.assertEqual(list(iter_pages(path)), [(1, "# Title\n\nText")])
+
+        binary = self._write("other", b"\x00\x01\x02")
+        self.assertIsNone(rename_by_type(binary, "image.png"))
+        self.assertFalse(os.path.exists(binary))
+
+    def test_markdown_sections(self):
+        """Test headings start sections, except inside fenced code"""
+        path = self._write("doc.md", "Intro\n# One\nText\n```\n# not a heading\n```\n## Two\nMore\n")
+        self.assertEqual(list(iter_pages(path)), [
+            (1, "Intro"), (2, "# One\nText\n```\n# not a heading\n```"), (3, "## Two\nMore"),
+        ])
+
+    def test_html_sections(self):
+        """Test visible text is kept line by line, scripts and styles dropped, and headings start sections"""
+        path = self._write("page.html", (
+            "<html><head><title>Page</title><style>p {color: red}</style><script>var x = 1;</script></head>"
+            "<body><h1>First</h1><p>Some   <b>bold</b>\ntext</p><ul><li>one</li><li>two</li></ul>"
+            "<h2>Second</h2><pre>a  b\n  c</pre></body></html>"
+        ))
+        self.assertEqual(list(iter_pages(path)), [
+            (1, "Page"), (2, "First\nSome bold text\none\ntwo"), (3, "Second\na  b\n  c"),
+        ])
+
+    def test_docx_sections(self):
+        """Test paragraphs are read in order and heading styles start sections"""
+        path = os.path.join(self.directory, "doc.docx")
+        write_docx(path, [("Title", "Report"), (None, "Intro <text> & more"), ("Heading1", "Results"), (None, "Fine")])
+        self.assertEqual(list(iter_pages(path)), [(1, "Report\nIntro <text> & more"), (2, "Results\nFine")])
+
+    def test_csv_rows(self):
+        """Test rows are labelled with their column names, with the delimiter detected"""
+        path = self._write("table.csv", "name;city;note\nAda;London;\nAlan;\"Wilmslow; UK\";math\n")
+        self.assertEqual(list(iter_pages(path)), [
+            (1, "name: Ada; city: London\nname: Alan; city: Wilmslow; UK; note: math"),
+        ])
+
+    def test_unsupported_type(self):
+        """Test files no parser handles are rejected"""
+        with self.assertRaises(ValueError):
+            iter_pages(self._write("blob.bin", b"\x00" * 64))
+
+
+class TestArchives(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def _read_members(self, path):
+        return {name: member.read() for name, member in archive_members(path)}
+
+    def test_zip_members(self):
+        """Test regular zip members are yielded and macOS metadata is skipped"""
+        path = os.path.join(self.directory, "bundle.zip")
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("docs/a.txt", "alpha")
+            archive.writestr("docs/", "")
+            archive.writestr("__MACOSX/docs/._a.txt", "metadata")
+        self.assertEqual(self._read_members(path), {"docs/a.txt": b"alpha"})
+
+    def test_compressed_tar_members(self):
+        """Test gzipped tar members are streamed in order"""
+        path = os.path.join(self.directory, "bundle.tar.gz")
+        with tarfile.open(path, "w:gz") as archive:
+            for name, data in [("a.txt", b"alpha"), ("b.pdf", b"%PDF")]:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        self.assertEqual(self._read_members(path), {"a.txt": b"alpha", "b.pdf": b"%PDF"})
+
+    def test_save_stream_enforces_the_size_limit(self):
+        """Test oversized streams are rejected and leave no partial file"""
+        path = os.path.join(self.directory, "big.txt")
+        with self.assertRaises(ValueError):
+            save_stream(io.BytesIO(b"x" * 2048), path, max_bytes=1024)
+        self.assertFalse(os.path.exists(path))
+
+        save_stream(io.BytesIO(b"x" * 1024), path, max_bytes=1024)
+        self.assertEqual(os.path.getsize(path), 1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+import numpy as np
+from fake_provider import FakeClient, hashed_embedding
+
+
+class TestFakeClient(unittest.TestCase):
+    def test_embeddings_are_deterministic_unit_vectors(self):
+        """Test the same text always gets the same vector, and shared words mean similar vectors"""
+        client = FakeClient()
+        result = client.models.embed_content(model="m", contents=["invoice payment overdue", "invoice payment overdue"])
+        first, second = (np.array(embedding.values) for embedding in result.embeddings)
+        self.assertEqual(len(first), 768)
+        self.assertTrue(np.array_equal(first, second))
+        self.assertAlmostEqual(float(np.linalg.norm(first)), 1.0, places=5)
+
+        related = np.array(hashed_embedding("overdue invoice payment reminder"))
+        unrelated = np.array(hashed_embedding("warehouse shipment schedule"))
+        self.assertGreater(first @ related, first @ unrelated)
+        self.assertEqual(client.stats["embed_calls"], 1)
+        self.assertEqual(client.stats["embedded_texts"], 2)
+
+    def test_chats_answer_from_the_context(self):
+        """Test streamed and whole answers quote the context and report token usage"""
+        client = FakeClient(answer_words=3)
+        message = "User: question\nAssistant: Relevant information:\nalpha beta gamma delta"
+        chunks = list(client.chats.create(model="m", history=[]).send_message_stream(message=message))
+        self.assertEqual("".join(chunk.text for chunk in chunks), "Based on the documents: alpha beta gamma ")
+        self.assertIsNone(chunks[0].usage_metadata)
+        self.assertEqual(chunks[-1].usage_metadata.candidates_token_count, 7)
+
+        response = client.chats.create(model="m", history=[]).send_message(message=message)
+        self.assertEqual(response.text, "Based on the documents: alpha beta gamma")
+        self.assertEqual(client.stats["chat_calls"], 2)
+
+    def test_failures(self):
+        """Test failure_rate makes calls raise a retryable error"""
+        client = FakeClient(failure_rate=1.0)
+        with self.assertRaises(ConnectionError):
+            client.models.embed_content(model="m", contents="text")
+        self.assertEqual(client.stats["failures"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import uuid
+from flask import Flask
+from flask_jwt_extended import create_access_token, verify_jwt_in_request
+from sqlalchemy import event
+from extensions import db, jwt
+from identity import access_token_claims, current_user_id, identity_cache
+from models import User
+
+
+class TestCurrentUserId(unittest.TestCase):
+    def setUp(self):
+        """Create an app with one user over an in-memory database"""
+        self.app = Flask(__name__)
+        self.app.config.update(
+            SQLALCHEMY_DATABASE_URI="sqlite://",
+            JWT_SECRET_KEY="test-secret-key-that-is-long-enough",
+            IDENTITY_CACHE_TTL=300,
+            IDENTITY_CACHE_MAX=100,
+        )
+        db.init_app(self.app)
+        jwt.init_app(self.app)
+        identity_cache.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+
+        self.user = User(id=uuid.uuid4(), username="u", email="u@example.com", password_hash="x")
+        db.session.add(self.user)
+        db.session.commit()
+        self.statements = 0
+        event.listen(db.engine, "before_cursor_execute", self.count)
+
+    def tearDown(self):
+        event.remove(db.engine, "before_cursor_execute", self.count)
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def count(self, *args):
+        self.statements += 1
+
+    def resolve(self, token):
+        # Each request gets its own app context, and with it its own flask.g
+        with self.app.app_context(), self.app.test_request_context(headers={"Authorization": f"Bearer {token}"}):
+            verify_jwt_in_request()
+            user_id = current_user_id()
+            self.assertEqual(current_user_id(), user_id)
+            return user_id
+
+    def test_claim_skips_the_users_table(self):
+        """Test tokens carrying the user_id claim resolve without a query"""
+        token = create_access_token(identity=self.user.email, additional_claims=access_token_claims(self.user))
+        self.statements = 0
+        self.assertEqual(self.resolve(token), self.user.id)
+        self.assertEqual(self.statements, 0)
+
+    def test_tokens_without_the_claim_are_cached(self):
+        """Test identity-only tokens query the users table once, then hit the cache"""
+        token = create_access_token(identity=self.user.email)
+        self.statements = 0
+        self.assertEqual(self.resolve(token), self.user.id)
+        self.assertEqual(self.resolve(token), self.user.id)
+        self.assertEqual(self.statements, 1)
+
+    def test_unknown_identities_resolve_to_none(self):
+        """Test a token for a missing user resolves to None"""
+        self.assertIsNone(self.resolve(create_access_token(identity="nobody@example.com")))
+
+    def test_user_changes_invalidate_the_cache(self):
+        """Test updating or deleting a user drops their cached id"""
+        token = create_access_token(identity=self.user.email)
+        self.resolve(token)
+        self.user.email = "new@example.com"
+        db.session.commit()
+        self.assertIsNone(identity_cache.get("u@example.com"))
+        self.assertIsNone(self.resolve(token))
+
+        self.resolve(create_access_token(identity="new@example.com"))
+        db.session.delete(self.user)
+        db.session.commit()
+        self.assertIsNone(identity_cache.get("new@example.com"))
+
+
+if __name__ == '__main__':
+    unittest.main()
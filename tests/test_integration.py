@@ -1,13 +1,30 @@
+import os
+import shutil
+import tempfile
+import time
 import unittest
+from unittest import mock
+import services
 from app import create_app  # Adjust based on your project structure
 from extensions import db  # Ensure db is imported from your extensions or where it's defined
 
+SAMPLE_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample.pdf")
+
 class TestIntegration(unittest.TestCase):
     def setUp(self):
         """Set up test client and database"""
-        self.app = create_app()
-        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"  # Use in-memory database
-        self.app.config["TESTING"] = True
+        self.workdir = tempfile.mkdtemp()
+        self.app = create_app({
+            # A database file rather than an in-memory one, so the ingestion worker threads get connections of their own
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(self.workdir, 'test.db')}",
+            "TESTING": True,
+            "LLM_PROVIDER": "fake",
+            "JWT_SECRET_KEY": "test-secret-key-of-at-least-32-bytes",
+            "VECTOR_INDEX_DIR": os.path.join(self.workdir, "vector_index"),
+            "REINDEX_ENABLED": False,
+        })
+        self.uploads = mock.patch.object(services, "UPLOAD_FOLDER", os.path.join(self.workdir, "uploads"))
+        self.uploads.start()
         self.client = self.app.test_client()
 
         # Create a new app context for the database setup
@@ -19,6 +36,8 @@ class TestIntegration(unittest.TestCase):
         with self.app.app_context():
             db.session.remove()
             db.drop_all()
+        self.uploads.stop()
+        shutil.rmtree(self.workdir)
 
     def test_user_workflow(self):
         """Test full user workflow from registration to QA"""
@@ -43,10 +62,19 @@ class TestIntegration(unittest.TestCase):
 
         # Upload a document
         data = {
-            "file": (open("sample.pdf", "rb"), "sample.pdf")
+            "file": (open(SAMPLE_PDF, "rb"), "sample.pdf")
         }
         response = self.client.post("/documentupload", headers=headers, data=data)
-        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.status_code, 202)
+
+        # Wait for the ingestion worker to finish
+        job_id = response.get_json()["job_id"]
+        for _ in range(100):
+            status = self.client.get(f"/documentstatus/{job_id}", headers=headers).get_json()["status"]
+            if status in ("ready", "failed"):
+                break
+            time.sleep(0.1)
+        self.assertEqual(status, "ready")
 
         # Ask a question
         question_data = {
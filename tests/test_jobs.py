@@ -0,0 +1,161 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+import uuid
+from datetime import timedelta
+from flask import Flask
+from sqlalchemy import func, select, update
+from extensions import db
+from jobs import IngestionQueue, confirm_claim, utcnow
+from models import Document, IngestionJob, User
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Queues a job straight in the database, then starts the app and waits without any upload
+RESTART_SCRIPT = """
+import sys, time, uuid
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from extensions import db
+from models import IngestionJob, User
+
+engine = create_engine(sys.argv[1])
+db.metadata.create_all(engine)
+with Session(engine) as session:
+    user = User(id=uuid.uuid4(), username="u", email="u@example.com", password_hash="x")
+    job = IngestionJob(id=uuid.uuid4(), user_id=user.id, document_name="d.txt", file_path=sys.argv[2])
+    session.add(user)
+    session.commit()
+    session.add(job)
+    session.commit()
+    job_id = job.id
+
+from app import create_app
+create_app()
+for _ in range(100):
+    with Session(engine) as session:
+        status = session.get(IngestionJob, job_id).status
+    if status in ("ready", "failed"):
+        break
+    time.sleep(0.1)
+print(status)
+"""
+
+
+class TestIngestionQueue(unittest.TestCase):
+    def setUp(self):
+        """Create a user with one queued ingestion job"""
+        app = Flask(__name__)
+        app.config.update(
+            SQLALCHEMY_DATABASE_URI="sqlite://",
+            INGESTION_MODE="async",
+            INGESTION_WORKERS=1,
+            INGESTION_POLL_INTERVAL=1,
+            INGESTION_JOB_TIMEOUT=600,
+        )
+        db.init_app(app)
+        self.queue = IngestionQueue(app)
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all()
+
+        self.user_id = uuid.uuid4()
+        db.session.add(User(id=self.user_id, username="u", email="u@example.com", password_hash="x"))
+        self.job_id = uuid.uuid4()
+        db.session.add(IngestionJob(id=self.job_id, user_id=self.user_id, document_name="d.txt", file_path="d.txt"))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def _store_document(self, job):
+        db.session.add(Document(user_id=job.user_id, document_name=job.document_name, document_path=job.file_path))
+        confirm_claim(job)
+        db.session.commit()
+
+    def test_claimed_job_runs_to_ready(self):
+        """Test a claimed job commits its document and ends ready"""
+        self.queue.register_handler(self._store_document)
+        self.assertEqual(self.queue._claim(), self.job_id)
+        job = self.queue.run(self.job_id)
+
+        self.assertEqual(job.status, "ready")
+        self.assertIn("total", job.timings)
+        self.assertEqual(db.session.execute(select(func.count(Document.id))).scalar(), 1)
+
+    def test_failed_job_removes_its_upload(self):
+        """Test a job that fails deletes its uploaded file"""
+        path = os.path.join(tempfile.mkdtemp(), "d.txt")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write("text")
+        db.session.get(IngestionJob, self.job_id).file_path = path
+        db.session.commit()
+
+        def fail(job):
+            raise ValueError("Unreadable document")
+
+        self.queue.register_handler(fail)
+        self.queue._claim()
+        job = self.queue.run(self.job_id)
+
+        self.assertEqual(job.status, "failed")
+        self.assertFalse(os.path.exists(path))
+
+    def test_reclaimed_job_commits_nothing(self):
+        """Test a run whose job was reclaimed by another worker stores no document and leaves the job alone"""
+        def reclaimed(job):
+            # Another worker claims the job while this run is still going
+            db.session.execute(
+                update(IngestionJob).where(IngestionJob.id == job.id)
+                .values(started_at=utcnow() + timedelta(seconds=1), status="extracting")
+            )
+            db.session.commit()
+            self._store_document(job)
+
+        self.queue.register_handler(reclaimed)
+        self.queue._claim()
+        job = self.queue.run(self.job_id)
+
+        self.assertEqual(job.status, "extracting")
+        self.assertIsNone(job.finished_at)
+        self.assertEqual(db.session.execute(select(func.count(Document.id))).scalar(), 0)
+
+
+class TestStartup(unittest.TestCase):
+    def setUp(self):
+        """Create a working directory for the database, the document and the vector index"""
+        self.workdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_job_queued_before_start_up_runs(self):
+        """Test workers start with the app and run a job queued before it, with no upload to wake them"""
+        path = os.path.join(self.workdir, "d.txt")
+        with open(path, "w") as f:
+            f.write("Paris is the capital of France.")
+        database = f"sqlite:///{os.path.join(self.workdir, 'test.db')}"
+        env = {
+            **os.environ,
+            "DATABASE_URL": database,
+            "LLM_PROVIDER": "fake",
+            "JWT_SECRET_KEY": "test-secret-key-of-at-least-32-bytes",
+            "VECTOR_INDEX_DIR": os.path.join(self.workdir, "vector_index"),
+            "REINDEX_ENABLED": "false",
+            "INGESTION_MODE": "async",
+            "INGESTION_POLL_INTERVAL": "0.1",
+        }
+        result = subprocess.run(
+            [sys.executable, "-c", RESTART_SCRIPT, database, path], cwd=ROOT, env=env, capture_output=True, text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.splitlines()[-1], "ready")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import uuid
+from flask import Flask
+from sqlalchemy import insert
+from extensions import db
+from lexical import chunk_postings, reciprocal_rank_fusion, search_lexical, tokenize
+from models import ChunkTerm, Document, DocumentChunk, User
+
+
+class TestTokenize(unittest.TestCase):
+    def test_identifiers_stay_whole(self):
+        """Test error codes, versions and snake_case names are single terms"""
+        self.assertEqual(
+            tokenize("The job failed with ERR-042 in worker_pool v1.2.3."),
+            ["job", "failed", "err-042", "worker_pool", "v1.2.3"],
+        )
+
+
+class TestReciprocalRankFusion(unittest.TestCase):
+    def test_items_in_both_rankings_win(self):
+        """Test fusion rewards agreement and applies the weights"""
+        vector = [("a", 0.9), ("b", 0.8), ("c", 0.7)]
+        lexical = [("c", 12.0), ("d", 3.0)]
+        fused = reciprocal_rank_fusion([vector, lexical], [1.0, 1.0], k=60)
+        self.assertEqual(fused[0][0], "c")
+        self.assertAlmostEqual(fused[0][1], 1 / 63 + 1 / 61)
+
+        vector_only = reciprocal_rank_fusion([vector, lexical], [1.0, 0.0], k=60)
+        self.assertEqual([item for item, _ in vector_only][:3], ["a", "b", "c"])
+
+
+class TestSearchLexical(unittest.TestCase):
+    def setUp(self):
+        """Index a few chunks for one user in an in-memory database"""
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.init_app(app)
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all()
+
+        self.user = User(id=uuid.uuid4(), username="u", email="u@example.com", password_hash="x")
+        self.other = User(id=uuid.uuid4(), username="o", email="o@example.com", password_hash="x")
+        db.session.add_all([self.user, self.other])
+        self.chunks = {}
+        self.add_document(self.user, {
+            "error": "Deploys fail with ERR-042 when the cache is cold.",
+            "cache": "The cache warms up after the first request. The cache is shared.",
+            "invoices": "Invoices are sent at the end of the month.",
+            "payroll": "Payroll runs every other Friday.",
+            "holidays": "Holidays follow the local calendar.",
+        })
+        self.add_document(self.other, {"foreign": "ERR-042 also appears in someone else's notes."})
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def add_document(self, user, texts):
+        document = Document(id=uuid.uuid4(), user_id=user.id, document_name="d.txt", document_path="d.txt")
+        db.session.add(document)
+        for index, (name, text) in enumerate(texts.items()):
+            chunk_id = uuid.uuid4()
+            term_count, postings = chunk_postings(chunk_id, document.id, text)
+            db.session.add(DocumentChunk(
+                id=chunk_id, document_id=document.id, chunk_index=index, page_number=1,
+                start_offset=0, end_offset=len(text), chunk_text=text, term_count=term_count,
+            ))
+            db.session.flush()
+            db.session.execute(insert(ChunkTerm), postings)
+            self.chunks[chunk_id] = name
+
+    def test_exact_identifier_ranks_first(self):
+        """Test the chunk containing an identifier outranks chunks sharing common words"""
+        ranked, chunk_count = search_lexical("what does ERR-042 mean for the cache", self.user.id)
+        self.assertEqual(chunk_count, 5)
+        self.assertEqual([self.chunks[chunk_id] for chunk_id, _ in ranked][:2], ["error", "cache"])
+
+    def test_results_stay_in_the_users_scope(self):
+        """Test other users' chunks are never returned"""
+        ranked, _ = search_lexical("ERR-042", self.user.id)
+        self.assertEqual([self.chunks[chunk_id] for chunk_id, _ in ranked], ["error"])
+
+    def test_queries_without_terms(self):
+        """Test stopword-only queries return nothing"""
+        self.assertEqual(search_lexical("what is the", self.user.id), ([], 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+import uuid
+from flask import Flask
+from sqlalchemy import event, inspect
+from extensions import db
+from models import Document, DocumentChunk, Embedding, User
+
+DOCUMENT_TEXT = "x" * 20000
+
+
+class Traffic:
+    """Counts the statements run and the bytes of column values loaded into ORM objects"""
+
+    def __init__(self):
+        self.statements = 0
+        self.bytes = 0
+
+    def __enter__(self):
+        event.listen(db.engine, "before_cursor_execute", self.on_execute)
+        event.listen(db.Model, "load", self.on_load, propagate=True)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, "before_cursor_execute", self.on_execute)
+        event.remove(db.Model, "load", self.on_load)
+
+    def on_execute(self, *args):
+        self.statements += 1
+
+    def on_load(self, instance, context):
+        self.bytes += sum(len(str(value)) for value in inspect(instance).dict.values() if value is not None)
+
+
+class TestLoading(unittest.TestCase):
+    def setUp(self):
+        """Create an in-memory database"""
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.init_app(app)
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def add_corpus(self, documents):
+        """A user with the given number of documents, each with a few chunks and embeddings"""
+        username = f"u{documents:03}"
+        email = f"{username}@example.com"
+        user = User(id=uuid.uuid4(), username=username, email=email, password_hash="x")
+        db.session.add(user)
+        for _ in range(documents):
+            document = Document(
+                id=uuid.uuid4(), user_id=user.id, document_name="d.txt", document_path="d.txt", document_text=DOCUMENT_TEXT,
+            )
+            db.session.add(document)
+            for index in range(3):
+                chunk = DocumentChunk(
+                    id=uuid.uuid4(), document_id=document.id, chunk_index=index,
+                    start_offset=0, end_offset=100, chunk_text="x" * 100,
+                )
+                db.session.add(chunk)
+                db.session.add(Embedding(document_id=document.id, chunk_id=chunk.id, embedding_vector=[0.1] * 768))
+        document_id = document.id
+        db.session.commit()
+        db.session.expunge_all()
+        return email, document_id
+
+    def measure(self, documents, operation):
+        email, document_id = self.add_corpus(documents)
+        with Traffic() as traffic:
+            operation(email, document_id)
+        db.session.expunge_all()
+        return traffic
+
+    def lookup_user(self, email, document_id):
+        User.query.filter_by(email=email).first()
+
+    def delete_document(self, email, document_id):
+        document = Document.query.filter_by(id=document_id).first()
+        db.session.delete(document)
+        db.session.commit()
+
+    def test_user_lookup_does_not_grow_with_corpus(self):
+        """Test looking up the request's user reads one row whatever the number of documents"""
+        small, large = self.measure(2, self.lookup_user), self.measure(20, self.lookup_user)
+        self.assertEqual(small.statements, 1)
+        self.assertEqual(large.statements, 1)
+        self.assertEqual(small.bytes, large.bytes)
+        self.assertLess(large.bytes, 1000)
+
+    def test_document_text_and_vectors_are_not_loaded(self):
+        """Test deleting a document neither reads its text nor loads its chunks and embeddings"""
+        small, large = self.measure(2, self.delete_document), self.measure(20, self.delete_document)
+        self.assertEqual(small.statements, large.statements)
+        self.assertLess(large.bytes, len(DOCUMENT_TEXT))
+
+
+if __name__ == '__main__':
+    unittest.main()
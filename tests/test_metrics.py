@@ -0,0 +1,70 @@
+import unittest
+from flask import Flask
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from extensions import db
+from metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        """Create an app with a route that runs two timed stages and two queries"""
+        self.metrics = Metrics()
+        self.app = Flask(__name__)
+        self.app.config.update(
+            SQLALCHEMY_DATABASE_URI="sqlite://",
+            METRICS_ENABLED=True,
+            SERVER_TIMING=True,
+            OTEL_ENABLED=False,
+        )
+        db.init_app(self.app)
+        self.metrics.init_app(self.app)
+
+        @self.app.route("/work")
+        def work():
+            timings = {}
+            with self.metrics.stage("qa", "retrieval", timings):
+                db.session.execute(text("SELECT 1"))
+                db.session.execute(text("SELECT 2"))
+            self.metrics.observe_stage("qa", "generation", 0.2, timings)
+            return timings
+
+    def tearDown(self):
+        event.remove(Engine, "before_cursor_execute", self.metrics._on_query)
+
+    def test_stages_are_reported_per_request(self):
+        """Test stage timings reach the response, the Server-Timing header and the histograms"""
+        response = self.app.test_client().get("/work")
+        self.assertEqual(set(response.get_json()), {"retrieval", "generation"})
+
+        header = response.headers["Server-Timing"]
+        self.assertIn("qa.retrieval;dur=", header)
+        self.assertIn("qa.generation;dur=200.0", header)
+        self.assertIn('db;desc="2 queries"', header)
+
+        rendered = self.metrics.render()
+        self.assertIn('pipeline_stage_seconds_bucket{pipeline="qa",stage="generation",le="0.1"} 0.0', rendered)
+        self.assertIn('pipeline_stage_seconds_bucket{pipeline="qa",stage="generation",le="0.25"} 1.0', rendered)
+        self.assertIn('pipeline_stage_seconds_bucket{pipeline="qa",stage="generation",le="+Inf"} 1.0', rendered)
+        self.assertIn('pipeline_stage_seconds_count{pipeline="qa",stage="retrieval"} 1.0', rendered)
+        self.assertIn('http_request_duration_seconds_count{method="GET",endpoint="work",status="200"} 1.0', rendered)
+        self.assertIn("db_queries_per_request_sum 2.0", rendered)
+
+    def test_render_format(self):
+        """Test counters, escaped label values and collectors in the exposition format"""
+        self.metrics.external_calls.inc(api="embedding", outcome="error")
+        self.metrics.external_calls.inc(2, api="embedding", outcome="error")
+        self.metrics.llm_tokens.inc(5, type='say "hi"\n')
+        self.metrics.register_collector("cache_lookups_total", "Cache lookups", "result", lambda: {"hits": 3})
+
+        rendered = self.metrics.render()
+        self.assertIn("# TYPE external_api_requests_total counter", rendered)
+        self.assertIn('external_api_requests_total{api="embedding",outcome="error"} 3.0', rendered)
+        self.assertIn('llm_tokens_total{type="say \\"hi\\"\\n"} 5.0', rendered)
+        self.assertIn("# TYPE pipeline_stage_seconds histogram", rendered)
+        self.assertIn('cache_lookups_total{result="hits"} 3.0', rendered)
+        self.assertTrue(rendered.endswith("\n"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import uuid
+from datetime import datetime, timedelta
+from flask import Flask
+from sqlalchemy import select
+from extensions import db
+from models import Document, User
+from pagination import decode_cursor, encode_cursor, list_documents
+
+
+class TestListDocuments(unittest.TestCase):
+    def setUp(self):
+        """Create a user with documents uploaded a day apart, plus another user's document"""
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.init_app(app)
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all()
+
+        self.user_id, other_id = uuid.uuid4(), uuid.uuid4()
+        db.session.add_all([
+            User(id=self.user_id, username="u", email="u@example.com", password_hash="x"),
+            User(id=other_id, username="o", email="o@example.com", password_hash="x"),
+        ])
+        self.start = datetime(2024, 1, 1)
+        names = ["report-1.pdf", "report-2.pdf", "notes.txt", "report_3.pdf", "notes-2.txt"]
+        for day, name in enumerate(names):
+            db.session.add(Document(
+                user_id=self.user_id, document_name=name, document_path=name, uploaded_at=self.start + timedelta(days=day),
+            ))
+        # Same timestamp as the newest document: ties are broken by id
+        db.session.add(Document(
+            user_id=self.user_id, document_name="tie.txt", document_path="tie.txt", uploaded_at=self.start + timedelta(days=4),
+        ))
+        db.session.add(Document(user_id=other_id, document_name="report-x.pdf", document_path="x", uploaded_at=self.start))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def test_pages_cover_every_document_once(self):
+        """Test following next_cursor lists all documents newest first, without repeats"""
+        seen, cursor = [], None
+        while True:
+            rows, cursor, total = list_documents(self.user_id, 4, cursor=cursor)
+            self.assertIsNone(total)
+            seen.extend(rows)
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(len({row.id for row in seen}), 6)
+        keys = [(row.uploaded_at, row.id) for row in seen]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+    def test_filters_and_total(self):
+        """Test name prefix and date range filters, with wildcards in the prefix taken literally"""
+        rows, cursor, total = list_documents(self.user_id, 10, name_prefix="report", include_total=True)
+        self.assertEqual([row.document_name for row in rows], ["report_3.pdf", "report-2.pdf", "report-1.pdf"])
+        self.assertEqual(total, 3)
+        self.assertIsNone(cursor)
+
+        rows, _, _ = list_documents(self.user_id, 10, name_prefix="report_")
+        self.assertEqual([row.document_name for row in rows], ["report_3.pdf"])
+
+        rows, _, total = list_documents(
+            self.user_id, 1, uploaded_after=self.start + timedelta(days=1), uploaded_before=self.start + timedelta(days=3),
+            include_total=True,
+        )
+        self.assertEqual([row.document_name for row in rows], ["notes.txt"])
+        self.assertEqual(total, 2)
+
+    def test_pages_with_default_upload_times(self):
+        """Test paging and date bounds over documents timestamped on insert, not set explicitly"""
+        user_id = uuid.uuid4()
+        db.session.add(User(id=user_id, username="d", email="d@example.com", password_hash="x"))
+        for name in ["d1.txt", "d2.txt", "d3.txt"]:
+            db.session.add(Document(user_id=user_id, document_name=name, document_path=name))
+            db.session.commit()
+
+        seen, cursor = [], None
+        for _ in range(4):
+            rows, cursor, _ = list_documents(user_id, 1, cursor=cursor)
+            seen.extend(row.document_name for row in rows)
+            if cursor is None:
+                break
+        self.assertEqual(seen, ["d3.txt", "d2.txt", "d1.txt"])
+
+        first = db.session.execute(select(Document.uploaded_at).where(Document.document_name == "d1.txt")).scalar()
+        rows, _, _ = list_documents(user_id, 10, uploaded_after=first)
+        self.assertEqual(len(rows), 3)
+
+    def test_cursor_round_trip(self):
+        """Test cursors decode to what they encode and malformed ones are rejected"""
+        document_id = uuid.uuid4()
+        self.assertEqual(decode_cursor(encode_cursor(self.start, document_id)), (self.start, document_id))
+        with self.assertRaises(ValueError):
+            decode_cursor("not-a-cursor")
+
+
+if __name__ == '__main__':
+    unittest.main()
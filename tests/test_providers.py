@@ -0,0 +1,39 @@
+import unittest
+from types import SimpleNamespace
+from flask import Flask
+from providers import LazyClient
+
+
+class TestLazyClient(unittest.TestCase):
+    def setUp(self):
+        """Create a registry with a counting test provider"""
+        self.created = 0
+        self.client = LazyClient()
+        self.client.register("test", self.factory)
+        self.app = Flask(__name__)
+        self.app.config.update(LLM_PROVIDER="test", API_KEY="key")
+
+    def factory(self, config):
+        self.created += 1
+        return SimpleNamespace(models="models", chats="chats", key=config["API_KEY"])
+
+    def test_client_is_created_on_first_use(self):
+        """Test the provider's client is built once, when first used, from the app config"""
+        self.client.init_app(self.app)
+        self.assertEqual(self.created, 0)
+        self.assertEqual(self.client.models, "models")
+        self.assertEqual(self.client.chats, "chats")
+        self.assertEqual(self.client.get().key, "key")
+        self.assertEqual(self.created, 1)
+
+    def test_unknown_or_uninitialized_provider(self):
+        """Test an unknown provider fails at init_app, and use before init_app is an error"""
+        with self.assertRaises(RuntimeError):
+            self.client.get()
+        self.app.config["LLM_PROVIDER"] = "missing"
+        with self.assertRaises(ValueError):
+            self.client.init_app(self.app)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+import uuid
+from datetime import datetime
+from flask import Flask
+from sqlalchemy import func, select
+from embeddings import EmbeddingVersion, text_hash
+from extensions import db
+from models import AnswerCacheEntry, Document, DocumentChunk, Embedding, EmbeddingVersionState, User
+from reindex import reindexer
+from vector_store import stored_vectors
+from versions import embedding_versions
+
+OLD = EmbeddingVersion("old-model", "1")
+NEW = EmbeddingVersion("new-model", "1")
+
+
+def vector(value):
+    return [float(value)] + [0.0] * 767
+
+
+class TestReindexer(unittest.TestCase):
+    def setUp(self):
+        """Store five chunks embedded by the old version, with the new one configured"""
+        app = Flask(__name__)
+        app.config.update(
+            SQLALCHEMY_DATABASE_URI="sqlite://",
+            VECTOR_BACKEND="pgvector",  # no local index shards to maintain
+            EMBEDDING_MODEL=NEW.model,
+            EMBEDDING_PIPELINE_VERSION=NEW.pipeline,
+            EMBEDDING_VERSION_REFRESH=0,
+            REINDEX_ENABLED=False,
+            REINDEX_BATCH_SIZE=2,
+            REINDEX_INTERVAL=0,
+            REINDEX_IDLE_INTERVAL=0,
+            REINDEX_RETIRE_AFTER=0,
+            CHUNK_SIZE=40,
+            CHUNK_OVERLAP=0,
+        )
+        db.init_app(app)
+        embedding_versions.init_app(app)
+        reindexer.init_app(app)
+        reindexer._after, reindexer._pass_pending, reindexer._legacy_pending = None, True, True
+        self.embedded = []
+        reindexer.register_embedder(self.embed)
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all()
+
+        self.user_id = uuid.uuid4()
+        db.session.add(User(id=self.user_id, username="u", email="u@example.com", password_hash="x"))
+        document = Document(id=uuid.uuid4(), user_id=self.user_id, document_name="d.txt", document_path="d.txt")
+        db.session.add(document)
+        for index in range(5):
+            chunk = DocumentChunk(
+                id=uuid.uuid4(), document_id=document.id, chunk_index=index,
+                start_offset=0, end_offset=10, chunk_text=f"chunk {index}",
+            )
+            db.session.add(chunk)
+            db.session.add(Embedding(
+                document_id=document.id, chunk_id=chunk.id, embedding_vector=vector(index),
+                model_name=OLD.model, pipeline_version=OLD.pipeline,
+            ))
+        db.session.add(EmbeddingVersionState(model_name=OLD.model, pipeline_version=OLD.pipeline, state="serving"))
+        db.session.add(AnswerCacheEntry(
+            user_id=self.user_id, scope_key="all", query_text="q", query_vector=vector(1), response="a", sources=[],
+            created_at=datetime.utcnow(),
+        ))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def embed(self, texts, session=None, version=None):
+        self.assertEqual(version, NEW)
+        self.embedded.extend(texts)
+        return [vector(len(text)) for text in texts]
+
+    def count(self, version):
+        return db.session.execute(
+            select(func.count(Embedding.id))
+            .where(Embedding.model_name == version.model, Embedding.pipeline_version == version.pipeline)
+        ).scalar()
+
+    def test_reindex_switches_once_every_chunk_is_embedded(self):
+        """Test batches are embedded while the old version serves, then the switch and clean-up"""
+        reports = []
+        while not reports or not reports[-1]["switched"]:
+            self.assertEqual(embedding_versions.serving(), OLD)
+            reports.append(reindexer.run_once())
+        self.assertEqual([report["embedded"] for report in reports], [2, 2, 1, 0, 0])
+        self.assertEqual(sorted(self.embedded), [f"chunk {index}" for index in range(5)])
+
+        self.assertEqual(embedding_versions.serving(), NEW)
+        self.assertEqual(db.session.execute(select(func.count(AnswerCacheEntry.id))).scalar(), 0)
+        self.assertIsNone(db.session.execute(select(DocumentChunk.id).where(DocumentChunk.content_hash.is_(None))).first())
+        self.assertEqual(self.count(OLD), 5)
+
+        # The old vectors are deleted after the grace period, and nothing is embedded twice
+        self.assertEqual(reindexer.run_once()["deleted"], 5)
+        while not reindexer.run_once()["idle"]:
+            pass
+        self.assertEqual(self.count(OLD), 0)
+        self.assertEqual(self.count(NEW), 5)
+        self.assertEqual(len(self.embedded), 5)
+        self.assertEqual(reindexer.get_status()["stale_chunks"], 0)
+
+    def test_documents_from_before_chunking_are_chunked_and_embedded(self):
+        """Test a legacy document's stored text is chunked, embedded and replaces its document-level vector"""
+        legacy = Document(
+            id=uuid.uuid4(), user_id=self.user_id, document_name="old.pdf", document_path="old.pdf",
+            document_text="The first sentence is here. The second one follows it. A third closes the text.",
+        )
+        db.session.add(legacy)
+        db.session.add(Embedding(
+            document_id=legacy.id, embedding_vector=vector(9), model_name=OLD.model, pipeline_version=OLD.pipeline,
+        ))
+        db.session.commit()
+
+        report = reindexer.run_once()
+        self.assertEqual(report["chunked"], 1)
+        chunks = db.session.execute(
+            select(DocumentChunk.chunk_text, DocumentChunk.term_count, DocumentChunk.content_hash)
+            .where(DocumentChunk.document_id == legacy.id).order_by(DocumentChunk.chunk_index)
+        ).all()
+        self.assertEqual([chunk.chunk_text for chunk in chunks], [
+            "The first sentence is here.", "The second one follows it.", "A third closes the text.",
+        ])
+        self.assertTrue(all(chunk.term_count and chunk.content_hash for chunk in chunks))
+        self.assertIsNone(db.session.execute(select(Embedding.id).where(Embedding.chunk_id.is_(None))).first())
+
+        while not reindexer.run_once()["switched"]:
+            pass
+        self.assertIn("A third closes the text.", self.embedded)
+        self.assertEqual(self.count(NEW), 8)
+        self.assertEqual(reindexer.run_once()["chunked"], 0)
+
+    def test_unchanged_chunks_reuse_stored_vectors(self):
+        """Test vectors are found by content hash for the same user and version only"""
+        chunk_id = db.session.execute(select(DocumentChunk.id).where(DocumentChunk.chunk_text == "chunk 3")).scalar()
+        chunk = db.session.get(DocumentChunk, chunk_id)
+        chunk.content_hash = text_hash("chunk 3")
+        db.session.commit()
+
+        found = stored_vectors(self.user_id, [text_hash("chunk  3\n"), text_hash("new text")], OLD)
+        self.assertEqual(list(found), [text_hash("chunk 3")])
+        self.assertEqual(found[text_hash("chunk 3")][0], 3.0)
+        self.assertEqual(stored_vectors(self.user_id, [text_hash("chunk 3")], NEW), {})
+        self.assertEqual(stored_vectors(uuid.uuid4(), [text_hash("chunk 3")], OLD), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import time
+import unittest
+from types import SimpleNamespace
+from rerank import LexicalOverlapReranker, Reranking
+
+
+def make_chunk(text, score=0.5):
+    return SimpleNamespace(chunk_text=text, score=score)
+
+
+class SlowReranker:
+    name = "slow"
+    blended = False
+
+    def score(self, query, texts):
+        if any("slow" in text for text in texts):
+            time.sleep(0.5)
+        return [float(len(text)) for text in texts]
+
+
+class LengthReranker:
+    name = "length"
+    blended = False
+
+    def score(self, query, texts):
+        return [len(text) / 100 for text in texts]
+
+
+class TestRerank(unittest.TestCase):
+    def setUp(self):
+        """Create a rerank stage scoring two candidates per batch"""
+        self.stage = Reranking(SimpleNamespace(extensions={}, config={
+            "RERANKER": "lexical",
+            "RERANK_MODEL": None,
+            "RERANK_BATCH_SIZE": 2,
+            "RERANK_TIMEOUT": 0.2,
+            "RERANK_LEXICAL_WEIGHT": 0.3,
+        }))
+
+    def test_lexical_overlap_prefers_matching_passages(self):
+        """Test passages with more query terms, in query order, score higher"""
+        scores = LexicalOverlapReranker().score("reset the admin password", [
+            "Billing runs monthly.",
+            "The password policy applies to every account.",
+            "To reset the admin password, open the console.",
+        ])
+        self.assertEqual(sorted(range(3), key=lambda i: -scores[i]), [2, 1, 0])
+
+    def test_candidates_are_reordered_and_cut_to_top_k(self):
+        """Test a model reranker's order replaces the first-stage order"""
+        self.stage._reranker = LengthReranker()
+        candidates = [make_chunk("short", 0.9), make_chunk("a much longer passage", 0.1)]
+        ranked, report = self.stage.rerank("q", candidates, top_k=1)
+
+        self.assertEqual([chunk.chunk_text for chunk in ranked], ["a much longer passage"])
+        self.assertAlmostEqual(ranked[0].score, 0.21)
+        self.assertEqual(report, {"reranker": "length", "candidates": 2, "reranked": 2, "degraded": False})
+
+    def test_lexical_scores_are_blended_with_the_first_stage(self):
+        """Test word overlap reorders close candidates but cannot overturn a clearly better first-stage match"""
+        candidates = [
+            make_chunk("Resetting credentials is done from the console.", 0.9),
+            make_chunk("Admin password reset dates are listed below.", 0.1),
+            make_chunk("The admin password reset form.", 0.85),
+        ]
+        ranked, report = self.stage.rerank("admin password reset", candidates, top_k=3)
+
+        self.assertAlmostEqual(candidates[0].score, 0.7)  # first by similarity, no query word in common
+        self.assertEqual([chunk.chunk_text for chunk in ranked], [
+            "The admin password reset form.",
+            "Resetting credentials is done from the console.",
+            "Admin password reset dates are listed below.",
+        ])
+        self.assertEqual(report["reranker"], "lexical")
+
+    def test_slow_batches_keep_first_stage_order(self):
+        """Test batches past the timeout are ranked after scored ones, in their original order"""
+        self.stage._reranker = SlowReranker()
+        candidates = [make_chunk("a"), make_chunk("bb"), make_chunk("slow one"), make_chunk("c")]
+        ranked, report = self.stage.rerank("q", candidates, top_k=4)
+
+        self.assertEqual([chunk.chunk_text for chunk in ranked], ["bb", "a", "slow one", "c"])
+        self.assertTrue(report["degraded"])
+        self.assertEqual(report["reranked"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,9 @@
+import os
+import shutil
+import tempfile
 import unittest
+from unittest import mock
+import services
 from app import create_app
 from extensions import db
 
@@ -6,16 +11,30 @@ from extensions import db
 class TestRoutes(unittest.TestCase):
     def setUp(self):
         """Set up test client and database"""
-        self.app = create_app()
-        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"  # Use in-memory database
-        self.app.config["TESTING"] = True
+        self.workdir = tempfile.mkdtemp()
+        self.app = create_app({
+            # A database file rather than an in-memory one, so the ingestion worker threads get connections of their own
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(self.workdir, 'test.db')}",
+            "TESTING": True,
+            "LLM_PROVIDER": "fake",
+            "JWT_SECRET_KEY": "test-secret-key-of-at-least-32-bytes",
+            "VECTOR_INDEX_DIR": os.path.join(self.workdir, "vector_index"),
+            "REINDEX_ENABLED": False,
+        })
+        self.uploads = mock.patch.object(services, "UPLOAD_FOLDER", os.path.join(self.workdir, "uploads"))
+        self.uploads.start()
         self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
         db.create_all()
 
     def tearDown(self):
         """Tear down after each test"""
         db.session.remove()
         db.drop_all()
+        self.context.pop()
+        self.uploads.stop()
+        shutil.rmtree(self.workdir)
 
     def test_register_route(self):
         """Test register route"""
@@ -30,6 +49,11 @@ class TestRoutes(unittest.TestCase):
 
     def test_login_route(self):
         """Test login route"""
+        self.client.post("/register", json={
+            "username": "newuser",
+            "email": "newuser@example.com",
+            "password": "newpassword"
+        })
         data = {
             "email": "newuser@example.com",
             "password": "newpassword"
@@ -1,24 +1,45 @@
+import os
+import shutil
+import tempfile
 import unittest
+from unittest import mock
+import services
 from services import UserService, DocumentService, QAService
 from models import User, Document, Embedding
 from extensions import db
 from flask_jwt_extended import create_access_token
 from app import create_app
 
+SAMPLE_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample.pdf")
+
 
 class TestUserService(unittest.TestCase):
     def setUp(self):
         """Set up test client and database"""
-        self.app = create_app()
-        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"  # Use in-memory database
-        self.app.config["TESTING"] = True
+        self.workdir = tempfile.mkdtemp()
+        self.app = create_app({
+            # A database file rather than an in-memory one, so the ingestion worker threads get connections of their own
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(self.workdir, 'test.db')}",
+            "TESTING": True,
+            "LLM_PROVIDER": "fake",
+            "JWT_SECRET_KEY": "test-secret-key-of-at-least-32-bytes",
+            "VECTOR_INDEX_DIR": os.path.join(self.workdir, "vector_index"),
+            "REINDEX_ENABLED": False,
+        })
+        self.uploads = mock.patch.object(services, "UPLOAD_FOLDER", os.path.join(self.workdir, "uploads"))
+        self.uploads.start()
         self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
         db.create_all()
 
     def tearDown(self):
         """Tear down after each test"""
         db.session.remove()
         db.drop_all()
+        self.context.pop()
+        self.uploads.stop()
+        shutil.rmtree(self.workdir)
 
     def test_register_user(self):
         """Test user registration"""
@@ -64,16 +85,30 @@ class TestUserService(unittest.TestCase):
 class TestDocumentService(unittest.TestCase):
     def setUp(self):
         """Set up test client and database"""
-        self.app = create_app()
-        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"  # Use in-memory database
-        self.app.config["TESTING"] = True
+        self.workdir = tempfile.mkdtemp()
+        self.app = create_app({
+            # A database file rather than an in-memory one, so the ingestion worker threads get connections of their own
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(self.workdir, 'test.db')}",
+            "TESTING": True,
+            "LLM_PROVIDER": "fake",
+            "JWT_SECRET_KEY": "test-secret-key-of-at-least-32-bytes",
+            "VECTOR_INDEX_DIR": os.path.join(self.workdir, "vector_index"),
+            "REINDEX_ENABLED": False,
+        })
+        self.uploads = mock.patch.object(services, "UPLOAD_FOLDER", os.path.join(self.workdir, "uploads"))
+        self.uploads.start()
         self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
         db.create_all()
 
     def tearDown(self):
         """Tear down after each test"""
         db.session.remove()
         db.drop_all()
+        self.context.pop()
+        self.uploads.stop()
+        shutil.rmtree(self.workdir)
 
     def test_upload_document(self):
         """Test document upload"""
@@ -93,11 +128,17 @@ class TestDocumentService(unittest.TestCase):
         # Upload document
         headers = {"Authorization": f"Bearer {access_token}"}
         data = {
-            "file": (open("sample.pdf", "rb"), "sample.pdf")
+            "file": (open(SAMPLE_PDF, "rb"), "sample.pdf")
         }
         response = self.client.post("/documentupload", headers=headers, data=data)
-        self.assertEqual(response.status_code, 201)
-        self.assertIn("Document uploaded successfully", response.get_json()["message"])
+        self.assertEqual(response.status_code, 202)
+        self.assertIn("job_id", response.get_json())
+
+        # Processing state is reported by the status route
+        job_id = response.get_json()["job_id"]
+        response = self.client.get(f"/documentstatus/{job_id}", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(response.get_json()["status"], ["queued", "extracting", "embedding", "ready"])
 
     def test_get_documents(self):
         """Test get all documents for the user"""
@@ -123,16 +164,31 @@ class TestDocumentService(unittest.TestCase):
 class TestQAService(unittest.TestCase):
     def setUp(self):
         """Set up test client and database"""
-        self.app = create_app()
-        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"  # Use in-memory database
-        self.app.config["TESTING"] = True
+        self.workdir = tempfile.mkdtemp()
+        self.app = create_app({
+            # A database file rather than an in-memory one, so the ingestion worker threads get connections of their own
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(self.workdir, 'test.db')}",
+            "TESTING": True,
+            "LLM_PROVIDER": "fake",
+            "JWT_SECRET_KEY": "test-secret-key-of-at-least-32-bytes",
+            "VECTOR_INDEX_DIR": os.path.join(self.workdir, "vector_index"),
+            "REINDEX_ENABLED": False,
+            "INGESTION_MODE": "sync",  # Documents are searchable once the upload returns
+        })
+        self.uploads = mock.patch.object(services, "UPLOAD_FOLDER", os.path.join(self.workdir, "uploads"))
+        self.uploads.start()
         self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
         db.create_all()
 
     def tearDown(self):
         """Tear down after each test"""
         db.session.remove()
         db.drop_all()
+        self.context.pop()
+        self.uploads.stop()
+        shutil.rmtree(self.workdir)
 
     def test_ask_question(self):
         """Test asking a question and getting an answer"""
@@ -150,6 +206,14 @@ class TestQAService(unittest.TestCase):
         access_token = login_response.get_json()["access_token"]
 
         headers = {"Authorization": f"Bearer {access_token}"}
+
+        # Upload a document to ask about
+        data = {
+            "file": (open(SAMPLE_PDF, "rb"), "sample.pdf")
+        }
+        response = self.client.post("/documentupload", headers=headers, data=data)
+        self.assertEqual(response.status_code, 201)
+
         data = {
             "query": "What is the capital of France?"
         }
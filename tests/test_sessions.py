@@ -0,0 +1,93 @@
+import unittest
+import uuid
+from datetime import datetime, timedelta
+from flask import Flask
+from extensions import db
+from models import ChatSession
+from sessions import MAX_MESSAGE_CHARS, ChatSessionStore, MemorySessionBackend
+
+
+def make_app(backend):
+    app = Flask(__name__)
+    app.config.update({
+        "SQLALCHEMY_DATABASE_URI": "sqlite://",
+        "CHAT_SESSION_BACKEND": backend,
+        "CHAT_SESSION_MAX": 2,
+        "CHAT_SESSION_TTL": 3600,
+        "CHAT_HISTORY_MAX_TURNS": 2,
+    })
+    db.init_app(app)
+    return app
+
+
+class TestMemorySessions(unittest.TestCase):
+    def setUp(self):
+        """Create a store holding at most two conversations of two turns"""
+        self.store = ChatSessionStore(make_app("memory"))
+
+    def test_history_keeps_the_latest_turns(self):
+        """Test old turns are dropped and long messages truncated"""
+        for i in range(3):
+            self.store.append("u", f"question {i}", "x" * (MAX_MESSAGE_CHARS + i))
+
+        history = self.store.history("u")
+        self.assertEqual([m["text"] for m in history if m["role"] == "user"], ["question 1", "question 2"])
+        self.assertTrue(all(len(m["text"]) <= MAX_MESSAGE_CHARS for m in history))
+
+    def test_least_recently_used_conversation_is_evicted(self):
+        """Test the conversation count stays bounded"""
+        self.store.append("a", "q", "a")
+        self.store.append("b", "q", "a")
+        self.store.history("a")
+        self.store.append("c", "q", "a")
+
+        self.assertEqual(self.store.history("b"), [])
+        self.assertEqual(len(self.store.history("a")), 2)
+
+    def test_idle_conversations_expire(self):
+        """Test conversations older than the TTL are forgotten"""
+        self.store.backend = MemorySessionBackend(ttl=0)
+        self.store.append("u", "q", "a")
+        self.assertEqual(self.store.history("u"), [])
+
+
+class TestDatabaseSessions(unittest.TestCase):
+    def setUp(self):
+        """Create the chat_sessions table in an in-memory database"""
+        self.app = make_app("database")
+        self.context = self.app.app_context()
+        self.context.push()
+        ChatSession.__table__.create(db.engine)
+        self.store = ChatSessionStore(self.app)
+        self.user_id = uuid.uuid4()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+
+    def test_history_is_shared_through_the_table(self):
+        """Test a second store, as in another worker, resumes the conversation"""
+        self.store.append(self.user_id, "first", "one")
+        self.store.append(self.user_id, "second", "two")
+        db.session.remove()
+
+        other = ChatSessionStore(self.app)
+        self.assertEqual([m["text"] for m in other.history(self.user_id)], ["first", "one", "second", "two"])
+
+        other.reset(self.user_id)
+        self.assertEqual(self.store.history(self.user_id), [])
+
+    def test_expired_history_is_not_resumed(self):
+        """Test a conversation idle past the TTL starts over"""
+        self.store.append(self.user_id, "first", "one")
+        row = db.session.get(ChatSession, self.user_id)
+        row.updated_at = datetime.utcnow() - timedelta(hours=2)
+        db.session.commit()
+
+        self.assertEqual(self.store.history(self.user_id), [])
+        self.store.append(self.user_id, "second", "two")
+        self.assertEqual([m["text"] for m in self.store.history(self.user_id)], ["second", "two"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = """
+import sys
+import setup
+from app import create_app
+create_app()
+print([module for module in ("google.genai", "pdfplumber") if module in sys.modules])
+"""
+
+
+class TestStartup(unittest.TestCase):
+    def test_startup_defers_heavy_imports(self):
+        """Test create_app runs without credentials, the provider SDK, pdfplumber or a setup.py connection"""
+        env = {
+            **{key: value for key, value in os.environ.items() if key != "GEMINI_API_KEY"},
+            "LLM_PROVIDER": "gemini",
+            "DATABASE_URL": "sqlite://",
+            "REINDEX_ENABLED": "false",
+        }
+        result = subprocess.run([sys.executable, "-c", SCRIPT], cwd=ROOT, env=env, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.splitlines()[-1], "[]")
+        # setup.py only connects when run as a script
+        self.assertNotIn("Connection", result.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
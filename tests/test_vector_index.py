@@ -0,0 +1,183 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import uuid
+from types import SimpleNamespace
+import numpy as np
+from vector_index import LocalVectorIndex
+
+
+class TestLocalVectorIndex(unittest.TestCase):
+    def setUp(self):
+        """Create an index rooted in a temporary directory"""
+        self.root = tempfile.mkdtemp()
+        self.index = self._make_index("float32")
+        self.user_id = uuid.uuid4()
+        self.rng = np.random.default_rng(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _make_index(self, dtype, max_segments=16):
+        app = SimpleNamespace(extensions={}, config={
+            "VECTOR_INDEX_DIR": self.root,
+            "VECTOR_INDEX_DTYPE": dtype,
+            "VECTOR_INDEX_MAX_SEGMENTS": max_segments,
+        })
+        return LocalVectorIndex(app)
+
+    def _document(self, count):
+        return uuid.uuid4(), [uuid.uuid4() for _ in range(count)], self.rng.normal(size=(count, 8))
+
+    def test_search_returns_nearest_chunks(self):
+        """Test results are ordered by cosine similarity across segments"""
+        self.index.build(self.user_id, [], [], [])
+        document_id, chunk_ids, vectors = self._document(20)
+        self.index.append(self.user_id, chunk_ids[:10], [document_id] * 10, vectors[:10])
+        self.index.append(self.user_id, chunk_ids[10:], [document_id] * 10, vectors[10:])
+
+        results = self.index.search(self.user_id, vectors[13], top_k=3)
+
+        self.assertEqual(results[0][0], chunk_ids[13])
+        self.assertAlmostEqual(results[0][1], 1.0, places=5)
+        self.assertEqual(len(results), 3)
+        self.assertEqual([score for _, score in results], sorted((score for _, score in results), reverse=True))
+
+    def test_document_filter(self):
+        """Test only chunks of the selected documents are returned"""
+        first, first_chunks, first_vectors = self._document(5)
+        second, second_chunks, second_vectors = self._document(5)
+        self.index.build(
+            self.user_id,
+            first_chunks + second_chunks,
+            [first] * 5 + [second] * 5,
+            np.vstack([first_vectors, second_vectors]),
+        )
+
+        results = self.index.search(self.user_id, first_vectors[0], top_k=10, document_ids=[str(second)])
+
+        self.assertEqual({chunk_id for chunk_id, _ in results}, set(second_chunks))
+
+    def test_document_filter_on_interleaved_rows(self):
+        """Test scoped searches find each selected document's rows wherever they are and skip deleted ones"""
+        documents = [self._document(3) for _ in range(4)]
+        # Rows of the documents interleaved, as in segments written before rows were grouped by document
+        rows = [(chunk_ids[i], document_id, vectors[i]) for i in range(3) for document_id, chunk_ids, vectors in documents]
+        self.index.build(self.user_id, [row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows])
+        (first, first_chunks, first_vectors), (second, second_chunks, _), (third, third_chunks, _) = documents[:3]
+        self.index.delete_document(self.user_id, third)
+
+        results = self.index.search(
+            self.user_id, first_vectors[2], top_k=10, document_ids=[str(first), str(second), str(third), str(uuid.uuid4())],
+        )
+        self.assertEqual({chunk_id for chunk_id, _ in results}, set(first_chunks + second_chunks))
+        self.assertEqual(results[0][0], first_chunks[2])
+        self.assertAlmostEqual(results[0][1], 1.0, places=5)
+        self.assertEqual(self.index.search(self.user_id, first_vectors[0], top_k=10, document_ids=[str(third)]), [])
+
+    def test_delete_and_compact(self):
+        """Test tombstoned documents stop matching and are removed by compaction"""
+        kept, kept_chunks, kept_vectors = self._document(4)
+        deleted, deleted_chunks, deleted_vectors = self._document(4)
+        self.index.build(self.user_id, kept_chunks, [kept] * 4, kept_vectors)
+        self.index.append(self.user_id, deleted_chunks, [deleted] * 4, deleted_vectors)
+
+        self.index.delete_document(self.user_id, deleted)
+        results = self.index.search(self.user_id, deleted_vectors[0], top_k=10)
+        self.assertEqual({chunk_id for chunk_id, _ in results}, set(kept_chunks))
+
+        self.index.compact(self.user_id)
+        shard_files = os.listdir(self.index.shard_path(self.user_id))
+        self.assertEqual(len([name for name in shard_files if name.endswith(".vectors.npy")]), 1)
+        self.assertNotIn("tombstones.npy", shard_files)
+        self.assertEqual(len(self.index.search(self.user_id, kept_vectors[0], top_k=10)), 4)
+
+    def test_append_compacts_past_segment_limit(self):
+        """Test appends merge segments once the configured limit is exceeded"""
+        index = self._make_index("float32", max_segments=2)
+        index.build(self.user_id, [], [], [])
+        for _ in range(3):
+            document_id, chunk_ids, vectors = self._document(2)
+            index.append(self.user_id, chunk_ids, [document_id] * 2, vectors)
+
+        shard_files = os.listdir(index.shard_path(self.user_id))
+        self.assertEqual(len([name for name in shard_files if name.endswith(".vectors.npy")]), 1)
+        self.assertEqual(len(index.search(self.user_id, vectors[0], top_k=10)), 6)
+
+    def test_append_without_shard_is_skipped(self):
+        """Test appends wait for the shard to be built from the database"""
+        document_id, chunk_ids, vectors = self._document(2)
+        self.index.append(self.user_id, chunk_ids, [document_id] * 2, vectors)
+        self.assertFalse(self.index.has_shard(self.user_id))
+
+    def test_append_during_build_is_kept(self):
+        """Test a document stored while the shard is read from the database is appended once the shard exists"""
+        old, old_chunks, old_vectors = self._document(3)
+        new, new_chunks, new_vectors = self._document(2)
+        appender = threading.Thread(target=self.index.append, args=(self.user_id, new_chunks, [new] * 2, new_vectors))
+
+        def load():
+            # The new document commits after the database read, and its append comes in before the build ends
+            appender.start()
+            appender.join(timeout=0.2)
+            self.assertTrue(appender.is_alive())
+            return old_chunks, [old] * 3, old_vectors
+
+        self.index.ensure_shard(self.user_id, load)
+        appender.join()
+
+        results = self.index.search(self.user_id, new_vectors[0], top_k=10)
+        self.assertEqual({chunk_id for chunk_id, _ in results}, set(old_chunks + new_chunks))
+
+    def test_append_of_built_chunks_is_skipped(self):
+        """Test chunks a build already read from the database are not added twice"""
+        document_id, chunk_ids, vectors = self._document(4)
+        self.index.ensure_shard(self.user_id, lambda: (chunk_ids[:3], [document_id] * 3, vectors[:3]))
+        self.index.append(self.user_id, chunk_ids, [document_id] * 4, vectors)
+
+        results = self.index.search(self.user_id, vectors[0], top_k=10)
+        self.assertEqual(sorted(chunk_id for chunk_id, _ in results), sorted(chunk_ids))
+
+    def test_float16_shards(self):
+        """Test half-precision shards rank like full precision"""
+        index = self._make_index("float16")
+        document_id, chunk_ids, vectors = self._document(50)
+        index.build(self.user_id, chunk_ids, [document_id] * 50, vectors)
+
+        results = index.search(self.user_id, vectors[7], top_k=1)
+
+        self.assertEqual(results[0][0], chunk_ids[7])
+        self.assertAlmostEqual(results[0][1], 1.0, places=2)
+
+    def test_quantized_shards(self):
+        """Test int8 and binary shards keep the nearest chunk first, in a fraction of the space, through compaction"""
+        document_id, chunk_ids, vectors = self._document(200)
+        vectors = self.rng.normal(size=(200, 768))
+        sizes = {}
+        for encoding in ("float32", "int8", "binary"):
+            index = self._make_index(encoding, max_segments=1)
+            user_id = uuid.uuid4()
+            index.build(user_id, chunk_ids[:100], [document_id] * 100, vectors[:100])
+            index.append(user_id, chunk_ids[100:], [document_id] * 100, vectors[100:])  # compacts into one segment
+            shard = index.shard_path(user_id)
+            sizes[encoding] = sum(os.path.getsize(os.path.join(shard, name)) for name in os.listdir(shard) if ".vectors." in name)
+
+            results = index.search(user_id, vectors[150], top_k=5)
+            self.assertEqual(results[0][0], chunk_ids[150])
+            self.assertGreater(results[0][1], 0.95)
+            self.assertEqual(len(results), 5)
+            self.assertEqual(index.quantized, encoding != "float32")
+
+        self.assertLess(sizes["int8"], sizes["float32"] / 3.5)
+        self.assertLess(sizes["binary"], sizes["float32"] / 25)
+
+    def test_unknown_encoding(self):
+        """Test an unsupported VECTOR_INDEX_DTYPE is rejected at start-up"""
+        with self.assertRaises(ValueError):
+            self._make_index("int4")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import shutil
+import tempfile
+import unittest
+import uuid
+from flask import Flask
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from embeddings import EmbeddingVersion
+from extensions import db, vector_index
+from models import Document, DocumentChunk, Embedding, EmbeddingVersionState, User
+from vector_store import _candidate_filter, _scope_size, search_chunks
+from versions import embedding_versions
+
+VERSION = EmbeddingVersion("model", "1")
+
+
+def vector(value):
+    return [1.0, float(value)] + [0.0] * 766
+
+
+class TestScopedSearch(unittest.TestCase):
+    DTYPE = "float32"
+
+    def setUp(self):
+        """Store two documents for one user and one for another, searched through the local index"""
+        self.root = tempfile.mkdtemp()
+        app = Flask(__name__)
+        app.config.update(
+            SQLALCHEMY_DATABASE_URI="sqlite://",
+            VECTOR_BACKEND="local",
+            VECTOR_INDEX_DIR=self.root,
+            VECTOR_INDEX_DTYPE=self.DTYPE,
+            VECTOR_RESCORE_FACTOR=2,
+            VECTOR_INDEX_MAX_SEGMENTS=16,
+            EMBEDDING_MODEL=VERSION.model,
+            EMBEDDING_PIPELINE_VERSION=VERSION.pipeline,
+            EMBEDDING_VERSION_REFRESH=0,
+            HYBRID_LEXICAL_WEIGHT=0,
+            LEXICAL_PREFILTER_THRESHOLD=0,
+            SCOPED_SEARCH_MAX_VECTORS=10000,
+        )
+        db.init_app(app)
+        vector_index.init_app(app)
+        embedding_versions.init_app(app)
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all()
+
+        self.user_id, self.other_id = uuid.uuid4(), uuid.uuid4()
+        db.session.add(User(id=self.user_id, username="u", email="u@example.com", password_hash="x"))
+        db.session.add(User(id=self.other_id, username="o", email="o@example.com", password_hash="x"))
+        db.session.add(EmbeddingVersionState(model_name=VERSION.model, pipeline_version=VERSION.pipeline, state="serving"))
+        self.first = self.add_document(self.user_id, [0, 1])
+        self.second = self.add_document(self.user_id, [2, 3])
+        self.foreign = self.add_document(self.other_id, [0, 1])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+        shutil.rmtree(self.root)
+
+    def add_document(self, user_id, values):
+        document = Document(id=uuid.uuid4(), user_id=user_id, document_name="d.txt", document_path="d.txt")
+        db.session.add(document)
+        for index, value in enumerate(values):
+            chunk = DocumentChunk(
+                id=uuid.uuid4(), document_id=document.id, chunk_index=index,
+                start_offset=0, end_offset=10, chunk_text=f"chunk {value}",
+            )
+            db.session.add(chunk)
+            db.session.add(Embedding(
+                document_id=document.id, chunk_id=chunk.id, embedding_vector=vector(value),
+                model_name=VERSION.model, pipeline_version=VERSION.pipeline,
+            ))
+        return document.id
+
+    def test_selected_documents_only(self):
+        """Test a document filter limits results to the selected documents"""
+        chunks = search_chunks(vector(0), self.user_id, [self.second], top_k=5)
+        self.assertEqual({chunk.document_id for chunk in chunks}, {self.second})
+        self.assertEqual(len(chunks), 2)
+
+    def test_other_users_documents_never_match(self):
+        """Test selecting another user's documents returns nothing from them"""
+        self.assertEqual(search_chunks(vector(0), self.user_id, [self.foreign], top_k=5), [])
+        chunks = search_chunks(vector(0), self.user_id, [self.foreign, self.first], top_k=5)
+        self.assertEqual({chunk.document_id for chunk in chunks}, {self.first})
+
+    def test_ownership_in_the_scoped_query(self):
+        """Test the pgvector candidate query checks the owner alongside the selected documents"""
+        stmt = _candidate_filter(select(Embedding.chunk_id), self.user_id, [self.foreign], VERSION)
+        sql = str(stmt.compile(dialect=postgresql.dialect()))
+        self.assertIn("JOIN documents ON documents.id = embeddings.document_id", sql)
+        self.assertIn("documents.user_id = ", sql)
+        self.assertIn("embeddings.document_id IN", sql)
+
+    def test_scope_size(self):
+        """Test the search scope is measured in the user's chunk vectors, counted until past the limit"""
+        self.assertEqual(_scope_size(self.user_id, None, VERSION, 1000), 4)
+        self.assertEqual(_scope_size(self.user_id, None, VERSION, 2), 3)
+        self.assertEqual(_scope_size(self.user_id, [self.first], VERSION, 1000), 2)
+        self.assertEqual(_scope_size(self.user_id, [self.foreign], VERSION, 1000), 0)
+
+
+class TestQuantizedSearch(TestScopedSearch):
+    """The scoped search tests again, over a binary-quantized local index"""
+    DTYPE = "binary"
+
+    def test_candidates_are_rescored_exactly(self):
+        """Test quantized candidates come back with exact cosine similarities, best first"""
+        chunks = search_chunks(vector(2), self.user_id, top_k=3)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(chunks[0].chunk_text, "chunk 2")
+        self.assertAlmostEqual(chunks[0].score, 1.0, places=5)
+        self.assertAlmostEqual(chunks[1].score, (1 + 2 * 3) / ((1 + 2 ** 2) ** 0.5 * (1 + 3 ** 2) ** 0.5), places=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,364 @@
+import fcntl
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+import numpy as np
+
+ID_DTYPE = np.dtype([("chunk", "V16"), ("document", "V16")])
+SCORE_BLOCK_ROWS = 65536  # compressed shards are decoded block by block while scoring
+ENCODINGS = ("float32", "float16", "int8", "binary")
+QUANTIZED = ("int8", "binary")  # scores are approximate: callers rescore the top candidates exactly
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _popcount(bits):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits)
+    return np.unpackbits(bits[..., None], axis=-1).sum(axis=-1)
+
+
+def _uuid_array(values):
+    return np.array([uuid.UUID(str(value)).bytes for value in values], dtype="V16")
+
+
+def _save(path, array):
+    """Writes an .npy file atomically so readers never map a half-written segment."""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class LocalVectorIndex:
+    """
+    In-process cosine similarity index with one shard directory per user.
+
+    A shard is a list of immutable segments: <name>.vectors.npy holds L2-normalised embeddings and
+    <name>.ids.npy the matching (chunk, document) UUIDs. Segments are memory-mapped, so workers start
+    without loading anything and share pages through the OS cache. Uploads append a new segment,
+    deleted documents are tombstoned, and compaction merges the segments and drops tombstoned rows.
+    Rows are written grouped by document, so a search restricted to a few documents reads only
+    their rows.
+
+    Vectors are stored as float32, float16, int8 (per-row scale in <name>.scales.npy, a quarter of
+    the size) or binary (sign bits, a 32nd), per VECTOR_INDEX_DTYPE. The quantized encodings
+    only approximate cosine similarity, so their results are meant to be rescored.
+    """
+
+    def __init__(self, app=None):
+        self.root = None
+        self.encoding = "float32"
+        self.max_segments = 16
+        self._segments = {}  # vectors path -> (vectors, ids) memory maps
+        self._documents = {}  # vectors path -> (sorted document ids, row order or None if already sorted)
+        self._tombstones = {}  # shard path -> (mtime, document ids)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.root = app.config["VECTOR_INDEX_DIR"]
+        encoding = app.config["VECTOR_INDEX_DTYPE"]
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown VECTOR_INDEX_DTYPE {encoding!r}; expected one of {', '.join(ENCODINGS)}")
+        self.encoding = encoding
+        self.max_segments = app.config["VECTOR_INDEX_MAX_SEGMENTS"]
+        os.makedirs(self.root, exist_ok=True)
+        app.extensions["vector_index"] = self
+
+    @property
+    def quantized(self):
+        return self.encoding in QUANTIZED
+
+    def _encode(self, vectors):
+        """Normalised vectors in the index's encoding; returns (vectors, per-row scales or None)."""
+        vectors = _normalize(vectors)
+        if self.encoding == "int8":
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        if self.encoding == "binary":
+            return np.packbits(vectors > 0, axis=1), None
+        return vectors.astype(self.encoding), None
+
+    def _save_segment(self, shard, ids, vectors, scales):
+        name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        order = np.argsort(ids["document"], kind="stable")
+        # The vectors file is written last: its presence marks the segment as complete
+        _save(os.path.join(shard, f"{name}.ids.npy"), ids[order])
+        if scales is not None:
+            _save(os.path.join(shard, f"{name}.scales.npy"), scales[order])
+        _save(os.path.join(shard, f"{name}.vectors.npy"), vectors[order])
+
+    def shard_path(self, user_id):
+        return os.path.join(self.root, str(user_id))
+
+    def has_shard(self, user_id):
+        return os.path.isdir(self.shard_path(user_id))
+
+    @contextmanager
+    def _lock(self, shard):
+        """
+        Serialises writers to a shard across threads and worker processes.
+        The lock file sits beside the shard, so a build can hold it before the shard exists.
+        """
+        os.makedirs(os.path.dirname(shard), exist_ok=True)
+        with open(f"{shard}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_segment(self, shard, chunk_ids, document_ids, vectors):
+        ids = np.empty(len(chunk_ids), dtype=ID_DTYPE)
+        ids["chunk"] = _uuid_array(chunk_ids)
+        ids["document"] = _uuid_array(document_ids)
+        self._save_segment(shard, ids, *self._encode(vectors))
+
+    def _segment_names(self, shard):
+        return sorted(name[:-len(".vectors.npy")] for name in os.listdir(shard) if name.endswith(".vectors.npy"))
+
+    def _load_segments(self, shard):
+        names = self._segment_names(shard)
+        segments = []
+        for name in names:
+            path = os.path.join(shard, f"{name}.vectors.npy")
+            if path not in self._segments:
+                scales_path = os.path.join(shard, f"{name}.scales.npy")
+                self._segments[path] = (
+                    np.load(path, mmap_mode="r"),
+                    np.load(os.path.join(shard, f"{name}.ids.npy"), mmap_mode="r"),
+                    np.load(scales_path) if os.path.exists(scales_path) else None,
+                )
+            segments.append((path, *self._segments[path]))
+
+        # Forget maps of segments removed by a compaction
+        live = {os.path.join(shard, f"{name}.vectors.npy") for name in names}
+        for path in [p for p in self._segments if os.path.dirname(p) == shard and p not in live]:
+            del self._segments[path]
+            self._documents.pop(path, None)
+        return segments
+
+    def _document_rows(self, path, ids, document_filter):
+        """Rows of a segment holding the given documents, found by binary search over its sorted document ids."""
+        cached = self._documents.get(path)
+        if cached is None:
+            documents = np.ascontiguousarray(ids["document"])
+            keys = documents.view("S16")
+            if np.all(keys[1:] >= keys[:-1]):
+                cached = (documents, None)
+            else:
+                # Segments written before rows were grouped by document are searched through a sort order
+                order = np.argsort(documents, kind="stable")
+                cached = (documents[order], order)
+            self._documents[path] = cached
+        documents, order = cached
+        starts = np.searchsorted(documents, document_filter, side="left")
+        ends = np.searchsorted(documents, document_filter, side="right")
+        rows = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)] or [np.empty(0, dtype=np.int64)])
+        return rows if order is None else np.sort(order[rows])
+
+    def _load_tombstones(self, shard):
+        path = os.path.join(shard, "tombstones.npy")
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return np.empty(0, dtype="V16")
+        cached = self._tombstones.get(shard)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, np.load(path))
+            self._tombstones[shard] = cached
+        return cached[1]
+
+    def build(self, user_id, chunk_ids, document_ids, vectors):
+        """Creates a user's shard from scratch, e.g. from the embeddings already in the database."""
+        shard = self.shard_path(user_id)
+        tmp_shard = f"{shard}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(tmp_shard)
+        if len(chunk_ids):
+            self._write_segment(tmp_shard, chunk_ids, document_ids, vectors)
+        try:
+            os.rename(tmp_shard, shard)
+        except OSError:
+            # Another worker built the shard first
+            shutil.rmtree(tmp_shard, ignore_errors=True)
+
+    def ensure_shard(self, user_id, load):
+        """
+        Builds a user's shard from load() -> (chunk_ids, document_ids, vectors) unless it exists.
+        load runs under the shard's lock, which append and delete_document take too, so a change
+        committed while it reads is either in what it returns or applied once the shard is in place.
+        """
+        if self.has_shard(user_id):
+            return
+        with self._lock(self.shard_path(user_id)):
+            if not self.has_shard(user_id):
+                self.build(user_id, *load())
+
+    def _stored_chunks(self, shard, chunk_ids, document_ids):
+        """Which of the given chunks the shard already holds, looked up through their documents' rows."""
+        chunks = _uuid_array(chunk_ids)
+        documents = np.unique(_uuid_array(document_ids))
+        stored = [np.empty(0, dtype="V16")]
+        for path, _, ids, _ in self._load_segments(shard):
+            stored.append(ids["chunk"][self._document_rows(path, ids, documents)])
+        return np.isin(chunks, np.concatenate(stored))
+
+    def append(self, user_id, chunk_ids, document_ids, vectors):
+        """
+        Adds vectors for newly uploaded chunks as a new segment.
+        Users without a shard are skipped; their shard is built from the database on first search.
+        Chunks a build already read from the database are not added twice.
+        """
+        shard = self.shard_path(user_id)
+        if not len(chunk_ids):
+            return
+        with self._lock(shard):
+            if not os.path.isdir(shard):
+                return
+            keep = ~self._stored_chunks(shard, chunk_ids, document_ids)
+            if not keep.any():
+                return
+            if not keep.all():
+                chunk_ids = [chunk_id for chunk_id, kept in zip(chunk_ids, keep) if kept]
+                document_ids = [document_id for document_id, kept in zip(document_ids, keep) if kept]
+                vectors = np.asarray(vectors, dtype=np.float32)[keep]
+            self._write_segment(shard, chunk_ids, document_ids, vectors)
+            if len(self._segment_names(shard)) > self.max_segments:
+                self._compact(shard)
+
+    def delete_document(self, user_id, document_id):
+        """Tombstones a document's vectors; they stop matching immediately and are dropped on compaction."""
+        shard = self.shard_path(user_id)
+        with self._lock(shard):
+            if not os.path.isdir(shard):
+                return
+            tombstones = np.union1d(self._load_tombstones(shard), _uuid_array([document_id]))
+            _save(os.path.join(shard, "tombstones.npy"), tombstones)
+
+    def drop(self, user_id):
+        """Deletes a shard, or a directory of shards, with everything in it."""
+        path = self.shard_path(user_id)
+        shutil.rmtree(path, ignore_errors=True)
+        for cache in (self._segments, self._tombstones, self._documents):
+            for key in [key for key in cache if key == path or key.startswith(path + os.sep)]:
+                del cache[key]
+
+    def compact(self, user_id):
+        shard = self.shard_path(user_id)
+        if os.path.isdir(shard):
+            with self._lock(shard):
+                self._compact(shard)
+
+    def _compact(self, shard):
+        names = self._segment_names(shard)
+        tombstones = self._load_tombstones(shard)
+        vectors, ids, scales = [], [], []
+        for name in names:
+            segment_ids = np.load(os.path.join(shard, f"{name}.ids.npy"))
+            keep = ~np.isin(segment_ids["document"], tombstones)
+            vectors.append(np.load(os.path.join(shard, f"{name}.vectors.npy"))[keep])
+            ids.append(segment_ids[keep])
+            scales_path = os.path.join(shard, f"{name}.scales.npy")
+            if os.path.exists(scales_path):
+                scales.append(np.load(scales_path)[keep])
+
+        if ids and sum(len(segment_ids) for segment_ids in ids):
+            vectors = np.concatenate(vectors)
+            if not self.quantized:
+                # Float shards follow a change between float32 and float16; quantized shards are kept apart
+                vectors = vectors.astype(self.encoding)
+            self._save_segment(shard, np.concatenate(ids), vectors, np.concatenate(scales) if scales else None)
+        for old_name in names:
+            os.remove(os.path.join(shard, f"{old_name}.vectors.npy"))
+            os.remove(os.path.join(shard, f"{old_name}.ids.npy"))
+            if os.path.exists(os.path.join(shard, f"{old_name}.scales.npy")):
+                os.remove(os.path.join(shard, f"{old_name}.scales.npy"))
+        if os.path.exists(os.path.join(shard, "tombstones.npy")):
+            os.remove(os.path.join(shard, "tombstones.npy"))
+
+    @staticmethod
+    def _score(vectors, query, scales=None):
+        """Cosine similarity of each row with the normalised query; approximate for quantized rows."""
+        if vectors.dtype == np.float32:
+            return vectors @ query
+        query_bits = np.packbits(query > 0) if vectors.dtype == np.uint8 else None
+        scores = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), SCORE_BLOCK_ROWS):
+            block = vectors[start:start + SCORE_BLOCK_ROWS]
+            if query_bits is not None:
+                # The share of sign bits that differ estimates the angle between the vectors
+                differing = _popcount(block ^ query_bits).sum(axis=1, dtype=np.float32)
+                scores[start:start + len(block)] = np.cos(np.pi * differing / len(query))
+            elif scales is not None:
+                scores[start:start + len(block)] = (block.astype(np.float32) @ query) * scales[start:start + len(block)]
+            else:
+                scores[start:start + len(block)] = block.astype(np.float32) @ query
+        return scores
+
+    def search(self, user_id, query_vector, top_k, document_ids=None, chunk_ids=None):
+        """
+        Returns up to top_k (chunk_id, cosine similarity) pairs from the user's shard, best first.
+        chunk_ids, when given, restricts scoring to those chunks.
+        """
+        shard = self.shard_path(user_id)
+        try:
+            segments = self._load_segments(shard)
+        except FileNotFoundError:
+            # A compaction removed a segment between listing and mapping it
+            segments = self._load_segments(shard)
+        tombstones = self._load_tombstones(shard)
+        try:
+            document_filter = _uuid_array(document_ids) if document_ids else None
+        except ValueError:
+            return []  # Malformed document ids cannot match anything
+        if document_filter is not None:
+            # Deleted documents are left out up front, so their rows are never looked up
+            document_filter = np.setdiff1d(document_filter, tombstones)
+        chunk_filter = _uuid_array(chunk_ids) if chunk_ids is not None else None
+        query = _normalize(query_vector)
+
+        candidate_ids, candidate_scores = [], []
+        for path, vectors, ids, scales in segments:
+            rows = None
+            if document_filter is not None:
+                rows = self._document_rows(path, ids, document_filter)
+            elif len(tombstones):
+                rows = np.flatnonzero(~np.isin(ids["document"], tombstones))
+            if chunk_filter is not None:
+                if rows is None:
+                    rows = np.flatnonzero(np.isin(ids["chunk"], chunk_filter))
+                else:
+                    rows = rows[np.isin(ids["chunk"][rows], chunk_filter)]
+
+            if rows is None:
+                scores = self._score(vectors, query, scales)
+            else:
+                # Only the rows in scope are read from the memory map and scored
+                scores = self._score(vectors[rows], query, None if scales is None else scales[rows])
+            if not len(scores):
+                continue
+
+            k = min(top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            candidate_scores.append(scores[top])
+            candidate_ids.append(ids["chunk"][top if rows is None else rows[top]])
+
+        if not candidate_scores:
+            return []
+        scores = np.concatenate(candidate_scores)
+        chunk_ids = np.concatenate(candidate_ids)
+        results, seen = [], set()
+        for i in np.argsort(-scores):
+            # A reader racing a compaction can see a row in both the old and the merged segment
+            chunk_id = chunk_ids[i].tobytes()
+            if chunk_id not in seen:
+                seen.add(chunk_id)
+                results.append((uuid.UUID(bytes=chunk_id), float(scores[i])))
+        return results[:top_k]
@@ -0,0 +1,278 @@
+import re
+from dataclasses import dataclass
+import numpy as np
+from flask import current_app
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+from sqlalchemy import cast, func, select, text
+from extensions import db, vector_index
+from models import Document, DocumentChunk, Embedding
+from lexical import search_lexical, reciprocal_rank_fusion
+from versions import embedding_versions, version_filter
+
+
+@dataclass
+class RetrievedChunk:
+    chunk_id: object
+    document_id: object
+    document_name: str
+    page_number: int
+    chunk_text: str
+    start_offset: int
+    end_offset: int
+    score: float
+
+
+def _candidate_filter(stmt, user_id, document_ids, version):
+    """
+    Restricts a query over embeddings to version's chunk embeddings of the user's documents, or of
+    the selected ones; ownership is checked in the same query, so others' document ids match nothing.
+    """
+    stmt = stmt.join(Document, Document.id == Embedding.document_id).where(
+        Document.user_id == user_id, Embedding.chunk_id.isnot(None), version_filter(version)
+    )
+    if document_ids:
+        stmt = stmt.where(Embedding.document_id.in_(document_ids))
+    return stmt
+
+
+def _scope_size(user_id, document_ids, version, limit):
+    """
+    Chunk vectors in the search scope, counted up to limit + 1 through ix_documents_user_uploaded and
+    ix_embeddings_document_id, so a large library stops the count early.
+    """
+    scoped = _candidate_filter(select(Embedding.id), user_id, document_ids, version).limit(limit + 1).subquery()
+    return db.session.execute(select(func.count()).select_from(scoped)).scalar()
+
+
+_iterative_scan = {}
+
+
+def _supports_iterative_scan():
+    """Whether the server's pgvector (0.8+) can keep scanning the HNSW graph until enough rows pass the filter."""
+    if db.engine not in _iterative_scan:
+        version = db.session.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+        _iterative_scan[db.engine] = tuple(int(part) for part in version.split(".")[:2]) >= (0, 8)
+    return _iterative_scan[db.engine]
+
+
+def _exact_search(stmt, top_k):
+    # The scope's vectors are found through ix_documents_user_uploaded and ix_embeddings_document_id
+    # and scored exactly; the materialized CTE keeps the planner from ordering by the HNSW index
+    scoped = stmt.cte("scoped").prefix_with("MATERIALIZED")
+    rows = db.session.execute(select(scoped.c.chunk_id, scoped.c.distance).order_by(scoped.c.distance).limit(top_k))
+    return [(chunk_id, 1.0 - distance) for chunk_id, distance in rows]
+
+
+def _pgvector_search(query_vector, user_id, document_ids, top_k, version, chunk_ids=None):
+    """
+    Lets Postgres rank chunks by cosine distance. The HNSW graph spans every user's vectors and is
+    filtered after the scan, so a small scope could get fewer than top_k matches from it: scopes of
+    up to SCOPED_SEARCH_MAX_VECTORS chunk vectors, selected documents or all of a user's, are scored
+    exactly. Larger ones go through HNSW, since an exact scan grows with the library.
+    """
+    distance = Embedding.embedding_vector.cosine_distance(query_vector)
+    stmt = _candidate_filter(select(Embedding.chunk_id, distance.label("distance")), user_id, document_ids, version)
+    if chunk_ids is not None:
+        # A prefiltered candidate set is scored exactly; an index scan could return fewer than top_k
+        rows = db.session.execute(stmt.where(Embedding.chunk_id.in_(chunk_ids))).all()
+        return sorted(((chunk_id, 1.0 - distance) for chunk_id, distance in rows), key=lambda r: -r[1])[:top_k]
+    max_vectors = current_app.config["SCOPED_SEARCH_MAX_VECTORS"]
+    if _scope_size(user_id, document_ids, version, max_vectors) <= max_vectors:
+        return _exact_search(stmt, top_k)
+
+    exact = stmt
+    quantization = current_app.config["PGVECTOR_QUANTIZATION"]
+    candidates = top_k
+    if quantization == "none":
+        stmt = stmt.order_by(distance).limit(top_k)
+    else:
+        # The compressed index picks the candidates; their full-precision distance ranks them
+        candidates = top_k * current_app.config["VECTOR_RESCORE_FACTOR"]
+        scan = stmt.order_by(_quantized_distance(quantization, query_vector)).limit(candidates).subquery()
+        stmt = select(scan.c.chunk_id, scan.c.distance).order_by(scan.c.distance).limit(top_k)
+
+    # ef_search bounds how many graph candidates the index visits; it must cover the candidates
+    ef_search = max(current_app.config["HNSW_EF_SEARCH"], candidates)
+    if embedding_versions.migrating():
+        ef_search *= 2  # about half the graph holds the other version's vectors, which the filter drops
+    db.session.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"))
+    if _supports_iterative_scan():
+        db.session.execute(text("SET LOCAL hnsw.iterative_scan = strict_order"))
+    rows = [(chunk_id, 1.0 - distance) for chunk_id, distance in db.session.execute(stmt)]
+    if len(rows) < top_k:
+        # The filter dropped too much of what the graph scan visited
+        return _exact_search(exact, top_k)
+    return rows
+
+
+def _quantized_distance(quantization, query_vector):
+    """
+    The distance expression served by setup.py's index for PGVECTOR_QUANTIZATION (pgvector 0.7+):
+    halfvec cosine distance, or Hamming distance between binary-quantized vectors.
+    """
+    dimensions = len(query_vector)
+    if quantization == "halfvec":
+        return cast(Embedding.embedding_vector, HALFVEC(dimensions)).cosine_distance(cast(query_vector, HALFVEC(dimensions)))
+    if quantization == "binary":
+        return cast(func.binary_quantize(Embedding.embedding_vector), BIT(dimensions)).hamming_distance(
+            func.binary_quantize(cast(query_vector, Vector(dimensions)))
+        )
+    raise ValueError(f"Unknown PGVECTOR_QUANTIZATION {quantization!r}; expected none, halfvec or binary")
+
+
+def _use_pgvector():
+    backend = current_app.config["VECTOR_BACKEND"]
+    if backend == "auto":
+        return db.engine.dialect.name == "postgresql"
+    return backend == "pgvector"
+
+
+def _version_dir(version):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", version.key)
+
+
+def _shard(user_id, version):
+    """
+    Local index shards are kept per embedding version, so a version switch starts from fresh shards.
+    Quantized encodings get shards of their own too, built from the full-precision vectors.
+    """
+    if vector_index.quantized:
+        return f"{_version_dir(version)}/{vector_index.encoding}/{user_id}"
+    return f"{_version_dir(version)}/{user_id}"
+
+
+def _rescore(query_vector, ranked, version, top_k):
+    """Ranks candidate chunks by exact cosine similarity, using their full-precision vectors."""
+    if not ranked:
+        return []
+    rows = db.session.execute(
+        select(Embedding.chunk_id, Embedding.embedding_vector)
+        .where(Embedding.chunk_id.in_([chunk_id for chunk_id, _ in ranked]), version_filter(version))
+    ).all()
+    if not rows:
+        return []
+    vectors = np.asarray([vector for _, vector in rows], dtype=np.float32)
+    query = np.asarray(query_vector, dtype=np.float32)
+    scores = vectors @ query / np.maximum(np.linalg.norm(vectors, axis=1) * np.linalg.norm(query), 1e-12)
+    order = np.argsort(-scores)[:top_k]
+    return [(rows[i].chunk_id, float(scores[i])) for i in order]
+
+
+def _local_search(query_vector, user_id, document_ids, top_k, version, chunk_ids=None):
+    """Searches the user's memory-mapped shard, building it from the database on first use."""
+    shard = _shard(user_id, version)
+    def load():
+        stmt = _candidate_filter(
+            select(Embedding.chunk_id, Embedding.document_id, Embedding.embedding_vector), user_id, None, version
+        )
+        rows = db.session.execute(stmt).all()
+        return (
+            [row.chunk_id for row in rows],
+            [row.document_id for row in rows],
+            [row.embedding_vector for row in rows],
+        )
+
+    # Built under the shard lock, so a document indexed meanwhile is read here or appended afterwards
+    vector_index.ensure_shard(shard, load)
+    if not vector_index.quantized:
+        return vector_index.search(shard, query_vector, top_k, document_ids, chunk_ids)
+    candidates = top_k * current_app.config["VECTOR_RESCORE_FACTOR"]
+    ranked = vector_index.search(shard, query_vector, candidates, document_ids, chunk_ids)
+    return _rescore(query_vector, ranked, version, top_k)
+
+
+def index_chunks(user_id, document_id, chunk_ids, vectors, version):
+    """Makes newly stored chunk embeddings searchable (pgvector indexes them on insert)."""
+    if not _use_pgvector():
+        vector_index.append(_shard(user_id, version), chunk_ids, [document_id] * len(chunk_ids), vectors)
+
+
+def remove_document(user_id, document_id):
+    """Drops a deleted document's chunks from search (pgvector rows go with the cascade)."""
+    if not _use_pgvector():
+        vector_index.delete_document(_shard(user_id, embedding_versions.serving()), document_id)
+
+
+def drop_version(version):
+    """Removes a retired version's local index shards."""
+    if not _use_pgvector():
+        vector_index.drop(_version_dir(version))
+
+
+def stored_vectors(user_id, content_hashes, version):
+    """
+    {content hash: vector} for the user's chunks already embedded by version, so chunks whose text
+    is unchanged, e.g. in a re-uploaded document, are not embedded again.
+    """
+    if not content_hashes:
+        return {}
+    rows = db.session.execute(
+        select(DocumentChunk.content_hash, Embedding.embedding_vector)
+        .join(Embedding, Embedding.chunk_id == DocumentChunk.id)
+        .join(Document, Document.id == DocumentChunk.document_id)
+        .where(
+            Document.user_id == user_id,
+            DocumentChunk.content_hash.in_(set(content_hashes)),
+            version_filter(version),
+        )
+    )
+    return {content_hash: [float(value) for value in vector] for content_hash, vector in rows}
+
+
+def _vector_search(query_vector, user_id, document_ids, top_k, version, chunk_ids=None):
+    if _use_pgvector():
+        return _pgvector_search(query_vector, user_id, document_ids, top_k, version, chunk_ids)
+    return _local_search(query_vector, user_id, document_ids, top_k, version, chunk_ids)
+
+
+def search_chunks(query_vector, user_id, document_ids=None, top_k=5, query_text=None, version=None):
+    """
+    Returns the top_k best chunks for a query as RetrievedChunk rows, best match first.
+    Only the columns needed to build a prompt are loaded. query_vector must come from version,
+    by default the serving embedding version.
+
+    With query_text, chunks are ranked by both vector similarity and BM25, and the two rankings
+    are merged by weighted reciprocal rank fusion; score is then the fused score. On scopes larger
+    than LEXICAL_PREFILTER_THRESHOLD chunks, the vector stage only scores the best lexical matches.
+    """
+    config = current_app.config
+    version = version or embedding_versions.serving()
+    lexical_weight = config["HYBRID_LEXICAL_WEIGHT"] if query_text else 0
+    prefilter = config["LEXICAL_PREFILTER_THRESHOLD"] if query_text else 0
+    if not lexical_weight and not prefilter:
+        ranked = _vector_search(query_vector, user_id, document_ids, top_k, version)
+    else:
+        pool = max(top_k, config["HYBRID_CANDIDATES"])
+        lexical, chunk_count = search_lexical(
+            query_text, user_id, document_ids, max(pool, config["LEXICAL_PREFILTER_SIZE"] if prefilter else 0)
+        )
+        candidates = None
+        if prefilter and chunk_count > prefilter and lexical:
+            candidates = [chunk_id for chunk_id, _ in lexical]
+        vector = _vector_search(query_vector, user_id, document_ids, pool, version, candidates)
+        if lexical_weight:
+            ranked = reciprocal_rank_fusion(
+                [vector, lexical[:pool]], [config["HYBRID_VECTOR_WEIGHT"], lexical_weight], config["HYBRID_RRF_K"]
+            )[:top_k]
+        else:
+            ranked = vector[:top_k]
+    if not ranked:
+        return []
+
+    scores = dict(ranked)
+    rows = db.session.execute(
+        select(
+            DocumentChunk.id,
+            DocumentChunk.document_id,
+            Document.document_name,
+            DocumentChunk.page_number,
+            DocumentChunk.chunk_text,
+            DocumentChunk.start_offset,
+            DocumentChunk.end_offset,
+        )
+        .join(Document, Document.id == DocumentChunk.document_id)
+        .where(DocumentChunk.id.in_(scores))
+    ).all()
+    chunks = [RetrievedChunk(*row, score=scores[row[0]]) for row in rows]
+    chunks.sort(key=lambda chunk: chunk.score, reverse=True)
+    return chunks
@@ -0,0 +1,109 @@
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import select, update, delete, and_
+from extensions import db
+from embeddings import EmbeddingVersion
+from models import AnswerCacheEntry, Embedding, EmbeddingVersionState
+
+
+def version_filter(version):
+    """Condition matching embeddings produced by version."""
+    return and_(Embedding.model_name == version.model, Embedding.pipeline_version == version.pipeline)
+
+
+class EmbeddingVersions:
+    """
+    Tracks which embedding version queries are served from, in the embedding_versions table.
+
+    The target version is the configured EMBEDDING_MODEL and EMBEDDING_PIPELINE_VERSION. While it
+    differs from the serving version, the re-indexer embeds chunks for the target and queries keep
+    using the serving version; switch() then makes the target the serving version for every worker
+    at once. Workers re-read the serving version at most every EMBEDDING_VERSION_REFRESH seconds.
+    """
+
+    def __init__(self, app=None):
+        self.target = EmbeddingVersion("text-embedding-004", "1")
+        self.refresh = 5.0
+        self._serving = None  # (read_at, version)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.target = EmbeddingVersion(app.config["EMBEDDING_MODEL"], app.config["EMBEDDING_PIPELINE_VERSION"])
+        self.refresh = app.config["EMBEDDING_VERSION_REFRESH"]
+        self._serving = None
+        app.extensions["embedding_versions"] = self
+
+    def _read_serving(self):
+        row = db.session.execute(
+            select(EmbeddingVersionState.model_name, EmbeddingVersionState.pipeline_version)
+            .where(EmbeddingVersionState.state == "serving")
+        ).first()
+        return EmbeddingVersion(*row) if row else None
+
+    def serving(self, fresh=False):
+        """The version queries are answered from; the target version until one has been recorded."""
+        with self._lock:
+            cached = self._serving
+        if fresh or cached is None or time.monotonic() - cached[0] > self.refresh:
+            version = self._read_serving() or self.target
+            cached = (time.monotonic(), version)
+            with self._lock:
+                self._serving = cached
+        return cached[1]
+
+    def migrating(self):
+        return self.serving() != self.target
+
+    def ensure_serving(self):
+        """Records the target as the serving version if none is recorded yet (e.g. a new database)."""
+        if self._read_serving() is None:
+            self._set_state(self.target, "serving")
+            db.session.commit()
+
+    def _set_state(self, version, state):
+        now = datetime.utcnow()
+        updated = db.session.execute(
+            update(EmbeddingVersionState)
+            .where(
+                EmbeddingVersionState.model_name == version.model,
+                EmbeddingVersionState.pipeline_version == version.pipeline,
+            )
+            .values(state=state, switched_at=now)
+        ).rowcount
+        if not updated:
+            db.session.add(EmbeddingVersionState(
+                model_name=version.model, pipeline_version=version.pipeline, state=state, switched_at=now,
+            ))
+
+    def switch(self, version):
+        """
+        Makes version the serving one in a single transaction. Cached answers are dropped with it,
+        since their query embeddings are from the previous version.
+        """
+        previous = self._read_serving()
+        if previous == version:
+            return
+        db.session.execute(
+            update(EmbeddingVersionState)
+            .where(EmbeddingVersionState.state == "serving")
+            .values(state="retired", switched_at=datetime.utcnow())
+        )
+        self._set_state(version, "serving")
+        db.session.execute(delete(AnswerCacheEntry))
+        db.session.commit()
+        with self._lock:
+            self._serving = (time.monotonic(), version)
+
+    def retired(self, before):
+        """Versions retired before the given time, whose embeddings can be deleted."""
+        rows = db.session.execute(
+            select(EmbeddingVersionState.model_name, EmbeddingVersionState.pipeline_version)
+            .where(EmbeddingVersionState.state == "retired", EmbeddingVersionState.switched_at < before)
+        ).all()
+        return [EmbeddingVersion(*row) for row in rows]
+
+
+embedding_versions = EmbeddingVersions()
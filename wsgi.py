@@ -0,0 +1,4 @@
+from app import create_app
+
+# WSGI entrypoint for gunicorn (settings in gunicorn.conf.py): gunicorn wsgi:app
+app = create_app()